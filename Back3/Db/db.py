@@ -18,11 +18,4 @@ async def get_Db():
             print(e)
             await Session.rollout()
         finally:
-            await Session.close()    
-
-
-async def create_tables(Drop=False):
-   async with engine.begin() as conn:
-        Drop and await conn.run_sync(Base.metadata.drop_all)
-        await conn.run_sync(Base.metadata.create_all)
-
+            await Session.close()
@@ -0,0 +1,28 @@
+"""Back3's schema steps, applied through the shared schema_versioning helper.
+
+Add new steps to the end of MIGRATIONS; never edit or reorder applied ones.
+"""
+from sqlalchemy.ext.asyncio import AsyncEngine
+from Models.Models import User, Blog
+from Db.db import Base, engine
+from pathlib import Path
+import sys
+
+# schema_versioning lives at the repository root, shared with backend and Backend2
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+import schema_versioning
+from schema_versioning import Migration
+
+MIGRATIONS = [
+    Migration(1, "users and blogs", schema_versioning.create_tables(User, Blog)),
+]
+
+async def ensure_schema(async_engine: AsyncEngine = engine) -> list[Migration]:
+    return await schema_versioning.ensure_schema(async_engine, MIGRATIONS)
+
+async def create_tables(Drop=False):
+    """Bring the schema up to date; Drop=True wipes every table and the version first"""
+    if Drop:
+        async with engine.begin() as conn:
+            await conn.run_sync(schema_versioning.drop_schema, Base.metadata)
+    await ensure_schema()
@@ -1,12 +1,12 @@
 from fastapi import FastAPI
 import uvicorn
-from Db.db import create_tables
+from Db.migrations import create_tables
 from Models.Models import User
 from contextlib import asynccontextmanager
 
 @asynccontextmanager
 async def lifespan(app:FastAPI):
-    await create_tables(Drop=True)
+    await create_tables()
     yield
     
 app=FastAPI(lifespan=lifespan)
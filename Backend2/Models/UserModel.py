@@ -3,13 +3,14 @@ from db.db import Base
 
 class User(Base):
     __tablename__="users"
-    id=Column(Integer,index=True)
+    id=Column(Integer,primary_key=True,index=True)
     name=Column(String(100),nullable=False)
     age=Column(Integer)
     
 class Post(Base):
     __tablename__="Posts"
 
+    id=Column(Integer,primary_key=True,index=True)
     title = Column(String(100),nullable=False)
 
     
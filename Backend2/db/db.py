@@ -15,9 +15,4 @@ async def get_Db():
         except Exception as e:
            await db.rollback()
         finally:
-           await  db.close()    
-
-async def create_tables():
-    async with engine.begin() as conn:
-       await conn.run_sync(Base.metadata.drop_all)
-       await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+           await  db.close()    
\ No newline at end of file
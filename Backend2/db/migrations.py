@@ -0,0 +1,21 @@
+"""Backend2's schema steps, applied through the shared schema_versioning helper.
+
+Add new steps to the end of MIGRATIONS; never edit or reorder applied ones.
+"""
+from sqlalchemy.ext.asyncio import AsyncEngine
+from Models.UserModel import User, Post
+from db.db import engine
+from pathlib import Path
+import sys
+
+# schema_versioning lives at the repository root, shared with backend and Back3
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+import schema_versioning
+from schema_versioning import Migration, create_tables
+
+MIGRATIONS = [
+    Migration(1, "users and posts", create_tables(User, Post)),
+]
+
+async def ensure_schema(async_engine: AsyncEngine = engine) -> list[Migration]:
+    return await schema_versioning.ensure_schema(async_engine, MIGRATIONS)
@@ -1,13 +1,14 @@
 from fastapi import FastAPI
 import uvicorn
-from db.db import get_Db,create_tables
+from db.db import get_Db
+from db.migrations import ensure_schema
 from contextlib import asynccontextmanager
 
 @asynccontextmanager
 async def lifespan(app:FastAPI):
-    print("🔄 Recreating database tables with updated schema...")
-    await create_tables()
-    print("✅ Database tables recreated successfully!")
+    applied = await ensure_schema()
+    if applied:
+        print(f"✅ Applied {len(applied)} schema migration(s)")
     yield
 
 app = FastAPI(lifespan=lifespan)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey ,Integer, String, Float, DateTime
+from sqlalchemy import Column, ForeignKey ,Integer, String, Float, DateTime, Date, Index, LargeBinary
 from datetime import datetime
 from db.db import Base
 from sqlalchemy.orm import relationship
@@ -33,5 +33,112 @@ class Transaction(Base):
     user = relationship("User", back_populates="transactions", foreign_keys=[user_id])
     recipient_user = relationship("User", back_populates="sent_transactions", foreign_keys=[recipient_user_id])
     reference_transaction = relationship("Transaction", remote_side=[id])
-   
- 
\ No newline at end of file
+
+    __table_args__ = (
+        # Seek index for keyset pagination of a user's ledger (newest first)
+        Index("ix_transactions_user_created_id", "user_id", "created_at", "id"),
+    )
+
+class UserTransactionCount(Base):
+    """Per-user ledger row count, kept up to date on every ledger insert"""
+    __tablename__ = "user_transaction_counts"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class IdempotencyKey(Base):
+    """Stored response of a money-moving POST, replayed for retries with the same Idempotency-Key"""
+    __tablename__ = "idempotency_keys"
+    key = Column(String, primary_key=True)
+    request_hash = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=False)
+    response_body = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    # Set while the response belongs to a cross-shard transfer that is not yet resolved
+    transfer_intent_id = Column(String, index=True)
+
+class BalanceCheckpoint(Base):
+    """Ledger-derived balance of a user up to last_transaction_id, written by reconciliation"""
+    __tablename__ = "balance_checkpoints"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    balance = Column(Float, nullable=False, default=0.0)
+    last_transaction_id = Column(Integer, nullable=False, default=0)
+    # users.balance minus the ledger balance at the last check; non-zero means drift
+    drift = Column(Float, nullable=False, default=0.0)
+    checked_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class DailyRollup(Base):
+    """Per-user, per-day ledger totals, kept up to date on every ledger insert"""
+    __tablename__ = "daily_rollups"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    credit_total = Column(Float, nullable=False, default=0.0)
+    credit_count = Column(Integer, nullable=False, default=0)
+    debit_total = Column(Float, nullable=False, default=0.0)
+    debit_count = Column(Integer, nullable=False, default=0)
+    transfer_in_total = Column(Float, nullable=False, default=0.0)
+    transfer_in_count = Column(Integer, nullable=False, default=0)
+    transfer_out_total = Column(Float, nullable=False, default=0.0)
+    transfer_out_count = Column(Integer, nullable=False, default=0)
+
+class ArchiveSegment(Base):
+    """A per-month archive file holding ledger rows moved out of the live database"""
+    __tablename__ = "archive_segments"
+    month = Column(String, primary_key=True)  # YYYY-MM of the rows' created_at
+    path = Column(String, nullable=False)
+    row_count = Column(Integer, nullable=False, default=0)
+    min_id = Column(Integer, nullable=False)
+    max_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class ArchivedUser(Base):
+    """Time span of a user's archived ledger rows; no row means nothing is archived"""
+    __tablename__ = "archived_users"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    first_created_at = Column(DateTime, nullable=False)
+    last_created_at = Column(DateTime, nullable=False)
+
+class TransferIntent(Base):
+    """One side of a transfer between users on different shards.
+
+    The sender's shard records PREPARED when the debit commits; the row written
+    on the recipient's shard (COMMITTED with the credit, or ABORTED) is the
+    outcome, and the sender's row is then moved to match it.
+    """
+    __tablename__ = "transfer_intents"
+    id = Column(String, primary_key=True)  # uuid shared by both sides
+    role = Column(String, nullable=False)  # SENDER or RECIPIENT
+    state = Column(String, nullable=False, index=True)
+    sender_user_id = Column(Integer, nullable=False)
+    recipient_user_id = Column(Integer, nullable=False)
+    amount = Column(Float, nullable=False)
+    description = Column(String)
+    # This side's ledger row
+    transaction_id = Column(Integer)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class ScheduledTransfer(Base):
+    """A standing order: a transfer repeated on a schedule, kept on the sender's shard"""
+    __tablename__ = "scheduled_transfers"
+    id = Column(Integer, primary_key=True, index=True)
+    sender_user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    recipient_user_id = Column(Integer, nullable=False)
+    amount = Column(Float, nullable=False)
+    description = Column(String)
+    frequency = Column(String, nullable=False)  # ONCE, DAILY, WEEKLY or MONTHLY
+    status = Column(String, nullable=False)
+    # First run; later runs keep its time of day and, for MONTHLY, its day of month
+    starts_at = Column(DateTime, nullable=False)
+    ends_at = Column(DateTime)
+    # NULL unless ACTIVE, so the index only holds orders that will run
+    next_run_at = Column(DateTime, index=True)
+    run_count = Column(Integer, nullable=False, default=0)
+    # Failed attempts at the current occurrence
+    failed_attempts = Column(Integer, nullable=False, default=0)
+    last_run_at = Column(DateTime)
+    last_error = Column(String)
+    # TRANSFER_OUT row of the last successful run
+    last_transaction_id = Column(Integer)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr, validator, ConfigDict
-from datetime import datetime
+from datetime import datetime, date
 from typing import Optional, Literal
 from enum import Enum
 
@@ -37,6 +37,16 @@ class UserResponse(UserBase):
     created_at: datetime
     updated_at: datetime
 
+class UserListItem(BaseModel):
+    """An item of GET /users/: every UserResponse field, or id plus the columns named in `fields=`"""
+    id: int
+    username: Optional[str] = None
+    email: Optional[str] = None
+    phone_number: Optional[str] = None
+    balance: Optional[float] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
@@ -96,6 +106,31 @@ class TransferRequest(BaseModel):
             raise ValueError('recipient_user_id must be a positive integer')
         return v
 
+class BatchTransferMode(str, Enum):
+    ALL_OR_NOTHING = "all_or_nothing"
+    BEST_EFFORT = "best_effort"
+
+class BatchTransferItem(TransferRequest):
+    sender_user_id: int = Field(..., description="ID of the sender user")
+
+class BatchTransferRequest(BaseModel):
+    mode: BatchTransferMode = Field(BatchTransferMode.ALL_OR_NOTHING, description="all_or_nothing rolls back every transfer if one fails")
+    transfers: list[BatchTransferItem] = Field(..., min_length=1, max_length=10000)
+
+class BatchTransferItemResult(BaseModel):
+    index: int
+    success: bool
+    transaction_id: Optional[int] = None
+    new_balance: Optional[float] = None
+    error: Optional[str] = None
+
+class BatchTransferResponse(BaseModel):
+    mode: BatchTransferMode
+    committed: bool
+    succeeded: int
+    failed: int
+    results: list[BatchTransferItemResult]
+
 class MoneyOperationResponse(BaseModel):
     transaction_id: int
     user_id: int
@@ -105,6 +140,77 @@ class MoneyOperationResponse(BaseModel):
     description: Optional[str] = None
     created_at: datetime
 
+    @classmethod
+    def from_result(cls, result) -> "MoneyOperationResponse":
+        """From the (transaction, new_balance) result of a money operation"""
+        transaction, new_balance = result
+        return cls(
+            transaction_id=transaction.id,
+            user_id=transaction.user_id,
+            amount=transaction.amount,
+            new_balance=new_balance,
+            transaction_type=transaction.transaction_type,
+            description=transaction.description,
+            created_at=transaction.created_at
+        )
+
+# Scheduled transfers
+class ScheduleFrequency(str, Enum):
+    ONCE = "ONCE"
+    DAILY = "DAILY"
+    WEEKLY = "WEEKLY"
+    MONTHLY = "MONTHLY"
+
+class ScheduledTransferStatus(str, Enum):
+    ACTIVE = "ACTIVE"
+    PAUSED = "PAUSED"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
+
+class ScheduledTransferCreate(TransferRequest):
+    description: Optional[str] = Field("Scheduled transfer", max_length=255)
+    frequency: ScheduleFrequency
+    starts_at: Optional[datetime] = Field(None, description="First run; defaults to now")
+    ends_at: Optional[datetime] = Field(None, description="No runs after this")
+
+class ScheduledTransferUpdate(BaseModel):
+    amount: Optional[float] = Field(None, gt=0)
+    description: Optional[str] = Field(None, max_length=255)
+    frequency: Optional[ScheduleFrequency] = None
+    ends_at: Optional[datetime] = None
+    status: Optional[Literal[ScheduledTransferStatus.ACTIVE, ScheduledTransferStatus.PAUSED]] = Field(
+        None, description="Pause or resume the order"
+    )
+
+    @validator('amount', 'frequency', 'status')
+    def validate_not_null(cls, v):
+        # Leave these out to keep them; only description and ends_at can be cleared with null
+        if v is None:
+            raise ValueError('may be omitted but not set to null')
+        return v
+
+class ScheduledTransferResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    sender_user_id: int
+    recipient_user_id: int
+    amount: float
+    description: Optional[str] = None
+    frequency: ScheduleFrequency
+    status: ScheduledTransferStatus
+    starts_at: datetime
+    ends_at: Optional[datetime] = None
+    next_run_at: Optional[datetime] = None
+    run_count: int
+    failed_attempts: int
+    last_run_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+    last_transaction_id: Optional[int] = None
+    created_at: datetime
+    updated_at: datetime
+
 # Pagination
 class PaginationParams(BaseModel):
     page: int = Field(default=1, ge=1, description="Page number, starts from 1")
@@ -116,6 +222,59 @@ class PaginatedTransactionResponse(BaseModel):
     page: int
     limit: int
     total_pages: int
+    next_cursor: Optional[str] = Field(None, description="Pass as `cursor` to fetch the next page")
+
+# Spending summaries
+class SummaryGranularity(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+class SummaryPeriod(BaseModel):
+    period_start: date
+    credits: float
+    debits: float
+    transfers_in: float
+    transfers_out: float
+    net: float
+    transaction_count: int
+
+class TransactionSummaryResponse(BaseModel):
+    user_id: int
+    granularity: SummaryGranularity
+    periods: list[SummaryPeriod]
+
+# Exports
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+# Bulk imports accept the same two formats
+ImportFormat = ExportFormat
+
+class UserImportRowError(BaseModel):
+    row: int = Field(..., description="1-based data row of the upload, not counting a CSV header")
+    error: str
+    username: Optional[str] = None
+    email: Optional[str] = None
+
+class UserImportReport(BaseModel):
+    received: int = 0
+    created: int = 0
+    failed: int = 0
+    errors: list[UserImportRowError] = Field(default_factory=list)
+    errors_truncated: bool = Field(False, description="More rows failed than are listed in errors")
+    elapsed: float = 0.0
+
+# Profiling
+class ProfileArmRequest(BaseModel):
+    route: str = Field(..., description="Route template, e.g. /transactions/{user_id}")
+    method: str = "GET"
+    count: int = Field(1, ge=1, le=1000)
+
+class ProfilingStatusResponse(BaseModel):
+    armed: list[dict]
+    profiles: list[str]
 
 # API Response wrappers
 class SuccessResponse(BaseModel):
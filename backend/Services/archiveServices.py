@@ -0,0 +1,415 @@
+from sqlalchemy import select, tuple_, create_engine
+from sqlalchemy.engine import Row, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.sql import Select
+from Models.Model import Transaction, ArchiveSegment, ArchivedUser
+from Services.streaming import stream_rows
+from db.db import DATABASE_URL, SQLITE_BUSY_TIMEOUT_MS, ReadSessionLocal
+from db.shards import Shard, shards
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import partial
+from itertools import groupby
+from typing import AsyncIterator, Optional, Sequence
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+
+# Ledger rows older than this many days are moved to the monthly archive files
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./db/archive")
+# Rows moved per copy/delete round; each round holds the write lock only briefly
+ARCHIVE_BATCH_ROWS = int(os.getenv("ARCHIVE_BATCH_ROWS", "5000"))
+# Seconds between runs of the background archiver; 0 turns it off
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "0"))
+
+# Ids per IN (...) list in the copy/delete statements
+ARCHIVE_ID_CHUNK = 500
+
+logger = logging.getLogger("archive")
+
+# Re-checked when copying and deleting, so rows stay put once reconcile --full has dropped the checkpoints
+CHECKPOINTED = (
+    "id <= (SELECT cp.last_transaction_id FROM main.balance_checkpoints cp "
+    "WHERE cp.user_id = main.transactions.user_id)"
+)
+
+def month_bounds(month: str) -> tuple[datetime, datetime]:
+    """[start, end) of a YYYY-MM month"""
+    start = datetime.strptime(month, "%Y-%m")
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+def sqlite_timestamp(value: datetime) -> str:
+    # Same text format SQLAlchemy's DateTime type stores in SQLite
+    return value.isoformat(sep=" ", timespec="microseconds")
+
+@dataclass
+class ArchiveRun:
+    moved: int = 0
+    segments: int = 0
+    elapsed: float = 0.0
+
+class ArchiveStore:
+    """Read access to the monthly archive files.
+
+    Each segment is opened read-only on its own small engine. Callers query the
+    live database first and come here only when a page, range or id lookup
+    reaches into archived months.
+    """
+
+    def __init__(self):
+        self._engines: dict[str, tuple[AsyncEngine, async_sessionmaker]] = {}
+
+    def session_factory(self, segment: ArchiveSegment) -> async_sessionmaker:
+        if segment.path not in self._engines:
+            engine = create_async_engine(f"sqlite+aiosqlite:///file:{segment.path}?mode=ro&uri=true", pool_size=2)
+            self._engines[segment.path] = (engine, async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False))
+        return self._engines[segment.path][1]
+
+    async def dispose(self):
+        for engine, _ in self._engines.values():
+            await engine.dispose()
+        self._engines.clear()
+
+    async def user_segments(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        before: Optional[datetime] = None,
+        since: Optional[datetime] = None,
+        newest_first: bool = True
+    ) -> list[ArchiveSegment]:
+        """Segments that may hold rows of `user_id` created in [since, before)"""
+        archived = await db.get(ArchivedUser, user_id)
+        if archived is None:
+            return []
+        first = archived.first_created_at if since is None else max(since, archived.first_created_at)
+        last = archived.last_created_at if before is None else min(before, archived.last_created_at + timedelta(microseconds=1))
+        if first >= last:
+            return []
+        segments = (await db.scalars(
+            select(ArchiveSegment)
+            .filter(ArchiveSegment.month >= first.strftime("%Y-%m"), ArchiveSegment.month <= last.strftime("%Y-%m"))
+            .order_by(ArchiveSegment.month.desc() if newest_first else ArchiveSegment.month)
+        )).all()
+        return list(segments)
+
+    async def user_page(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        columns: list,
+        hot_rows: list[Row],
+        skip: int,
+        limit: int,
+        before: Optional[tuple[datetime, int]] = None
+    ) -> list[Row]:
+        """Complete a short page of live rows with archived ones, newest first.
+
+        `hot_rows` must hold every live row that sorts before the page end, so
+        merging it with the newest archived rows past the cursor is exact.
+        Archived rows are read with the same `columns`.
+        """
+        segments = await self.user_segments(db, user_id, before=before[0] if before else None)
+        if not segments:
+            return hot_rows[skip:skip + limit]
+
+        needed = skip + limit
+        archived = []
+        for segment in segments:
+            query = select(*columns).filter(Transaction.user_id == user_id)
+            if before:
+                query = query.filter(tuple_(Transaction.created_at, Transaction.id) < tuple_(*before))
+            async with self.session_factory(segment)() as archive_db:
+                result = await archive_db.execute(
+                    query
+                    .order_by(Transaction.created_at.desc(), Transaction.id.desc())
+                    .limit(needed - len(archived))
+                )
+                archived.extend(result.all())
+            if len(archived) >= needed:
+                break
+
+        # A row can sit in both stores between the archiver's copy and delete
+        seen = {row.id for row in hot_rows}
+        rows = hot_rows + [row for row in archived if row.id not in seen]
+        rows.sort(key=lambda row: (row.created_at, row.id), reverse=True)
+        return rows[skip:skip + limit]
+
+    async def get_transaction(self, db: AsyncSession, transaction_id: int) -> Optional[Transaction]:
+        segments = (await db.scalars(
+            select(ArchiveSegment)
+            .filter(ArchiveSegment.min_id <= transaction_id, ArchiveSegment.max_id >= transaction_id)
+            .order_by(ArchiveSegment.month.desc())
+        )).all()
+        for segment in segments:
+            async with self.session_factory(segment)() as archive_db:
+                transaction = await archive_db.get(Transaction, transaction_id)
+            if transaction is not None:
+                return transaction
+        return None
+
+    async def stream_user_rows(
+        self,
+        statement: Select,
+        user_id: int,
+        since: Optional[datetime] = None,
+        before: Optional[datetime] = None,
+        session_factory: async_sessionmaker = ReadSessionLocal
+    ) -> AsyncIterator[Sequence]:
+        """stream_rows over live and archived rows of a user, oldest first.
+
+        `statement` selects the user's ledger columns ordered by (created_at, id)
+        and filtered to [since, before); it is run on every store involved.
+        `session_factory` reads the live database holding the user.
+        """
+        async with session_factory() as db:
+            segments = await self.user_segments(db, user_id, before=before, since=since, newest_first=False)
+        if not segments:
+            async for rows in stream_rows(statement, session_factory):
+                yield rows
+            return
+
+        # Live rows older than the newest archived month are few (not yet
+        # reconciled or not yet moved), so they are merged in from memory
+        horizon = month_bounds(segments[-1].month)[1]
+        live_old = []
+        async for rows in stream_rows(statement.filter(Transaction.created_at < horizon), session_factory):
+            live_old.extend(rows)
+        seen = {row["id"] for row in live_old}
+        position = 0
+
+        for segment in segments:
+            async for rows in stream_rows(statement, self.session_factory(segment)):
+                merged = []
+                for row in rows:
+                    if row["id"] in seen:
+                        continue
+                    key = (row["created_at"], row["id"])
+                    while position < len(live_old) and (live_old[position]["created_at"], live_old[position]["id"]) < key:
+                        merged.append(live_old[position])
+                        position += 1
+                    merged.append(row)
+                if merged:
+                    yield merged
+        if position < len(live_old):
+            yield live_old[position:]
+
+        async for rows in stream_rows(statement.filter(Transaction.created_at >= horizon), session_factory):
+            yield rows
+
+class Archiver:
+    """Moves old, reconciled ledger rows into per-month archive files.
+
+    Runs on a plain sqlite3 connection in a worker thread and ATTACHes the
+    target month's file. Rows are first copied (INSERT OR IGNORE, with the
+    segment catalog updated in the same transaction), then deleted from the
+    live table in a second short transaction, so an interrupted run is simply
+    repeated. Only rows covered by the user's balance checkpoint are moved,
+    which keeps reconciliation incremental.
+    """
+
+    def __init__(
+        self,
+        database_path: Optional[str] = None,
+        archive_dir: str = ARCHIVE_DIR,
+        after_days: int = ARCHIVE_AFTER_DAYS,
+        batch_rows: int = ARCHIVE_BATCH_ROWS
+    ):
+        self.database_path = database_path or make_url(DATABASE_URL).database
+        self.archive_dir = os.path.abspath(archive_dir)
+        self.after_days = after_days
+        self.batch_rows = batch_rows
+
+    def run(self, max_rows: Optional[int] = None) -> ArchiveRun:
+        """Archive everything eligible (or up to `max_rows`), batch by batch"""
+        report = ArchiveRun()
+        started = time.perf_counter()
+        conn = sqlite3.connect(self.database_path, isolation_level=None, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+        try:
+            cutoff = sqlite_timestamp(datetime.now() - timedelta(days=self.after_days))
+            boundary = self._boundary_id(conn, cutoff)
+            after_id = 0
+            months = set()
+            while max_rows is None or report.moved < max_rows:
+                rows = conn.execute(
+                    "SELECT t.id, t.user_id, t.created_at FROM transactions t "
+                    "JOIN balance_checkpoints cp ON cp.user_id = t.user_id "
+                    "WHERE t.id > ? AND t.id <= ? AND t.created_at < ? AND t.id <= cp.last_transaction_id "
+                    "ORDER BY t.id LIMIT ?",
+                    (after_id, boundary, cutoff, self.batch_rows)
+                ).fetchall()
+                if not rows:
+                    break
+                after_id = rows[-1][0]
+                for month, month_rows in groupby(sorted(rows, key=lambda row: row[2][:7]), key=lambda row: row[2][:7]):
+                    report.moved += self._move_month(conn, month, list(month_rows))
+                    months.add(month)
+            report.segments = len(months)
+        finally:
+            conn.close()
+        report.elapsed = time.perf_counter() - started
+        if report.moved:
+            logger.info("Archived %d ledger rows into %d monthly files in %.1fs", report.moved, report.segments, report.elapsed)
+        return report
+
+    def _boundary_id(self, conn: sqlite3.Connection, cutoff: str) -> int:
+        """Highest id created before the cutoff, found by bisecting the id index.
+
+        created_at grows with id, so this bounds the scan without an index on
+        created_at; rows slightly out of order are picked up by the next run.
+        The newest row is never archived: new ids are MAX(id) + 1 (SQLite's
+        rowid and allocate_ids alike), so it keeps ids from being reused.
+        """
+        low, high = conn.execute("SELECT min(id), max(id) FROM transactions").fetchone()
+        if low is None:
+            return 0
+        newest = high
+        boundary = low - 1
+        while low <= high:
+            middle = (low + high) // 2
+            row = conn.execute(
+                "SELECT id, created_at FROM transactions WHERE id >= ? ORDER BY id LIMIT 1", (middle,)
+            ).fetchone()
+            if row is not None and row[1] < cutoff:
+                boundary = row[0]
+                low = row[0] + 1
+            else:
+                high = middle - 1
+        return min(boundary, newest - 1)
+
+    def _segment_path(self, month: str) -> str:
+        path = os.path.join(self.archive_dir, f"transactions-{month}.db")
+        if not os.path.exists(path):
+            os.makedirs(self.archive_dir, exist_ok=True)
+            engine = create_engine(f"sqlite:///{path}")
+            Transaction.__table__.create(engine, checkfirst=True)
+            engine.dispose()
+        return path
+
+    def _move_month(self, conn: sqlite3.Connection, month: str, rows: list[tuple]) -> int:
+        path = self._segment_path(month)
+        ids = [row[0] for row in rows]
+        chunks = [ids[i:i + ARCHIVE_ID_CHUNK] for i in range(0, len(ids), ARCHIVE_ID_CHUNK)]
+        spans = {}
+        for _, user_id, created_at in rows:
+            first, last = spans.get(user_id, (created_at, created_at))
+            spans[user_id] = (min(first, created_at), max(last, created_at))
+
+        conn.execute("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                copied = 0
+                for chunk in chunks:
+                    copied += conn.execute(
+                        f"INSERT OR IGNORE INTO archive.transactions SELECT * FROM main.transactions "
+                        f"WHERE id IN ({', '.join('?' * len(chunk))}) AND {CHECKPOINTED}",
+                        chunk
+                    ).rowcount
+                conn.execute(
+                    "INSERT INTO main.archive_segments (month, path, row_count, min_id, max_id, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (month) DO UPDATE SET "
+                    "row_count = row_count + excluded.row_count, min_id = min(min_id, excluded.min_id), "
+                    "max_id = max(max_id, excluded.max_id), updated_at = excluded.updated_at",
+                    (month, path, copied, min(ids), max(ids), sqlite_timestamp(datetime.now()))
+                )
+                conn.executemany(
+                    "INSERT INTO main.archived_users (user_id, first_created_at, last_created_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (user_id) DO UPDATE SET "
+                    "first_created_at = min(first_created_at, excluded.first_created_at), "
+                    "last_created_at = max(last_created_at, excluded.last_created_at)",
+                    [(user_id, first, last) for user_id, (first, last) in spans.items()]
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+            # Readers see the catalog entry before the live rows disappear
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for chunk in chunks:
+                    conn.execute(
+                        f"DELETE FROM main.transactions WHERE id IN ({', '.join('?' * len(chunk))}) AND {CHECKPOINTED}",
+                        chunk
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.execute("DETACH DATABASE archive")
+        return len(ids)
+
+def archived_balances(database_path: str) -> dict[int, float]:
+    """Each user's net ledger amount held only in the archive files.
+
+    Rows still in the live table as well (copied, not yet deleted) are left
+    out, so adding the live ledger on top counts every row once.
+    """
+    balances: dict[int, float] = {}
+    conn = sqlite3.connect(database_path, isolation_level=None, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+    try:
+        paths = [row[0] for row in conn.execute("SELECT path FROM archive_segments ORDER BY month")]
+        for path in paths:
+            conn.execute("ATTACH DATABASE ? AS archive", (path,))
+            try:
+                for user_id, amount in conn.execute(
+                    "SELECT a.user_id, SUM(CASE WHEN a.transaction_type IN ('CREDIT', 'TRANSFER_IN') "
+                    "THEN a.amount ELSE -a.amount END) FROM archive.transactions a "
+                    "WHERE NOT EXISTS (SELECT 1 FROM main.transactions t WHERE t.id = a.id) "
+                    "GROUP BY a.user_id"
+                ):
+                    balances[user_id] = balances.get(user_id, 0.0) + amount
+            finally:
+                conn.execute("DETACH DATABASE archive")
+    finally:
+        conn.close()
+    return balances
+
+class ArchiveWorker:
+    """Background task that runs the archiver every interval"""
+
+    def __init__(self, archiver_factory=Archiver, interval_seconds: float = ARCHIVE_INTERVAL_SECONDS):
+        self.archiver_factory = archiver_factory
+        self.interval = interval_seconds
+        self.last_run: Optional[ArchiveRun] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                self.last_run = await asyncio.to_thread(self.archiver_factory().run)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Archive run failed")
+            await asyncio.sleep(self.interval)
+
+def shard_archiver(shard: Shard, archive_dir: str = ARCHIVE_DIR, **kwargs) -> Archiver:
+    """Archiver for one shard; shard 0 keeps ARCHIVE_DIR itself, the others get a subdirectory each"""
+    if shard.index:
+        archive_dir = os.path.join(archive_dir, f"shard{shard.index}")
+    return Archiver(make_url(shard.url).database, archive_dir, **kwargs)
+
+archive_store = ArchiveStore()
+archive_worker = ArchiveWorker()
+# One worker per shard; shard 0's is archive_worker
+archive_workers = [archive_worker] + [ArchiveWorker(partial(shard_archiver, shard)) for shard in shards[1:]]
@@ -0,0 +1,177 @@
+from pydantic_core import to_json
+from Schemas.schemas import TransactionResponse
+from collections import deque
+from typing import Optional, AsyncIterator, Awaitable, Callable
+import asyncio
+import os
+import weakref
+
+# Events buffered per subscriber; past this the oldest are dropped
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "64"))
+# Open feeds per worker; new subscribers get a 503 beyond this
+EVENT_MAX_SUBSCRIBERS = int(os.getenv("EVENT_MAX_SUBSCRIBERS", "50000"))
+# Idle feeds get a keep-alive this often so proxies don't close them
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+
+class HubFull(Exception):
+    pass
+
+class Subscription:
+    """One open feed: a bounded queue of (event, json bytes) messages.
+
+    Slotted, with no task or Event of its own, and the queue is only
+    allocated once a message arrives, so an idle subscriber costs little
+    more than its entry in the hub. The waiter future exists only while the
+    feed is blocked in `get_batch`.
+    """
+    __slots__ = ("user_id", "maxsize", "queue", "dropped", "_waiter")
+
+    def __init__(self, user_id: int, maxsize: int):
+        self.user_id = user_id
+        self.maxsize = maxsize
+        self.queue: Optional[deque] = None
+        self.dropped = 0
+        self._waiter: Optional[asyncio.Future] = None
+
+    def put(self, message: tuple[str, bytes]) -> bool:
+        """Enqueue without blocking; a full queue drops its oldest message. Returns False on a drop"""
+        if self.queue is None:
+            self.queue = deque(maxlen=self.maxsize)
+        dropped = len(self.queue) == self.maxsize
+        if dropped:
+            self.dropped += 1
+        self.queue.append(message)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+        return not dropped
+
+    async def get_batch(self, timeout: Optional[float] = None) -> list[tuple[str, bytes]]:
+        """Every queued message, waiting up to `timeout` for one; empty if none arrived"""
+        if self.queue is None:
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait_for(self._waiter, timeout)
+            except asyncio.TimeoutError:
+                return []
+            finally:
+                self._waiter = None
+        batch, self.queue = list(self.queue), None
+        return batch
+
+class EventHub:
+    """In-process pub/sub of committed balance and ledger changes, keyed by user.
+
+    Publishing never blocks: each message is encoded once and appended to
+    every subscriber's bounded queue. Only commits made by this worker
+    process are seen, so with several workers a feed carries the writes
+    that landed on its own worker.
+    """
+
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE, max_subscribers: int = EVENT_MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers: dict[int, set[Subscription]] = {}
+        self.subscriber_count = 0
+        self.published = 0
+        self.dropped = 0
+
+    @property
+    def full(self) -> bool:
+        return self.subscriber_count >= self.max_subscribers
+
+    def subscribe(self, user_id: int) -> Subscription:
+        if self.full:
+            raise HubFull()
+        subscription = Subscription(user_id, self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        self.subscriber_count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is None or subscription not in subscribers:
+            return
+        subscribers.discard(subscription)
+        self.subscriber_count -= 1
+        if not subscribers:
+            del self._subscribers[subscription.user_id]
+
+    def has_subscribers(self, user_id: int) -> bool:
+        return user_id in self._subscribers
+
+    def publish(self, user_id: int, event: str, data: dict):
+        subscribers = self._subscribers.get(user_id)
+        if not subscribers:
+            return
+        message = (event, to_json(data))
+        self.published += 1
+        for subscription in subscribers:
+            if not subscription.put(message):
+                self.dropped += 1
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": self.subscriber_count,
+            "users": len(self._subscribers),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+event_hub = EventHub()
+
+# SQLite's RETURNING hands back whole-number REALs as ints, so values are coerced
+# to the response types here rather than encoded as returned
+
+def publish_balance(user_id: int, balance: float, updated_at):
+    if event_hub.has_subscribers(user_id):
+        event_hub.publish(user_id, "balance", {"user_id": user_id, "balance": float(balance), "updated_at": updated_at})
+
+def publish_transactions(transactions: list):
+    """Publish committed ledger rows; read at commit time so transfer legs carry their reference ids"""
+    for transaction in transactions:
+        if event_hub.has_subscribers(transaction.user_id):
+            event_hub.publish(
+                transaction.user_id, "transaction",
+                TransactionResponse.model_validate(transaction).model_dump()
+            )
+
+def subscription_feed(
+    subscription: Subscription,
+    initial: Callable[[], Awaitable[list[tuple[str, dict]]]],
+    heartbeat: float = EVENT_HEARTBEAT_SECONDS
+) -> AsyncIterator[list[tuple[str, bytes]]]:
+    """Batches of a subscription's events, until the consumer stops iterating.
+
+    The caller subscribes before this reads `initial`, so the hub slot is
+    taken before the response starts and nothing committed in between is
+    missed (it may arrive twice; balance events carry updated_at). An empty
+    batch means `heartbeat` seconds passed quietly, and writing the
+    keep-alive is also how a dropped client gets noticed. The subscription
+    is released when the feed is closed or dropped.
+    """
+    feed = _feed(subscription, initial, heartbeat)
+    # A feed dropped before its first iteration never runs its finally block
+    weakref.finalize(feed, event_hub.unsubscribe, subscription)
+    return feed
+
+async def _feed(
+    subscription: Subscription,
+    initial: Callable[[], Awaitable[list[tuple[str, dict]]]],
+    heartbeat: float
+) -> AsyncIterator[list[tuple[str, bytes]]]:
+    try:
+        yield [(event, to_json(data)) for event, data in await initial()]
+        while True:
+            yield await subscription.get_batch(heartbeat)
+    finally:
+        event_hub.unsubscribe(subscription)
+
+async def encode_sse(feed: AsyncIterator[list[tuple[str, bytes]]]) -> AsyncIterator[bytes]:
+    async for batch in feed:
+        if not batch:
+            yield b": keep-alive\n\n"
+            continue
+        yield b"".join(b"event: " + event.encode("ascii") + b"\ndata: " + data + b"\n\n" for event, data in batch)
+
+def encode_websocket(event: str, data: bytes) -> str:
+    return '{"event":"' + event + '","data":' + data.decode("utf-8") + "}"
@@ -0,0 +1,36 @@
+from Services.lruCache import LRUCache
+from Schemas.schemas import TransactionType
+from typing import Optional
+import os
+
+# Ledger rows never change once committed, so clients may cache them forever
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# ...except the TRANSFER_OUT leg of a cross-shard transfer, which is linked to its TRANSFER_IN leg later
+UNSETTLED_CACHE_CONTROL = "no-store"
+
+TRANSACTION_DETAIL_CACHE_SIZE = int(os.getenv("TRANSACTION_DETAIL_CACHE_SIZE", "10000"))
+
+# transaction_id -> serialized TransactionResponse JSON, settled rows only
+transaction_detail_cache = LRUCache(maxsize=TRANSACTION_DETAIL_CACHE_SIZE)
+
+def is_settled(transaction) -> bool:
+    """Whether a ledger row is final; an unlinked TRANSFER_OUT leg may still get its reference"""
+    return not (
+        transaction.transaction_type == TransactionType.TRANSFER_OUT
+        and transaction.reference_transaction_id is None
+    )
+
+def transaction_etag(transaction_id: int) -> str:
+    """Strong ETag of a settled transaction; derived from the id alone because those rows are immutable"""
+    return f'"txn-{transaction_id}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for this header)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag
+        for candidate in if_none_match.split(",")
+    )
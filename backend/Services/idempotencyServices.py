@@ -0,0 +1,230 @@
+from fastapi import HTTPException, Response, status
+from pydantic import BaseModel
+from sqlalchemy import select, delete, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from Models.Model import IdempotencyKey
+from Services.lruCache import LRUCache
+from db.shards import shard_for_user
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, NamedTuple, Optional
+import asyncio
+import hashlib
+import json
+import os
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 60 * 60)))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+# Expired rows are purged in bounded batches every this many saves
+IDEMPOTENCY_PURGE_EVERY = 1000
+IDEMPOTENCY_PURGE_BATCH = 1000
+
+class StoredResponse(NamedTuple):
+    request_hash: str
+    status_code: int
+    body: bytes
+    # The response of a cross-shard transfer that is not resolved yet
+    pending: bool = False
+
+@dataclass
+class IdempotentRequest:
+    """The keyed request being served; the money operation stores its response before committing"""
+    key: str
+    request_hash: str
+    status_code: int
+    render: Callable[[Any], BaseModel]
+    ttl_seconds: int
+    body: Optional[bytes] = None
+
+class DuplicateRequest(HTTPException):
+    """Another request with the same key committed first; the operation must roll back"""
+
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is still being processed"
+        )
+
+# Set by IdempotencyStore.run for the duration of the operation
+current_request: ContextVar[Optional[IdempotentRequest]] = ContextVar("idempotent_request", default=None)
+
+_saves = 0
+
+async def save_response(
+    db: AsyncSession,
+    result: Any,
+    request: Optional[IdempotentRequest] = None,
+    transfer_intent_id: Optional[str] = None
+):
+    """Store the response for the current keyed request in `db`'s transaction, without committing.
+
+    Call it right before committing the ledger write, on the same session, so
+    the money moves if and only if the key is recorded. Raises
+    DuplicateRequest when a live row for the key already exists.
+    """
+    global _saves
+    request = request or current_request.get()
+    if request is None:
+        return
+    request.body = request.render(result).model_dump_json().encode("utf-8")
+    now = datetime.now()
+    statement = insert(IdempotencyKey).values(
+        key=request.key,
+        request_hash=request.request_hash,
+        status_code=request.status_code,
+        response_body=request.body,
+        created_at=now,
+        expires_at=now + timedelta(seconds=request.ttl_seconds),
+        transfer_intent_id=transfer_intent_id
+    )
+    # An expired row for the same key is simply taken over
+    saved = await db.execute(statement.on_conflict_do_update(
+        index_elements=[IdempotencyKey.key],
+        set_={column: statement.excluded[column] for column in (
+            "request_hash", "status_code", "response_body", "created_at", "expires_at", "transfer_intent_id"
+        )},
+        where=IdempotencyKey.expires_at <= now
+    ))
+    if not saved.rowcount:
+        raise DuplicateRequest()
+    _saves += 1
+    if _saves % IDEMPOTENCY_PURGE_EVERY == 0:
+        await db.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.key.in_(
+                select(IdempotencyKey.key)
+                .where(IdempotencyKey.expires_at <= now)
+                .limit(IDEMPOTENCY_PURGE_BATCH)
+            ))
+        )
+
+async def settle_transfer_response(db: AsyncSession, transfer_intent_id: str, committed: bool):
+    """Finish the stored response of a cross-shard transfer in the sender's step-3 transaction.
+
+    A committed transfer keeps it; an aborted one drops it, like any failed
+    request, so a retry runs again.
+    """
+    if committed:
+        await db.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.transfer_intent_id == transfer_intent_id)
+            .values(transfer_intent_id=None)
+        )
+    else:
+        await db.execute(delete(IdempotencyKey).where(IdempotencyKey.transfer_intent_id == transfer_intent_id))
+
+class IdempotencyStore:
+    """Idempotency-Key support for money-moving POSTs.
+
+    The response is written to idempotency_keys on the acting user's shard in
+    the same DB transaction as the ledger rows, so a crash can't leave money
+    moved without a record, and the key's primary key lets only one of two
+    concurrent duplicates commit, whichever worker process they reach.
+    Responses are kept in an in-memory LRU as well; concurrent duplicates
+    within this process wait for the first request instead of running
+    alongside it.
+    """
+
+    def __init__(self, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS, cache_size: int = IDEMPOTENCY_CACHE_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self._cache = LRUCache(maxsize=cache_size, ttl=ttl_seconds)
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    async def run(
+        self,
+        idempotency_key: Optional[str],
+        user_id: int,
+        scope: str,
+        payload: Any,
+        operation: Callable[[], Awaitable[Any]],
+        render: Callable[[Any], BaseModel],
+        status_code: int = status.HTTP_201_CREATED
+    ):
+        """Run `operation` once per (scope, key) and replay its rendered response afterwards.
+
+        `user_id` is the user whose shard the operation writes its ledger rows to.
+        """
+        if idempotency_key is None:
+            return render(await operation())
+
+        key = f"{scope}:{idempotency_key}"
+        request_hash = hashlib.sha256(
+            json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+        while True:
+            stored = await self._lookup(user_id, key)
+            if stored is not None:
+                return self._replay(stored, request_hash)
+            pending = self._in_flight.get(key)
+            if pending is None:
+                break
+            error = await asyncio.shield(pending)
+            if error is not None:
+                raise error
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        request = IdempotentRequest(key, request_hash, status_code, render, self.ttl_seconds)
+        token = current_request.set(request)
+        error = None
+        try:
+            result = await operation()
+            body = request.body or render(result).model_dump_json().encode("utf-8")
+            self._cache.set(key, StoredResponse(request_hash, status_code, body))
+            return Response(content=body, status_code=status_code, media_type="application/json")
+        except DuplicateRequest as e:
+            # Another worker process committed this key first
+            stored = await self._lookup(user_id, key)
+            if stored is None:
+                error = e
+                raise
+            return self._replay(stored, request_hash)
+        except HTTPException as e:
+            # Failures are not stored, but waiting duplicates get the same answer
+            error = e
+            raise
+        finally:
+            current_request.reset(token)
+            del self._in_flight[key]
+            future.set_result(error)
+
+    def _replay(self, stored: StoredResponse, request_hash: str) -> Response:
+        if stored.request_hash != request_hash:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Idempotency-Key was already used with a different request"
+            )
+        if stored.pending:
+            raise DuplicateRequest()
+        return Response(
+            content=stored.body,
+            status_code=stored.status_code,
+            media_type="application/json",
+            headers={"Idempotent-Replayed": "true"}
+        )
+
+    async def _lookup(self, user_id: int, key: str) -> Optional[StoredResponse]:
+        stored = self._cache.get(key)
+        if stored is not None:
+            return stored
+        async with shard_for_user(user_id).read_session_factory() as db:
+            result = await db.execute(
+                select(
+                    IdempotencyKey.request_hash,
+                    IdempotencyKey.status_code,
+                    IdempotencyKey.response_body,
+                    IdempotencyKey.transfer_intent_id.is_not(None)
+                )
+                .filter(IdempotencyKey.key == key, IdempotencyKey.expires_at > datetime.now())
+            )
+            row = result.one_or_none()
+        if row is None:
+            return None
+        stored = StoredResponse(*row)
+        if not stored.pending:
+            self._cache.set(key, stored)
+        return stored
+
+idempotency_store = IdempotencyStore()
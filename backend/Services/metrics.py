@@ -0,0 +1,213 @@
+"""In-process request and SQL metrics, rendered in Prometheus text format"""
+from collections import defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+from bisect import bisect_left
+import time
+import os
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Off by default, like profiling: the engine events and per-request accounting cost a little on every query
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+# Adds a Server-Timing header with app and DB time to every response
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Queries per request; a route whose count grows with the data is an N+1
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+# Label for SQL run outside any request (startup, write scheduler, background tasks)
+BACKGROUND_ROUTE = "background"
+
+# Emitted by the engines' "begin" hook (db.configure_sqlite_engine), not by the
+# app; counted as transactions, and their time is the wait for the write lock
+TRANSACTION_START = "BEGIN"
+
+
+@dataclass
+class RequestStats:
+    """SQL activity of the request being served, filled in by the engine events"""
+    queries: int = 0
+    db_seconds: float = 0.0
+    transactions: int = 0
+    begin_seconds: float = 0.0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+@dataclass
+class Histogram:
+    buckets: tuple
+    counts: list = field(default_factory=list)
+    total: float = 0.0
+    count: int = 0
+
+    def __post_init__(self):
+        self.counts = [0] * len(self.buckets)
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Per-route counters and histograms, keyed by (method, route template)"""
+
+    def __init__(self):
+        self.requests = defaultdict(int)
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.query_counts = defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))
+        self.queries = defaultdict(int)
+        self.db_seconds = defaultdict(float)
+        self.transactions = defaultdict(int)
+        self.begin_seconds = defaultdict(float)
+        self.in_flight = 0
+        # Caches register here so their hit rates show up next to the latencies
+        self.caches = {}
+        self.event_hub = None
+        self.velocity_limiter = None
+
+    def observe_request(self, method: str, route: str, status_code: int, seconds: float, stats: RequestStats):
+        key = (method, route)
+        self.requests[(method, route, status_code)] += 1
+        self.latency[key].observe(seconds)
+        self.query_counts[key].observe(stats.queries)
+        self.queries[key] += stats.queries
+        self.db_seconds[key] += stats.db_seconds
+        self.transactions[key] += stats.transactions
+        self.begin_seconds[key] += stats.begin_seconds
+
+    def observe_background_query(self, seconds: float):
+        key = ("", BACKGROUND_ROUTE)
+        self.queries[key] += 1
+        self.db_seconds[key] += seconds
+
+    def observe_background_transaction(self, seconds: float):
+        key = ("", BACKGROUND_ROUTE)
+        self.transactions[key] += 1
+        self.begin_seconds[key] += seconds
+
+    def register_cache(self, name: str, cache):
+        self.caches[name] = cache
+
+    def register_event_hub(self, hub):
+        self.event_hub = hub
+
+    def register_velocity_limiter(self, limiter):
+        self.velocity_limiter = limiter
+
+    def render(self) -> str:
+        lines = []
+
+        def header(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name: str, histograms: dict):
+            for (method, route), hist in sorted(histograms.items()):
+                labels = f'method="{method}",route="{escape(route)}"'
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+                lines.append(f"{name}_sum{{{labels}}} {hist.total}")
+                lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+        header("http_requests_total", "counter", "Requests served, by route template and status")
+        for (method, route, status_code), count in sorted(self.requests.items()):
+            lines.append(
+                f'http_requests_total{{method="{method}",route="{escape(route)}",status="{status_code}"}} {count}'
+            )
+
+        header("http_requests_in_flight", "gauge", "Requests currently being served")
+        lines.append(f"http_requests_in_flight {self.in_flight}")
+
+        header("http_request_duration_seconds", "histogram", "Request latency until the last body byte")
+        histogram("http_request_duration_seconds", self.latency)
+
+        header("db_queries_per_request", "histogram", "SQL statements executed per request")
+        histogram("db_queries_per_request", self.query_counts)
+
+        header("db_queries_total", "counter", "SQL statements executed, by route template")
+        for (method, route), count in sorted(self.queries.items()):
+            lines.append(f'db_queries_total{{method="{method}",route="{escape(route)}"}} {count}')
+
+        header("db_query_duration_seconds_total", "counter", "Time spent executing SQL, by route template")
+        for (method, route), seconds in sorted(self.db_seconds.items()):
+            lines.append(f'db_query_duration_seconds_total{{method="{method}",route="{escape(route)}"}} {seconds}')
+
+        header("db_transactions_total", "counter", "DB transactions started, by route template")
+        for (method, route), count in sorted(self.transactions.items()):
+            lines.append(f'db_transactions_total{{method="{method}",route="{escape(route)}"}} {count}')
+
+        header("db_begin_duration_seconds_total", "counter", "Time spent in BEGIN, mostly waiting for the write lock")
+        for (method, route), seconds in sorted(self.begin_seconds.items()):
+            lines.append(f'db_begin_duration_seconds_total{{method="{method}",route="{escape(route)}"}} {seconds}')
+
+        for stat, kind in (("size", "gauge"), ("hits", "counter"), ("misses", "counter"), ("evictions", "counter")):
+            name = f"cache_{stat}" if kind == "gauge" else f"cache_{stat}_total"
+            header(name, kind, f"In-process cache {stat}")
+            for cache_name, cache in sorted(self.caches.items()):
+                lines.append(f'{name}{{cache="{cache_name}"}} {cache.stats()[stat]}')
+
+        if self.event_hub is not None:
+            hub = self.event_hub.stats()
+            header("event_subscribers", "gauge", "Open balance/transaction feeds")
+            lines.append(f"event_subscribers {hub['subscribers']}")
+            header("events_published_total", "counter", "Events published to at least one feed")
+            lines.append(f"events_published_total {hub['published']}")
+            header("events_dropped_total", "counter", "Events dropped from full feed queues")
+            lines.append(f"events_dropped_total {hub['dropped']}")
+
+        if self.velocity_limiter is not None and self.velocity_limiter.enabled:
+            velocity = self.velocity_limiter.stats()
+            header("velocity_windows", "gauge", "Per-user velocity windows held in memory")
+            lines.append(f"velocity_windows {velocity['tracked']}")
+            header("velocity_rejections_total", "counter", "Operations refused with 429 by a velocity limit")
+            lines.append(f"velocity_rejections_total {velocity['rejected']}")
+
+        return "\n".join(lines) + "\n"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+metrics = MetricsRegistry()
+
+
+def instrument_engine(async_engine: AsyncEngine):
+    """Count statements and DB time against the current request via engine events.
+
+    The BEGIN the engine emits for every transaction is reported separately
+    from the application's SQL.
+    """
+    sync_engine = async_engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _record_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        stats = current_request.get()
+        if statement.startswith(TRANSACTION_START):
+            if stats is None:
+                metrics.observe_background_transaction(elapsed)
+            else:
+                stats.transactions += 1
+                stats.begin_seconds += elapsed
+        elif stats is None:
+            metrics.observe_background_query(elapsed)
+        else:
+            stats.queries += 1
+            stats.db_seconds += elapsed
@@ -0,0 +1,82 @@
+from concurrent.futures import ProcessPoolExecutor
+from Services.lruCache import LRUCache
+from typing import Optional
+import asyncio
+import bcrypt
+import hashlib
+import hmac
+import os
+
+# bcrypt work factor for new hashes; existing hashes keep the factor they were made with
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(os.cpu_count() or 1)))
+
+# Successful password checks are remembered briefly so repeated logins skip bcrypt
+LOGIN_CACHE_TTL_SECONDS = float(os.getenv("LOGIN_CACHE_TTL_SECONDS", "300"))
+LOGIN_CACHE_SIZE = int(os.getenv("LOGIN_CACHE_SIZE", "10000"))
+
+# Passwords per pool task in a bulk hash; small so logins queued behind an import wait one task, not the whole import
+PASSWORD_HASH_BATCH = int(os.getenv("PASSWORD_HASH_BATCH", "4"))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_verified = LRUCache(maxsize=LOGIN_CACHE_SIZE, ttl=LOGIN_CACHE_TTL_SECONDS)
+# Per-process key so the cache never holds anything that can be checked offline
+_cache_key = os.urandom(32)
+
+def _hash_password(password: str, rounds: int) -> str:
+    salt = bcrypt.gensalt(rounds=rounds)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+def _hash_passwords(passwords: list[str], rounds: int) -> list[str]:
+    return [_hash_password(password, rounds) for password in passwords]
+
+def _check_password(password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+def get_password_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PASSWORD_WORKERS)
+    return _executor
+
+def shutdown_password_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+async def hash_password(password: str) -> str:
+    """Hash a password using bcrypt on the process pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_password_executor(), _hash_password, password, BCRYPT_ROUNDS)
+
+async def hash_passwords(passwords: list[str], batch_size: int = PASSWORD_HASH_BATCH) -> list[str]:
+    """Hash many passwords across the whole process pool, in input order.
+
+    At most one task per worker is queued at a time, so logins and signups
+    that arrive mid-import still get a worker after the current tasks.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_password_executor()
+    slots = asyncio.Semaphore(PASSWORD_WORKERS)
+
+    async def run(part: list[str]) -> list[str]:
+        async with slots:
+            return await loop.run_in_executor(executor, _hash_passwords, part, BCRYPT_ROUNDS)
+
+    parts = await asyncio.gather(*(run(passwords[i:i + batch_size]) for i in range(0, len(passwords), batch_size)))
+    return [hashed for part in parts for hashed in part]
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    """Check a password against a bcrypt hash on the process pool"""
+    cache_key = hmac.new(
+        _cache_key, f"{hashed_password}\0{password}".encode('utf-8'), hashlib.sha256
+    ).digest()
+    if _verified.get(cache_key):
+        return True
+
+    loop = asyncio.get_running_loop()
+    valid = await loop.run_in_executor(get_password_executor(), _check_password, password, hashed_password)
+    if valid:
+        _verified.set(cache_key, True)
+    return valid
@@ -0,0 +1,208 @@
+"""On-demand request profiling: cProfile plus async stack sampling.
+
+Nothing here is installed unless PROFILING_ENABLED=1, so it costs nothing
+when off. A request is profiled when it carries a valid signed
+X-Profile-Token header, when its route has been armed through the admin
+endpoint, or when it falls in the PROFILING_SAMPLE_RATE fraction.
+"""
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+import asyncio
+import cProfile
+import hashlib
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+# Signs X-Profile-Token headers and guards the admin endpoint; both are refused when unset
+PROFILING_SECRET = os.getenv("PROFILING_SECRET", "")
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", "./profiles")
+# Oldest profiles are deleted once the directory holds more than this many
+PROFILING_MAX_PROFILES = int(os.getenv("PROFILING_MAX_PROFILES", "200"))
+PROFILING_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILING_SAMPLE_INTERVAL_MS", "2"))
+
+
+def sign_profile_token(expires_at: int, secret: str = PROFILING_SECRET) -> str:
+    signature = hmac.new(secret.encode(), str(expires_at).encode(), hashlib.sha256).hexdigest()
+    return f"{expires_at}.{signature}"
+
+
+def verify_profile_token(token: str, secret: str = PROFILING_SECRET) -> bool:
+    if not secret:
+        return False
+    expires_at, _, _ = token.partition(".")
+    if not expires_at.isdigit() or int(expires_at) < time.time():
+        return False
+    return hmac.compare_digest(token, sign_profile_token(int(expires_at), secret))
+
+
+class ProfileArms:
+    """Routes armed to profile their next N requests"""
+
+    def __init__(self):
+        self._remaining: dict[tuple[str, str], int] = {}
+
+    def arm(self, method: str, route: str, count: int):
+        self._remaining[(method.upper(), route)] = count
+
+    def disarm(self, method: str, route: str):
+        self._remaining.pop((method.upper(), route), None)
+
+    def take(self, method: str, route: str) -> bool:
+        key = (method, route)
+        remaining = self._remaining.get(key, 0)
+        if remaining <= 0:
+            return False
+        if remaining == 1:
+            del self._remaining[key]
+        else:
+            self._remaining[key] = remaining - 1
+        return True
+
+    def __bool__(self) -> bool:
+        return bool(self._remaining)
+
+    def snapshot(self) -> list[dict]:
+        return [
+            {"method": method, "route": route, "remaining": remaining}
+            for (method, route), remaining in sorted(self._remaining.items())
+        ]
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class AsyncStackSampler:
+    """Sample one task's logical async stack from a background thread.
+
+    Walking the task's cr_await chain shows where the request is waiting
+    (a DB await, the password pool) even while the loop runs other work, so
+    the collapsed stacks are wall-clock time for this request only.
+    """
+
+    def __init__(self, task: asyncio.Task, interval: float):
+        self.task = task
+        self.interval = interval
+        self.loop_thread_id = threading.get_ident()
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                stack = self._sample()
+            except (AttributeError, ValueError):
+                # The task moved on while we walked it; skip this sample
+                continue
+            if stack:
+                self.samples[";".join(stack)] += 1
+
+    def _sample(self) -> list[str]:
+        stack = []
+        coro = self.task.get_coro()
+        innermost = None
+        while coro is not None:
+            frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+            if frame is None:
+                break
+            stack.append(_frame_label(frame))
+            innermost = coro
+            coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+
+        if coro is not None:
+            stack.append(f"<await {type(coro).__name__}>")
+        elif innermost is not None and getattr(innermost, "cr_running", False):
+            # Running right now: add the synchronous frames above the innermost coroutine
+            frame = sys._current_frames().get(self.loop_thread_id)
+            sync_frames = []
+            while frame is not None and frame is not innermost.cr_frame:
+                sync_frames.append(_frame_label(frame))
+                frame = frame.f_back
+            if frame is not None:
+                stack.extend(reversed(sync_frames))
+        return stack
+
+
+class RequestProfile:
+    """cProfile and the async sampler around one request"""
+
+    # cProfile hooks the whole loop thread, so only one request is profiled at a time
+    _active = False
+
+    def __init__(self, method: str, route: str, reason: str):
+        self.method = method
+        self.route = route
+        self.reason = reason
+        self.profiler = cProfile.Profile()
+        self.sampler: Optional[AsyncStackSampler] = None
+        self.started = 0.0
+        self.elapsed = 0.0
+
+    @classmethod
+    def try_start(cls, method: str, route: str, reason: str) -> Optional["RequestProfile"]:
+        if cls._active:
+            return None
+        cls._active = True
+        profile = cls(method, route, reason)
+        profile.sampler = AsyncStackSampler(asyncio.current_task(), PROFILING_SAMPLE_INTERVAL_MS / 1000)
+        profile.started = time.perf_counter()
+        profile.sampler.start()
+        profile.profiler.enable()
+        return profile
+
+    def stop(self):
+        self.profiler.disable()
+        self.sampler.stop()
+        self.elapsed = time.perf_counter() - self.started
+        RequestProfile._active = False
+
+    def save(self, directory: str = PROFILING_DIR) -> str:
+        """Write <name>.pstats and <name>.collapsed, then rotate the directory"""
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", self.route).strip("_") or "root"
+        name = (
+            f"{datetime.now().strftime('%Y%m%dT%H%M%S.%f')}-{self.method}-{slug}"
+            f"-{self.elapsed * 1000:.0f}ms-{self.reason}"
+        )
+        base = os.path.join(directory, name)
+        self.profiler.dump_stats(base + ".pstats")
+        with open(base + ".collapsed", "w") as f:
+            for stack, count in self.sampler.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        rotate_profiles(directory)
+        return base
+
+
+def rotate_profiles(directory: str = PROFILING_DIR, keep: int = PROFILING_MAX_PROFILES):
+    names = sorted({os.path.splitext(name)[0] for name in os.listdir(directory)})
+    for name in names[:max(0, len(names) - keep)]:
+        for extension in (".pstats", ".collapsed"):
+            try:
+                os.remove(os.path.join(directory, name + extension))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(directory: str = PROFILING_DIR) -> list[str]:
+    if not os.path.isdir(directory):
+        return []
+    return sorted({os.path.splitext(name)[0] for name in os.listdir(directory)}, reverse=True)
+
+
+profile_arms = ProfileArms()
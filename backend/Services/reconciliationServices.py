@@ -0,0 +1,236 @@
+from sqlalchemy import select, func, and_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from Models.Model import User, Transaction, BalanceCheckpoint
+from Services.trasnactionServices import signed_amount
+from Services.archiveServices import archived_balances
+from db.db import AsyncSessionLocal, ReadSessionLocal
+from db.shards import shards
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+import asyncio
+import logging
+import os
+import time
+
+# Seconds between full reconciliation passes of the background task; 0 turns the task off
+RECONCILIATION_INTERVAL_SECONDS = float(os.getenv("RECONCILIATION_INTERVAL_SECONDS", "0"))
+# Users verified per batch; each batch is one read snapshot and one checkpoint write
+RECONCILIATION_BATCH_USERS = int(os.getenv("RECONCILIATION_BATCH_USERS", "500"))
+# Pause between batches so a pass never monopolises the writer or the event loop
+RECONCILIATION_BATCH_PAUSE_MS = float(os.getenv("RECONCILIATION_BATCH_PAUSE_MS", "10"))
+# Differences below this are float noise, not drift
+RECONCILIATION_TOLERANCE = float(os.getenv("RECONCILIATION_TOLERANCE", "0.005"))
+
+logger = logging.getLogger("reconciliation")
+
+@dataclass
+class BalanceDrift:
+    user_id: int
+    balance: float
+    ledger_balance: float
+
+    @property
+    def drift(self) -> float:
+        return self.balance - self.ledger_balance
+
+@dataclass
+class ReconciliationReport:
+    users_checked: int = 0
+    transactions_verified: int = 0
+    drifted: list[BalanceDrift] = field(default_factory=list)
+    started_at: datetime = field(default_factory=datetime.now)
+    elapsed: float = 0.0
+
+    def merge(self, other: "ReconciliationReport"):
+        self.users_checked += other.users_checked
+        self.transactions_verified += other.transactions_verified
+        self.drifted.extend(other.drifted)
+
+class ReconciliationService:
+    """Incremental check of users.balance against the ledger.
+
+    Each user's checkpoint holds the ledger balance up to a transaction id, so
+    a batch only sums that user's rows added since the last check. The
+    balance and the new rows are read in one snapshot, which keeps the check
+    exact while money operations keep committing.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        read_session_factory: async_sessionmaker = ReadSessionLocal,
+        batch_users: int = RECONCILIATION_BATCH_USERS,
+        tolerance: float = RECONCILIATION_TOLERANCE
+    ):
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory
+        self.batch_users = batch_users
+        self.tolerance = tolerance
+
+    async def reconcile_batch(self, after_user_id: int = 0) -> tuple[ReconciliationReport, Optional[int]]:
+        """Verify the next batch of users after `after_user_id`.
+
+        Returns the batch report and the last user id checked, or None once
+        there are no users left in this pass.
+        """
+        report = ReconciliationReport()
+        users = (
+            select(User.id, User.balance)
+            .filter(User.id > after_user_id)
+            .order_by(User.id)
+            .limit(self.batch_users)
+            .subquery()
+        )
+        transactions = Transaction.__table__
+        statement = (
+            select(
+                users.c.id,
+                users.c.balance,
+                func.coalesce(BalanceCheckpoint.balance, 0.0),
+                func.coalesce(BalanceCheckpoint.last_transaction_id, 0),
+                func.coalesce(func.sum(signed_amount()), 0.0),
+                func.max(transactions.c.id),
+                func.count(transactions.c.id)
+            )
+            .select_from(users)
+            .outerjoin(BalanceCheckpoint, BalanceCheckpoint.user_id == users.c.id)
+            .outerjoin(transactions, and_(
+                transactions.c.user_id == users.c.id,
+                transactions.c.id > func.coalesce(BalanceCheckpoint.last_transaction_id, 0)
+            ))
+            .group_by(users.c.id)
+            .order_by(users.c.id)
+        )
+        async with self.read_session_factory() as db:
+            rows = (await db.execute(statement)).all()
+        if not rows:
+            return report, None
+
+        checkpoints = []
+        for user_id, balance, checkpoint_balance, last_transaction_id, delta, max_id, new_rows in rows:
+            ledger_balance = checkpoint_balance + delta
+            drift = balance - ledger_balance
+            if abs(drift) > self.tolerance:
+                report.drifted.append(BalanceDrift(user_id, balance, ledger_balance))
+            else:
+                drift = 0.0
+            checkpoints.append({
+                "user_id": user_id,
+                "balance": ledger_balance,
+                "last_transaction_id": max_id or last_transaction_id,
+                "drift": drift,
+                "checked_at": datetime.now(),
+            })
+            report.transactions_verified += new_rows
+        report.users_checked = len(rows)
+
+        statement = insert(BalanceCheckpoint)
+        async with self.session_factory() as db:
+            await db.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[BalanceCheckpoint.user_id],
+                    set_={
+                        "balance": statement.excluded.balance,
+                        "last_transaction_id": statement.excluded.last_transaction_id,
+                        "drift": statement.excluded.drift,
+                        "checked_at": statement.excluded.checked_at,
+                    }
+                ),
+                checkpoints
+            )
+            await db.commit()
+        return report, rows[-1][0]
+
+    async def reconcile_all(self, pause: float = 0.0) -> ReconciliationReport:
+        """One full pass over every user, batch by batch"""
+        report = ReconciliationReport()
+        started = time.perf_counter()
+        after_user_id = 0
+        while True:
+            batch, after_user_id = await self.reconcile_batch(after_user_id)
+            report.merge(batch)
+            if after_user_id is None:
+                break
+            if pause:
+                await asyncio.sleep(pause)
+        report.elapsed = time.perf_counter() - started
+        for drifted in report.drifted:
+            logger.warning(
+                "Balance drift for user %s: balance %.2f, ledger %.2f (%+.2f)",
+                drifted.user_id, drifted.balance, drifted.ledger_balance, drifted.drift
+            )
+        logger.info(
+            "Reconciled %d users, %d new ledger rows in %.2fs; %d drifted",
+            report.users_checked, report.transactions_verified, report.elapsed, len(report.drifted)
+        )
+        return report
+
+    async def reset_checkpoints(self):
+        """Drop every checkpoint so the next pass re-verifies the whole ledger.
+
+        Archived rows are no longer in the live table, so each user's new
+        checkpoint starts from the sum of their archived rows at transaction
+        id 0. The archiver only moves rows a checkpoint covers, and checks
+        that again as it copies and deletes, so nothing moves between
+        dropping the checkpoints and the next pass.
+        """
+        async with self.session_factory() as db:
+            await db.execute(BalanceCheckpoint.__table__.delete())
+            await db.commit()
+            database_path = db.get_bind().url.database
+        archived = await asyncio.to_thread(archived_balances, database_path)
+        if not archived:
+            return
+        async with self.session_factory() as db:
+            await db.execute(insert(BalanceCheckpoint), [
+                {"user_id": user_id, "balance": balance, "last_transaction_id": 0, "drift": 0.0, "checked_at": datetime.now()}
+                for user_id, balance in archived.items()
+            ])
+            await db.commit()
+
+class ReconciliationWorker:
+    """Background task that runs a reconciliation pass every interval"""
+
+    def __init__(
+        self,
+        service: ReconciliationService,
+        interval_seconds: float = RECONCILIATION_INTERVAL_SECONDS,
+        batch_pause_ms: float = RECONCILIATION_BATCH_PAUSE_MS
+    ):
+        self.service = service
+        self.interval = interval_seconds
+        self.batch_pause = batch_pause_ms / 1000
+        self.last_report: Optional[ReconciliationReport] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                self.last_report = await self.service.reconcile_all(pause=self.batch_pause)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Reconciliation pass failed")
+            await asyncio.sleep(self.interval)
+
+reconciliation_worker = ReconciliationWorker(ReconciliationService())
+# One worker per shard; shard 0's is reconciliation_worker
+reconciliation_workers = [reconciliation_worker] + [
+    ReconciliationWorker(ReconciliationService(shard.session_factory, shard.read_session_factory))
+    for shard in shards[1:]
+]
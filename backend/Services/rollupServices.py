@@ -0,0 +1,156 @@
+from sqlalchemy import select, delete, func, case, and_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from Models.Model import User, Transaction, DailyRollup, ArchivedUser
+from Schemas.schemas import TransactionType, SummaryGranularity
+from db.db import AsyncSessionLocal
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Iterable, Optional
+import logging
+
+# Users whose rollups are rebuilt per write transaction
+ROLLUP_REBUILD_BATCH_USERS = 200
+
+# (total column, count column) of each ledger row type
+ROLLUP_COLUMNS = {
+    TransactionType.CREDIT.value: ("credit_total", "credit_count"),
+    TransactionType.DEBIT.value: ("debit_total", "debit_count"),
+    TransactionType.TRANSFER_IN.value: ("transfer_in_total", "transfer_in_count"),
+    TransactionType.TRANSFER_OUT.value: ("transfer_out_total", "transfer_out_count"),
+}
+ROLLUP_VALUE_COLUMNS = [column for pair in ROLLUP_COLUMNS.values() for column in pair]
+
+logger = logging.getLogger("rollups")
+
+async def bump_daily_rollups(db: AsyncSession, transactions: Iterable[Transaction]):
+    """Add freshly inserted ledger rows to their users' daily rollups, without committing"""
+    increments = defaultdict(lambda: dict.fromkeys(ROLLUP_VALUE_COLUMNS, 0))
+    for transaction in transactions:
+        total_column, count_column = ROLLUP_COLUMNS[transaction.transaction_type]
+        row = increments[(transaction.user_id, transaction.created_at.date())]
+        row[total_column] += transaction.amount
+        row[count_column] += 1
+    if not increments:
+        return
+
+    statement = insert(DailyRollup)
+    await db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[DailyRollup.user_id, DailyRollup.day],
+            set_={column: getattr(DailyRollup, column) + statement.excluded[column] for column in ROLLUP_VALUE_COLUMNS}
+        ),
+        [{"user_id": user_id, "day": day, **values} for (user_id, day), values in increments.items()]
+    )
+
+def rollup_select(user_filter):
+    """SELECT computing daily rollup rows from the ledger for the users matching `user_filter`"""
+    aggregates = []
+    for transaction_type, (total_column, count_column) in ROLLUP_COLUMNS.items():
+        is_type = Transaction.transaction_type == transaction_type
+        aggregates.append(func.coalesce(func.sum(case((is_type, Transaction.amount), else_=0.0)), 0.0).label(total_column))
+        aggregates.append(func.coalesce(func.sum(case((is_type, 1), else_=0)), 0).label(count_column))
+    day = func.date(Transaction.created_at)
+    return (
+        select(Transaction.user_id, day.label("day"), *aggregates)
+        .filter(user_filter)
+        .group_by(Transaction.user_id, day)
+    )
+
+def archive_horizon(user_id_column):
+    """Day of the user's newest archived ledger row, or '' (before any day) when nothing is archived"""
+    return func.coalesce(
+        select(func.date(ArchivedUser.last_created_at))
+        .filter(ArchivedUser.user_id == user_id_column)
+        .scalar_subquery(),
+        ""
+    )
+
+async def rebuild_daily_rollups(
+    session_factory: async_sessionmaker = AsyncSessionLocal,
+    batch_users: int = ROLLUP_REBUILD_BATCH_USERS
+) -> int:
+    """Recompute every user's rollups from the ledger, one batch of users per transaction.
+
+    Each batch deletes and re-inserts its users' rows under the write lock, so
+    it is safe to run while money operations keep updating rollups. Days up to
+    a user's last archived row are kept as they are, since part of their
+    ledger is no longer in the live table.
+    """
+    after_user_id = 0
+    rebuilt = 0
+    while True:
+        async with session_factory() as db:
+            user_ids = (await db.scalars(
+                select(User.id).filter(User.id > after_user_id).order_by(User.id).limit(batch_users)
+            )).all()
+            if not user_ids:
+                await db.rollback()
+                return rebuilt
+            in_batch = and_(
+                Transaction.user_id >= user_ids[0],
+                Transaction.user_id <= user_ids[-1],
+                func.date(Transaction.created_at) > archive_horizon(Transaction.user_id)
+            )
+            await db.execute(
+                delete(DailyRollup).filter(
+                    DailyRollup.user_id >= user_ids[0],
+                    DailyRollup.user_id <= user_ids[-1],
+                    DailyRollup.day > archive_horizon(DailyRollup.user_id)
+                )
+            )
+            await db.execute(
+                insert(DailyRollup).from_select(["user_id", "day", *ROLLUP_VALUE_COLUMNS], rollup_select(in_batch))
+            )
+            await db.commit()
+        rebuilt += len(user_ids)
+        after_user_id = user_ids[-1]
+        logger.info("Rebuilt daily rollups for %d users (up to id %d)", rebuilt, after_user_id)
+
+def summary_start(granularity: SummaryGranularity, periods: int, today: date) -> date:
+    """First day of the earliest of `periods` periods ending with the one containing `today`"""
+    if granularity == SummaryGranularity.DAY:
+        return today - timedelta(days=periods - 1)
+    if granularity == SummaryGranularity.WEEK:
+        return today - timedelta(days=today.weekday() + 7 * (periods - 1))
+    months = today.year * 12 + today.month - 1 - (periods - 1)
+    return date(months // 12, months % 12 + 1, 1)
+
+async def get_spending_summary(
+    db: AsyncSession,
+    user_id: int,
+    granularity: SummaryGranularity,
+    start: date,
+    end: date
+) -> list[dict]:
+    """Per-period totals from the rollups between `start` and `end` (inclusive), oldest first"""
+    if granularity == SummaryGranularity.DAY:
+        period = DailyRollup.day
+    elif granularity == SummaryGranularity.WEEK:
+        # Monday of the rollup day's week
+        period = func.date(DailyRollup.day, "weekday 0", "-6 days")
+    else:
+        period = func.date(DailyRollup.day, "start of month")
+
+    result = await db.execute(
+        select(
+            period.label("period_start"),
+            func.sum(DailyRollup.credit_total).label("credits"),
+            func.sum(DailyRollup.debit_total).label("debits"),
+            func.sum(DailyRollup.transfer_in_total).label("transfers_in"),
+            func.sum(DailyRollup.transfer_out_total).label("transfers_out"),
+            func.sum(
+                DailyRollup.credit_count + DailyRollup.debit_count
+                + DailyRollup.transfer_in_count + DailyRollup.transfer_out_count
+            ).label("transaction_count")
+        )
+        .filter(DailyRollup.user_id == user_id, DailyRollup.day >= start, DailyRollup.day <= end)
+        .group_by(period)
+        .order_by(period)
+    )
+    periods = []
+    for row in result.mappings():
+        row = dict(row)
+        row["net"] = row["credits"] + row["transfers_in"] - row["debits"] - row["transfers_out"]
+        periods.append(row)
+    return periods
@@ -0,0 +1,419 @@
+from fastapi import HTTPException, status
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from Models.Model import ScheduledTransfer
+from Schemas.schemas import (
+    BatchTransferItem,
+    ScheduleFrequency,
+    ScheduledTransferStatus,
+    ScheduledTransferCreate,
+    ScheduledTransferUpdate
+)
+from Services.trasnactionServices import TransactionServices, MoneyOperationResult
+from Services.shardServices import cross_shard_transfers
+from db.shards import SHARDED, Shard, shards, shard_for_user, shard_index, allocate_ids
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Optional
+import asyncio
+import calendar
+import logging
+import os
+import time
+
+# Seconds between checks for due orders; 0 turns the scheduler off
+SCHEDULED_TRANSFER_POLL_SECONDS = float(os.getenv("SCHEDULED_TRANSFER_POLL_SECONDS", "30"))
+# Orders run per DB transaction
+SCHEDULED_TRANSFER_BATCH_SIZE = int(os.getenv("SCHEDULED_TRANSFER_BATCH_SIZE", "1000"))
+# Pause between batches so request writers get the lock during a large backlog
+SCHEDULED_TRANSFER_BATCH_PAUSE_MS = float(os.getenv("SCHEDULED_TRANSFER_BATCH_PAUSE_MS", "10"))
+# An occurrence that fails on insufficient balance is retried this much later...
+SCHEDULED_TRANSFER_RETRY_SECONDS = float(os.getenv("SCHEDULED_TRANSFER_RETRY_SECONDS", "3600"))
+# ...up to this many attempts, then skipped until the next occurrence
+SCHEDULED_TRANSFER_MAX_ATTEMPTS = int(os.getenv("SCHEDULED_TRANSFER_MAX_ATTEMPTS", "3"))
+
+# Failures that may clear up by the next attempt (matched as prefixes); anything else ends the order
+RETRYABLE_ERRORS = ("Insufficient balance", "Velocity limit exceeded")
+
+PERIODS = {
+    ScheduleFrequency.DAILY: timedelta(days=1),
+    ScheduleFrequency.WEEKLY: timedelta(weeks=1),
+}
+
+logger = logging.getLogger("scheduled_transfers")
+
+def shift_months(moment: datetime, months: int) -> datetime:
+    """`moment` moved by whole months, clamped to the end of shorter months"""
+    month_index = moment.month - 1 + months
+    year, month = moment.year + month_index // 12, month_index % 12 + 1
+    return moment.replace(year=year, month=month, day=min(moment.day, calendar.monthrange(year, month)[1]))
+
+def next_occurrence(frequency: str, starts_at: datetime, after: datetime) -> Optional[datetime]:
+    """First slot of the schedule strictly after `after`; None once a ONCE order is past.
+
+    Slots are counted from starts_at, so retries don't shift the time of day
+    and occurrences missed while the scheduler was down are not made up.
+    """
+    if after < starts_at:
+        return starts_at
+    if frequency == ScheduleFrequency.ONCE:
+        return None
+    if frequency == ScheduleFrequency.MONTHLY:
+        months = (after.year - starts_at.year) * 12 + after.month - starts_at.month
+        candidate = shift_months(starts_at, months)
+        return candidate if candidate > after else shift_months(starts_at, months + 1)
+    period = PERIODS[frequency]
+    return starts_at + period * ((after - starts_at) // period + 1)
+
+def following_run(order, now: datetime) -> Optional[datetime]:
+    next_run_at = next_occurrence(order.frequency, order.starts_at, now)
+    if next_run_at is not None and order.ends_at is not None and next_run_at > order.ends_at:
+        return None
+    return next_run_at
+
+class ScheduledTransferServices:
+    """CRUD for standing orders; `db` is a write session on the order's (the sender's) shard"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def create(self, sender_user_id: int, data: ScheduledTransferCreate) -> ScheduledTransfer:
+        if sender_user_id == data.recipient_user_id:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot transfer to yourself")
+        starts_at = data.starts_at or datetime.now()
+        if data.ends_at is not None and data.ends_at < starts_at:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ends_at must not be before starts_at")
+        async with shard_for_user(data.recipient_user_id).read_session_factory() as read_db:
+            if not await TransactionServices(read_db)._user_exists(data.recipient_user_id):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Recipient user not found")
+
+        try:
+            if not await TransactionServices(self.db)._user_exists(sender_user_id):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sender user not found")
+            order = ScheduledTransfer(
+                sender_user_id=sender_user_id,
+                recipient_user_id=data.recipient_user_id,
+                amount=data.amount,
+                description=data.description,
+                frequency=data.frequency.value,
+                status=ScheduledTransferStatus.ACTIVE.value,
+                starts_at=starts_at,
+                ends_at=data.ends_at,
+                next_run_at=starts_at,
+                run_count=0,
+                failed_attempts=0
+            )
+            if SHARDED:
+                # Order ids map to shards the same way user ids do
+                [order.id] = await allocate_ids(self.db, ScheduledTransfer.__table__, 1, shard_index(sender_user_id))
+            self.db.add(order)
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+        return order
+
+    async def get(self, schedule_id: int) -> ScheduledTransfer:
+        order = await self.db.get(ScheduledTransfer, schedule_id)
+        if order is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Scheduled transfer not found")
+        return order
+
+    async def list_for_user(self, user_id: int, skip: int = 0, limit: int = 100) -> list[ScheduledTransfer]:
+        result = await self.db.scalars(
+            select(ScheduledTransfer)
+            .filter(ScheduledTransfer.sender_user_id == user_id)
+            .order_by(ScheduledTransfer.id)
+            .offset(skip)
+            .limit(limit)
+        )
+        return result.all()
+
+    async def update(self, schedule_id: int, data: ScheduledTransferUpdate) -> ScheduledTransfer:
+        try:
+            order = await self.get(schedule_id)
+            if order.status not in (ScheduledTransferStatus.ACTIVE, ScheduledTransferStatus.PAUSED):
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Scheduled transfer is {order.status.lower()}"
+                )
+            changes = data.model_dump(exclude_unset=True)
+            resumed = order.status == ScheduledTransferStatus.PAUSED and changes.get("status") == ScheduledTransferStatus.ACTIVE
+            for field, value in changes.items():
+                setattr(order, field, value.value if isinstance(value, Enum) else value)
+
+            now = datetime.now()
+            if order.status == ScheduledTransferStatus.PAUSED:
+                order.next_run_at = None
+            elif resumed or "frequency" in changes:
+                # Resumed or rescheduled: the next slot from now, or the first run if that is still ahead
+                if order.frequency == ScheduleFrequency.ONCE and order.run_count == 0:
+                    order.next_run_at = max(order.starts_at, now)
+                else:
+                    order.next_run_at = following_run(order, now)
+            if order.next_run_at is not None and order.ends_at is not None and order.next_run_at > order.ends_at:
+                order.next_run_at = None
+            if order.status == ScheduledTransferStatus.ACTIVE and order.next_run_at is None:
+                order.status = ScheduledTransferStatus.COMPLETED.value
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+        return order
+
+    async def cancel(self, schedule_id: int):
+        try:
+            order = await self.get(schedule_id)
+            if order.status in (ScheduledTransferStatus.ACTIVE, ScheduledTransferStatus.PAUSED):
+                order.status = ScheduledTransferStatus.CANCELLED.value
+                order.next_run_at = None
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+
+class StaleScheduledRun(Exception):
+    """The order was run or changed by someone else since it was picked up"""
+
+@dataclass
+class ScheduledRunReport:
+    due: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+
+    def merge(self, other: "ScheduledRunReport"):
+        self.due += other.due
+        self.succeeded += other.succeeded
+        self.failed += other.failed
+
+# Columns of a due order the runner needs
+DUE_COLUMNS = [
+    ScheduledTransfer.id,
+    ScheduledTransfer.sender_user_id,
+    ScheduledTransfer.recipient_user_id,
+    ScheduledTransfer.amount,
+    ScheduledTransfer.description,
+    ScheduledTransfer.frequency,
+    ScheduledTransfer.starts_at,
+    ScheduledTransfer.ends_at,
+    ScheduledTransfer.next_run_at,
+    ScheduledTransfer.run_count,
+    ScheduledTransfer.failed_attempts,
+    ScheduledTransfer.last_transaction_id,
+]
+
+class ScheduledTransferRunner:
+    """Runs due standing orders of one shard, a batch per DB transaction.
+
+    Due orders are read on the next_run_at index inside the writer's
+    transaction (BEGIN IMMEDIATE), so workers in other processes wait instead
+    of picking the same orders. The transfers go through
+    TransactionServices' batch path: balances checked in memory, one bulk
+    ledger insert and one CASE update for the batch. The orders' outcomes
+    and next runs are written by primary key in the same transaction, so an
+    order is paid exactly once per occurrence. Orders whose recipient is on
+    another shard run one by one through CrossShardTransfers, with the
+    order advanced in the sender's step-1 transaction.
+    """
+
+    def __init__(
+        self,
+        shard: Shard = shards[0],
+        batch_size: int = SCHEDULED_TRANSFER_BATCH_SIZE,
+        retry_seconds: float = SCHEDULED_TRANSFER_RETRY_SECONDS,
+        max_attempts: int = SCHEDULED_TRANSFER_MAX_ATTEMPTS
+    ):
+        self.shard = shard
+        self.batch_size = batch_size
+        self.retry_delay = timedelta(seconds=retry_seconds)
+        self.max_attempts = max_attempts
+
+    async def has_due(self, now: datetime) -> bool:
+        """Cheap check on the read pool, so an idle poll never takes the write lock"""
+        async with self.shard.read_session_factory() as db:
+            result = await db.execute(
+                select(ScheduledTransfer.id).filter(ScheduledTransfer.next_run_at <= now).limit(1)
+            )
+            return result.first() is not None
+
+    def outcome(self, order, now: datetime, transaction_id: Optional[int] = None, error: Optional[str] = None) -> dict:
+        """New column values of an order after a run at `now`"""
+        values = {
+            "status": ScheduledTransferStatus.ACTIVE.value,
+            "last_run_at": now,
+            "last_error": error,
+            "failed_attempts": 0,
+            "run_count": order.run_count,
+            "last_transaction_id": order.last_transaction_id,
+            "updated_at": now,
+        }
+        if error is None:
+            values["run_count"] += 1
+            values["last_transaction_id"] = transaction_id
+            values["next_run_at"] = following_run(order, now)
+        elif not error.startswith(RETRYABLE_ERRORS):
+            values["status"] = ScheduledTransferStatus.FAILED.value
+            values["next_run_at"] = None
+        elif order.failed_attempts + 1 < self.max_attempts:
+            values["failed_attempts"] = order.failed_attempts + 1
+            values["next_run_at"] = now + self.retry_delay
+        else:
+            # Out of attempts for this occurrence; wait for the next one
+            values["next_run_at"] = following_run(order, now)
+
+        if values["next_run_at"] is None and values["status"] == ScheduledTransferStatus.ACTIVE:
+            values["status"] = (
+                ScheduledTransferStatus.COMPLETED if error is None else ScheduledTransferStatus.FAILED
+            ).value
+        return values
+
+    async def run_batch(self, now: datetime) -> ScheduledRunReport:
+        """Run up to batch_size orders due at `now`"""
+        report = ScheduledRunReport()
+        async with self.shard.session_factory() as db:
+            service = TransactionServices(db)
+            try:
+                orders = (await db.execute(
+                    select(*DUE_COLUMNS)
+                    .filter(ScheduledTransfer.next_run_at <= now)
+                    .order_by(ScheduledTransfer.next_run_at, ScheduledTransfer.id)
+                    .limit(self.batch_size)
+                )).all()
+                local = [order for order in orders if shard_index(order.recipient_user_id) == self.shard.index]
+                remote = [order for order in orders if shard_index(order.recipient_user_id) != self.shard.index]
+
+                if local:
+                    results = await service._apply_transfer_batch([
+                        BatchTransferItem.model_construct(
+                            sender_user_id=order.sender_user_id,
+                            recipient_user_id=order.recipient_user_id,
+                            amount=order.amount,
+                            description=order.description
+                        )
+                        for order in local
+                    ], atomic=False)
+                    await db.execute(update(ScheduledTransfer), [
+                        {"id": order.id, **self.outcome(order, now, result.transaction_id, result.error)}
+                        for order, result in zip(local, results)
+                    ])
+                    report.succeeded += sum(result.success for result in results)
+                    report.failed += sum(not result.success for result in results)
+                await service._commit()
+            except Exception:
+                await service._rollback()
+                raise
+
+        for order in remote:
+            succeeded = await self.run_cross_shard(order, now)
+            if succeeded is not None:
+                report.succeeded += succeeded
+                report.failed += not succeeded
+        report.due = len(orders)
+        return report
+
+    async def run_cross_shard(self, order, now: datetime) -> Optional[bool]:
+        """Run one order whose recipient is on another shard; None if it was already taken care of"""
+        async def advance(db: AsyncSession, result: MoneyOperationResult):
+            moved = await db.execute(
+                update(ScheduledTransfer)
+                .where(ScheduledTransfer.id == order.id, ScheduledTransfer.next_run_at == order.next_run_at)
+                .values(**self.outcome(order, now, result.transaction.id))
+                .execution_options(synchronize_session=False)
+            )
+            if not moved.rowcount:
+                raise StaleScheduledRun()
+
+        try:
+            await cross_shard_transfers.transfer(
+                order.sender_user_id, order.recipient_user_id, order.amount, order.description, prepare=advance
+            )
+            return True
+        except StaleScheduledRun:
+            return None
+        except HTTPException as e:
+            if e.status_code == status.HTTP_503_SERVICE_UNAVAILABLE:
+                # Debited and the order advanced; recovery delivers the credit
+                return True
+            error = e.detail
+
+        statement = update(ScheduledTransfer).where(ScheduledTransfer.id == order.id)
+        if error.startswith(RETRYABLE_ERRORS):
+            # Nothing was written, so only record it if no one else ran the order meanwhile
+            statement = statement.where(ScheduledTransfer.next_run_at == order.next_run_at)
+        async with self.shard.session_factory() as db:
+            await db.execute(
+                statement.values(**self.outcome(order, now, error=error)).execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        return False
+
+    async def run_due(self, now: Optional[datetime] = None, pause: float = 0.0) -> ScheduledRunReport:
+        """Run every order due at `now`, batch by batch.
+
+        Orders are always rescheduled past `now`, so the loop ends even when
+        every run fails; orders falling due meanwhile wait for the next call.
+        """
+        report = ScheduledRunReport()
+        now = now or datetime.now()
+        if not await self.has_due(now):
+            return report
+        started = time.perf_counter()
+        while True:
+            batch = await self.run_batch(now)
+            report.merge(batch)
+            if batch.due < self.batch_size:
+                break
+            if pause:
+                await asyncio.sleep(pause)
+        report.elapsed = time.perf_counter() - started
+        logger.info(
+            "Ran %d scheduled transfers on shard %d in %.2fs: %d succeeded, %d failed",
+            report.due, self.shard.index, report.elapsed, report.succeeded, report.failed
+        )
+        return report
+
+class ScheduledTransferWorker:
+    """Background task that runs due standing orders every poll interval"""
+
+    def __init__(
+        self,
+        runner: ScheduledTransferRunner,
+        poll_seconds: float = SCHEDULED_TRANSFER_POLL_SECONDS,
+        batch_pause_ms: float = SCHEDULED_TRANSFER_BATCH_PAUSE_MS
+    ):
+        self.runner = runner
+        self.poll = poll_seconds
+        self.batch_pause = batch_pause_ms / 1000
+        self.last_report: Optional[ScheduledRunReport] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                self.last_report = await self.runner.run_due(pause=self.batch_pause)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Scheduled transfer run failed")
+            await asyncio.sleep(self.poll)
+
+scheduled_transfer_worker = ScheduledTransferWorker(ScheduledTransferRunner())
+# One worker per shard; shard 0's is scheduled_transfer_worker
+scheduled_transfer_workers = [scheduled_transfer_worker] + [
+    ScheduledTransferWorker(ScheduledTransferRunner(shard)) for shard in shards[1:]
+]
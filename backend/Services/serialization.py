@@ -0,0 +1,17 @@
+from fastapi import Response
+from pydantic_core import to_json
+from Models.Model import Transaction
+from Schemas.schemas import TransactionResponse
+from typing import Any, Optional
+
+# Ledger columns in TransactionResponse field order, so rows encode exactly like the model
+TRANSACTION_FIELDS = list(TransactionResponse.model_fields)
+TRANSACTION_COLUMNS = [Transaction.__table__.c[field] for field in TRANSACTION_FIELDS]
+
+def json_response(content: Any, status_code: int = 200, headers: Optional[dict] = None) -> Response:
+    """Encode plain dicts/lists straight to JSON bytes, skipping response_model validation.
+
+    For rows read with the response model's columns: pydantic-core's encoder
+    writes the same JSON as the model would, without building model objects.
+    """
+    return Response(content=to_json(content), status_code=status_code, media_type="application/json", headers=headers)
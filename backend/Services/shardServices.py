@@ -0,0 +1,326 @@
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from Models.Model import User, Transaction, TransferIntent
+from Schemas.schemas import TransactionType, BatchTransferItem, BatchTransferItemResult
+from Services.trasnactionServices import TransactionServices, MoneyOperationResult
+from Services.writeScheduler import write_scheduler, write_schedulers, WRITE_QUEUE_ENABLED
+from Services.httpCache import transaction_detail_cache
+from Services.idempotencyServices import save_response, settle_transfer_response
+from db.db import get_db
+from db.shards import SHARDED, shards, shard_for_user, shard_index
+from collections import defaultdict
+from datetime import datetime
+from functools import partial
+from typing import Optional, Callable, Awaitable
+import asyncio
+import logging
+import os
+import uuid
+
+# Seconds between passes that finish transfers left between their two phases; 0 leaves it to startup
+CROSS_SHARD_RECOVERY_INTERVAL_SECONDS = float(os.getenv("CROSS_SHARD_RECOVERY_INTERVAL_SECONDS", "30"))
+
+logger = logging.getLogger("shards")
+
+# TransferIntent roles and states
+SENDER = "SENDER"
+RECIPIENT = "RECIPIENT"
+PREPARED = "PREPARED"
+COMMITTED = "COMMITTED"
+ABORTED = "ABORTED"
+
+class CrossShardTransfers:
+    """Two-phase transfer between users on different shards.
+
+    1. Sender's shard, one transaction: debit, TRANSFER_OUT row and a SENDER
+       intent in PREPARED.
+    2. Recipient's shard, one transaction: a RECIPIENT intent that records the
+       outcome, COMMITTED together with the credit and TRANSFER_IN row, or
+       ABORTED if the recipient is gone. The intent id is the primary key, so
+       when two workers drive the same transfer only one outcome is written.
+    3. Sender's shard: move the intent from PREPARED to that outcome, linking
+       the two legs or refunding the sender.
+
+    A crash or failure after step 1 leaves a PREPARED sender intent; `recover`
+    re-runs steps 2 and 3 for those, which is safe to repeat. It runs at
+    startup and then every CROSS_SHARD_RECOVERY_INTERVAL_SECONDS.
+    """
+
+    async def transfer(
+        self,
+        from_user_id: int,
+        to_user_id: int,
+        amount: float,
+        description: str,
+        prepare: Optional[Callable[[AsyncSession, MoneyOperationResult], Awaitable[None]]] = None
+    ) -> MoneyOperationResult:
+        """Move money between shards; `prepare` writes more into the sender's step-1 transaction"""
+        async with shard_for_user(to_user_id).read_session_factory() as db:
+            recipient = (await db.execute(select(User.username).filter(User.id == to_user_id))).scalar_one_or_none()
+        if recipient is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Recipient user not found")
+
+        async with shard_for_user(from_user_id).session_factory() as db:
+            service = TransactionServices(db)
+            try:
+                result = await service._apply_transfer_leg(
+                    from_user_id, to_user_id, amount, TransactionType.TRANSFER_OUT,
+                    f"Transfer to {recipient}: {description}"
+                )
+                sender = (await db.execute(select(User.username).filter(User.id == from_user_id))).scalar_one()
+                intent = TransferIntent(
+                    id=str(uuid.uuid4()),
+                    role=SENDER,
+                    state=PREPARED,
+                    sender_user_id=from_user_id,
+                    recipient_user_id=to_user_id,
+                    amount=amount,
+                    description=description,
+                    transaction_id=result.transaction.id
+                )
+                db.add(intent)
+                # A keyed request's response stays pending until step 3 settles it
+                await save_response(db, result, transfer_intent_id=intent.id)
+                if prepare is not None:
+                    await prepare(db, result)
+                await service._commit()
+            except Exception:
+                await service._rollback()
+                raise
+
+        try:
+            outcome, reference_transaction_id = await self.resolve(intent, sender)
+        except Exception:
+            logger.exception("Cross-shard transfer %s left in doubt", intent.id)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Transfer debited but not yet credited; it will be completed in the background"
+            )
+        if outcome == ABORTED:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Recipient user not found")
+        result.transaction.reference_transaction_id = reference_transaction_id
+        return result
+
+    async def resolve(self, intent: TransferIntent, sender_username: Optional[str] = None) -> tuple[str, Optional[int]]:
+        """Run steps 2 and 3 for a PREPARED sender intent; returns the outcome and the recipient's ledger row id"""
+        if sender_username is None:
+            async with shard_for_user(intent.sender_user_id).read_session_factory() as db:
+                sender_username = (await db.execute(
+                    select(User.username).filter(User.id == intent.sender_user_id)
+                )).scalar_one()
+        outcome, recipient_transaction_id = await self._apply_recipient(intent, sender_username)
+        await self._finish_sender(intent, outcome, recipient_transaction_id)
+        return outcome, recipient_transaction_id
+
+    async def _apply_recipient(self, intent: TransferIntent, sender_username: str) -> tuple[str, Optional[int]]:
+        shard = shard_for_user(intent.recipient_user_id)
+        async with shard.session_factory() as db:
+            service = TransactionServices(db)
+            try:
+                # The writer's BEGIN IMMEDIATE makes this check and the insert below one critical section
+                decided = (await db.execute(
+                    select(TransferIntent.state, TransferIntent.transaction_id).filter(TransferIntent.id == intent.id)
+                )).one_or_none()
+                if decided is not None:
+                    await service._rollback()
+                    return decided.state, decided.transaction_id
+                try:
+                    leg = await service._apply_transfer_leg(
+                        intent.recipient_user_id, intent.sender_user_id, intent.amount, TransactionType.TRANSFER_IN,
+                        f"Transfer from {sender_username}: {intent.description}",
+                        reference_transaction_id=intent.transaction_id
+                    )
+                    outcome, transaction_id = COMMITTED, leg.transaction.id
+                except HTTPException as e:
+                    if e.status_code != status.HTTP_404_NOT_FOUND:
+                        raise
+                    outcome, transaction_id = ABORTED, None
+                db.add(TransferIntent(
+                    id=intent.id,
+                    role=RECIPIENT,
+                    state=outcome,
+                    sender_user_id=intent.sender_user_id,
+                    recipient_user_id=intent.recipient_user_id,
+                    amount=intent.amount,
+                    description=intent.description,
+                    transaction_id=transaction_id
+                ))
+                await service._commit()
+            except IntegrityError:
+                # Another worker recorded the outcome first
+                await service._rollback()
+                async with shard.read_session_factory() as read_db:
+                    decided = (await read_db.execute(
+                        select(TransferIntent.state, TransferIntent.transaction_id).filter(TransferIntent.id == intent.id)
+                    )).one()
+                return decided.state, decided.transaction_id
+            except Exception:
+                await service._rollback()
+                raise
+        return outcome, transaction_id
+
+    async def _finish_sender(self, intent: TransferIntent, outcome: str, recipient_transaction_id: Optional[int]):
+        async with shard_for_user(intent.sender_user_id).session_factory() as db:
+            service = TransactionServices(db)
+            try:
+                moved = await db.execute(
+                    update(TransferIntent)
+                    .where(TransferIntent.id == intent.id, TransferIntent.state == PREPARED)
+                    .values(state=outcome, updated_at=datetime.now())
+                    .execution_options(synchronize_session=False)
+                )
+                if moved.rowcount:
+                    await settle_transfer_response(db, intent.id, committed=outcome == COMMITTED)
+                if moved.rowcount and outcome == COMMITTED:
+                    await db.execute(
+                        update(Transaction)
+                        .where(Transaction.id == intent.transaction_id)
+                        .values(reference_transaction_id=recipient_transaction_id)
+                        .execution_options(synchronize_session=False)
+                    )
+                    # The TRANSFER_OUT row only gets its reference now; drop any copy cached before that
+                    service._after_commit.append(partial(transaction_detail_cache.pop, intent.transaction_id))
+                elif moved.rowcount and outcome == ABORTED:
+                    await service._credit_balance(intent.sender_user_id, intent.amount)
+                    await service._insert_ledger([
+                        service._ledger_row(
+                            intent.sender_user_id, intent.amount, TransactionType.CREDIT,
+                            f"Transfer reversed: {intent.description}",
+                            reference_transaction_id=intent.transaction_id
+                        )
+                    ])
+                await service._commit()
+            except Exception:
+                await service._rollback()
+                raise
+
+    async def recover(self) -> int:
+        """Finish every transfer whose sender side is still PREPARED; returns how many"""
+        recovered = 0
+        for shard in shards:
+            async with shard.read_session_factory() as db:
+                intents = (await db.scalars(
+                    select(TransferIntent).filter(TransferIntent.state == PREPARED, TransferIntent.role == SENDER)
+                )).all()
+            for intent in intents:
+                try:
+                    outcome, _ = await self.resolve(intent)
+                except Exception:
+                    # Still unreachable; the intent stays PREPARED for the next pass
+                    logger.exception("In-doubt transfer %s not recovered yet", intent.id)
+                    continue
+                logger.warning("Recovered in-doubt transfer %s: %s", intent.id, outcome)
+                recovered += 1
+        return recovered
+
+cross_shard_transfers = CrossShardTransfers()
+
+class CrossShardRecoveryWorker:
+    """Background task that runs `recover` every interval, so in-doubt transfers don't wait for a restart"""
+
+    def __init__(self, transfers: CrossShardTransfers, interval_seconds: float = CROSS_SHARD_RECOVERY_INTERVAL_SECONDS):
+        self.transfers = transfers
+        self.interval = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.transfers.recover()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Cross-shard recovery pass failed")
+
+cross_shard_recovery_worker = CrossShardRecoveryWorker(cross_shard_transfers)
+
+class ShardedMoneyService:
+    """credit/withdraw/transfer routed to the users' shards, same API as TransactionServices.
+
+    Anything that touches one shard runs there, through that shard's write
+    queue when it is enabled; transfers between shards go through
+    CrossShardTransfers.
+    """
+
+    def __init__(self, use_write_queue: bool = WRITE_QUEUE_ENABLED):
+        self.use_write_queue = use_write_queue
+
+    async def _on_shard(self, user_id: int, method: str, *args) -> MoneyOperationResult:
+        if self.use_write_queue:
+            return await getattr(write_schedulers[shard_index(user_id)], method)(*args)
+        async with shard_for_user(user_id).session_factory() as db:
+            return await getattr(TransactionServices(db), method)(*args)
+
+    async def credit(self, user_id: int, amount: float, description: str = "Credit transaction") -> MoneyOperationResult:
+        return await self._on_shard(user_id, "credit", user_id, amount, description)
+
+    async def withdraw(self, user_id: int, amount: float, description: str = "Withdraw transaction") -> MoneyOperationResult:
+        return await self._on_shard(user_id, "withdraw", user_id, amount, description)
+
+    async def transfer(self, from_user_id: int, to_user_id: int, amount: float, description: str = "Transfer") -> MoneyOperationResult:
+        if shard_index(from_user_id) == shard_index(to_user_id):
+            return await self._on_shard(from_user_id, "transfer", from_user_id, to_user_id, amount, description)
+        return await cross_shard_transfers.transfer(from_user_id, to_user_id, amount, description)
+
+    async def transfer_batch(self, transfers: list[BatchTransferItem], atomic: bool = True) -> list[BatchTransferItemResult]:
+        """Batch per shard; cross-shard items go one by one and can't be part of an all-or-nothing batch"""
+        by_shard = defaultdict(list)
+        cross_shard = []
+        for index, item in enumerate(transfers):
+            if shard_index(item.sender_user_id) == shard_index(item.recipient_user_id):
+                by_shard[shard_index(item.sender_user_id)].append(index)
+            else:
+                cross_shard.append(index)
+        if atomic and (cross_shard or len(by_shard) > 1):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="All-or-nothing batches must keep every transfer on one shard"
+            )
+
+        results: list[Optional[BatchTransferItemResult]] = [None] * len(transfers)
+        for index, indexes in by_shard.items():
+            async with shards[index].session_factory() as db:
+                shard_results = await TransactionServices(db).transfer_batch(
+                    [transfers[i] for i in indexes], atomic=atomic
+                )
+            for i, result in zip(indexes, shard_results):
+                result.index = i
+                results[i] = result
+        for i in cross_shard:
+            item = transfers[i]
+            try:
+                transaction, new_balance = await self.transfer(
+                    item.sender_user_id, item.recipient_user_id, item.amount, item.description
+                )
+                results[i] = BatchTransferItemResult(
+                    index=i, success=True, transaction_id=transaction.id, new_balance=new_balance
+                )
+            except HTTPException as e:
+                results[i] = BatchTransferItemResult(index=i, success=False, error=e.detail)
+        return results
+
+sharded_money_service = ShardedMoneyService()
+
+def get_money_service(db: AsyncSession = Depends(get_db)):
+    """Service for credit/withdraw/transfer, routed across shards and through the write queue when enabled"""
+    if SHARDED:
+        return sharded_money_service
+    if WRITE_QUEUE_ENABLED:
+        return write_scheduler
+    return TransactionServices(db)
@@ -0,0 +1,74 @@
+from sqlalchemy.sql import Select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from db.db import ReadSessionLocal
+from datetime import datetime
+from typing import AsyncIterator, Callable, Sequence
+from pydantic_core import to_json
+import heapq
+import csv
+import io
+import os
+
+# Rows fetched from the cursor and encoded per response chunk
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "1000"))
+
+async def stream_rows(
+    statement: Select,
+    session_factory: async_sessionmaker = ReadSessionLocal,
+    chunk_rows: int = STREAM_CHUNK_ROWS
+) -> AsyncIterator[Sequence]:
+    """Yield lists of row mappings from a server-side cursor.
+
+    The generator owns its session, so it stays open for as long as the
+    response is being streamed rather than for the lifetime of the request.
+    """
+    async with session_factory() as db:
+        result = await db.stream(statement.execution_options(yield_per=chunk_rows))
+        async for rows in result.mappings().partitions():
+            yield rows
+
+async def merge_row_streams(streams: list[AsyncIterator[Sequence]], key: Callable) -> AsyncIterator[Sequence]:
+    """Merge chunked streams that are each sorted by `key` into one sorted chunked stream.
+
+    Keeps one chunk per stream in memory: rows up to the smallest last key
+    among the buffered chunks are safe to emit, since nothing later can sort
+    before them.
+    """
+    buffers: list[list] = [[] for _ in streams]
+    active = list(range(len(streams)))
+    while active:
+        for i in list(active):
+            if not buffers[i]:
+                chunk = await anext(streams[i], None)
+                if chunk is None:
+                    active.remove(i)
+                else:
+                    buffers[i] = list(chunk)
+        if not any(buffers):
+            return
+        bound = min((key(buffers[i][-1]) for i in active), default=None)
+        ready = []
+        for i, buffer in enumerate(buffers):
+            cut = len(buffer) if bound is None else next((n for n, row in enumerate(buffer) if key(row) > bound), len(buffer))
+            ready.append(buffer[:cut])
+            buffers[i] = buffer[cut:]
+        yield list(heapq.merge(*ready, key=key))
+
+async def encode_ndjson(chunks: AsyncIterator[Sequence]) -> AsyncIterator[bytes]:
+    async for rows in chunks:
+        yield b"".join(to_json(dict(row)) + b"\n" for row in rows)
+
+async def encode_csv(chunks: AsyncIterator[Sequence], columns: list[str]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    # Header goes out before the first query round-trip
+    yield buffer.getvalue()
+    async for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            [row[column].isoformat() if isinstance(row[column], datetime) else row[column] for column in columns]
+            for row in rows
+        )
+        yield buffer.getvalue()
@@ -1,130 +1,430 @@
 from fastapi import HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from Models.Model import User, Transaction
-from Schemas.schemas import TransactionType
-from typing import Optional
+from sqlalchemy import select, update, insert, func, literal, tuple_, case, or_
+from Models.Model import User, Transaction, UserTransactionCount
+from Schemas.schemas import TransactionType, BatchTransferItem, BatchTransferItemResult
+from Services.userCache import user_cache, cache_user, cache_balance
+from Services.rollupServices import bump_daily_rollups
+from Services.archiveServices import archive_store
+from Services.serialization import TRANSACTION_COLUMNS
+from Services.eventHub import publish_balance, publish_transactions
+from Services.velocityLimits import velocity_limiter
+from Services.idempotencyServices import save_response
+from db.shards import SHARDED, shard_index, allocate_ids
+from typing import Optional, NamedTuple, Callable
+from collections import Counter, defaultdict
+from functools import partial
+from datetime import datetime
+import base64
+import json
+
+# Users per IN/CASE statement, keeps it well under SQLite's bound-parameter limit
+IN_CLAUSE_CHUNK = 500
+
+# Float slack allowed when re-checking balances after a batch update
+BALANCE_EPSILON = 1e-9
+
+class MoneyOperationResult(NamedTuple):
+    transaction: Transaction
+    new_balance: float
+
+def encode_transaction_cursor(transaction: Transaction) -> str:
+    """Encode the (created_at, id) seek position of a transaction as an opaque cursor"""
+    payload = json.dumps([transaction.created_at.isoformat(), transaction.id])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def decode_transaction_cursor(cursor: str) -> tuple[datetime, int]:
+    """Decode a cursor produced by encode_transaction_cursor"""
+    try:
+        created_at, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_at), int(transaction_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def signed_amount(table=Transaction.__table__):
+    """SQL expression for a ledger row's effect on its user's balance"""
+    return case(
+        (table.c.transaction_type.in_([TransactionType.CREDIT.value, TransactionType.TRANSFER_IN.value]), table.c.amount),
+        else_=-table.c.amount
+    )
 
 class TransactionServices:
     def __init__(self, db: AsyncSession):
         self.db = db
+        # Callbacks that publish the effects of the current DB transaction once it commits
+        self._after_commit: list[Callable[[], None]] = []
+        # Callbacks that undo in-memory bookkeeping if it rolls back instead
+        self._after_rollback: list[Callable[[], None]] = []
+
+    async def _commit(self):
+        await self.db.commit()
+        self._run_after_commit()
+
+    async def _rollback(self):
+        self._run_after_rollback()
+        await self.db.rollback()
+
+    def _run_after_commit(self):
+        callbacks, self._after_commit = self._after_commit, []
+        self._after_rollback = []
+        for callback in callbacks:
+            callback()
+
+    def _run_after_rollback(self):
+        callbacks, self._after_rollback = self._after_rollback, []
+        self._after_commit = []
+        for callback in callbacks:
+            callback()
+
+    def _check_velocity(self, user_id: int, transaction_type: TransactionType, amount: float):
+        """Count the operation against the user's velocity limit; raises 429 when over it"""
+        reservation = velocity_limiter.acquire(user_id, transaction_type, amount)
+        if reservation is not None:
+            self._after_rollback.append(partial(velocity_limiter.release, reservation))
 
-    async def get_user_transactions(self, user_id: int, skip: int = 0, limit: int = 10):
+    def _balance_changed(self, user_id: int, balance: float, updated_at: datetime):
+        """Once committed: write the balance through to the user cache and push it to live feeds"""
+        self._after_commit.append(partial(cache_balance, user_id, balance, updated_at))
+        self._after_commit.append(partial(publish_balance, user_id, balance, updated_at))
+
+    async def get_user_profile(self, user_id: int) -> Optional[dict]:
+        """Get a user's UserResponse fields, from the user cache when possible"""
+        snapshot = user_cache.get(user_id)
+        if snapshot is None:
+            user = await self.get_user_by_id(user_id)
+            if user is None:
+                return None
+            snapshot = cache_user(user)
+        return snapshot
+
+    async def get_user_transactions(
+        self,
+        user_id: int,
+        skip: int = 0,
+        limit: int = 10,
+        cursor: Optional[str] = None
+    ):
+        """Get a page of a user's transactions as rows, newest first.
+
+        With a cursor the page starts right after the cursor position using the
+        (user_id, created_at, id) index; otherwise `skip` rows are skipped.
+        Rows carry the TransactionResponse columns and are never loaded as ORM objects.
+        """
+        query = select(*TRANSACTION_COLUMNS).filter(Transaction.user_id == user_id)
+        before = None
+        if cursor:
+            before = decode_transaction_cursor(cursor)
+            query = query.filter(tuple_(Transaction.created_at, Transaction.id) < tuple_(*before))
+            skip = 0
+        query = query.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+
+        result = await self.db.execute(query.offset(skip).limit(limit))
+        transactions = result.all()
+        if len(transactions) == limit:
+            return transactions
+
+        # Short page: older rows may live in the archive files
+        if skip:
+            # Archived rows can interleave with old live ones, so merge from the top
+            transactions = (await self.db.execute(query.limit(skip + limit))).all()
+        return await archive_store.user_page(
+            self.db, user_id, TRANSACTION_COLUMNS, list(transactions), skip, limit, before
+        )
+
+    async def count_user_transactions(self, user_id: int) -> int:
+        """Get the number of ledger rows of a user from the per-user counter"""
         result = await self.db.execute(
-            select(Transaction)
-            .filter(Transaction.user_id == user_id)
-            .offset(skip)
-            .limit(limit)
-            .order_by(Transaction.created_at.desc())
+            select(UserTransactionCount.count).filter(UserTransactionCount.user_id == user_id)
         )
-        return result.scalars().all()
+        count = result.scalar_one_or_none()
+        if count is None:
+            # No counter yet: the user has not transacted since counters were introduced
+            result = await self.db.execute(
+                select(func.count(Transaction.id)).filter(Transaction.user_id == user_id)
+            )
+            count = result.scalar()
+        return count
 
     async def get_user_by_id(self, user_id: int) -> Optional[User]:
         result = await self.db.execute(select(User).filter(User.id == user_id))
         return result.scalar_one_or_none()
 
-    async def credit(self, user_id: int, amount: float, description: str = "Credit transaction"):
-        user = await self.get_user_by_id(user_id)
-        if not user:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-        
-        transaction = await self.create_transaction(
-            user_id=user.id,
-            amount=amount,
-            transaction_type=TransactionType.CREDIT,
-            description=description
-        )
-        
-        if transaction:
-            user.balance += amount
-            await self.db.commit()
-            await self.db.refresh(transaction)
-            await self.db.refresh(user)
+    async def credit(self, user_id: int, amount: float, description: str = "Credit transaction") -> MoneyOperationResult:
+        try:
+            result = await self._apply_credit(user_id, amount, description)
+            await save_response(self.db, result)
+            await self._commit()
+        except Exception:
+            await self._rollback()
+            raise
+        return result
+
+    async def withdraw(self, user_id: int, amount: float, description: str = "Withdraw transaction") -> MoneyOperationResult:
+        try:
+            result = await self._apply_withdraw(user_id, amount, description)
+            await save_response(self.db, result)
+            await self._commit()
+        except Exception:
+            await self._rollback()
+            raise
+        return result
+
+    async def transfer(self, from_user_id: int, to_user_id: int, amount: float, description: str = "Transfer") -> MoneyOperationResult:
+        try:
+            result = await self._apply_transfer(from_user_id, to_user_id, amount, description)
+            await save_response(self.db, result)
+            await self._commit()
+        except HTTPException:
+            await self._rollback()
+            raise
+        except Exception as e:
+            await self._rollback()
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Transfer failed: {str(e)}")
+        return result
+
+    async def transfer_batch(self, transfers: list[BatchTransferItem], atomic: bool = True) -> list[BatchTransferItemResult]:
+        """Apply many transfers in one DB transaction.
+
+        Balances are loaded once and checked in memory in request order. With
+        `atomic` any failed item aborts the whole batch; otherwise failed items
+        are skipped and the rest are committed.
+        """
+        try:
+            results = await self._apply_transfer_batch(transfers, atomic)
+            if any(result.success for result in results):
+                await self._commit()
+            else:
+                await self._rollback()
+        except HTTPException:
+            await self._rollback()
+            raise
+        except Exception as e:
+            await self._rollback()
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Transfer failed: {str(e)}")
+        return results
+
+    async def _apply_transfer_batch(self, transfers: list[BatchTransferItem], atomic: bool = True) -> list[BatchTransferItemResult]:
+        """Write the accepted transfers of a batch into the current DB transaction; see transfer_batch"""
+        user_ids = list({t.sender_user_id for t in transfers} | {t.recipient_user_id for t in transfers})
+        users = {}
+        for i in range(0, len(user_ids), IN_CLAUSE_CHUNK):
+            result = await self.db.execute(
+                select(User.id, User.username, User.balance)
+                .where(User.id.in_(user_ids[i:i + IN_CLAUSE_CHUNK]))
+            )
+            users.update({row.id: row for row in result})
+        balances = {user_id: user.balance for user_id, user in users.items()}
+
+        results = [BatchTransferItemResult(index=index, success=False) for index in range(len(transfers))]
+        accepted = []
+        for index, item in enumerate(transfers):
+            error = self._check_batch_transfer(item, users, balances)
+            if error is None:
+                try:
+                    self._check_velocity(item.sender_user_id, TransactionType.TRANSFER_OUT, item.amount)
+                except HTTPException as e:
+                    error = e.detail
+            if error:
+                results[index].error = error
+                if atomic:
+                    break
+                continue
+            balances[item.sender_user_id] -= item.amount
+            balances[item.recipient_user_id] += item.amount
+            results[index].new_balance = balances[item.sender_user_id]
+            accepted.append(index)
+
+        if atomic and len(accepted) < len(transfers):
+            for result in results:
+                result.new_balance = None
+                if result.error is None:
+                    result.error = "Not applied: batch aborted"
+            return results
+        if not accepted:
+            return results
+
+        deltas = defaultdict(float)
+        rows = []
+        for index in accepted:
+            item = transfers[index]
+            sender, recipient = users[item.sender_user_id], users[item.recipient_user_id]
+            deltas[sender.id] -= item.amount
+            deltas[recipient.id] += item.amount
+            rows.append(self._ledger_row(
+                sender.id, item.amount, TransactionType.TRANSFER_OUT,
+                f"Transfer to {recipient.username}: {item.description}",
+                recipient_user_id=recipient.id
+            ))
+            rows.append(self._ledger_row(
+                recipient.id, item.amount, TransactionType.TRANSFER_IN,
+                f"Transfer from {sender.username}: {item.description}",
+                recipient_user_id=sender.id
+            ))
+        transactions = await self._insert_ledger(rows)
+        for index, out_leg, in_leg in zip(accepted, transactions[0::2], transactions[1::2]):
+            out_leg.reference_transaction_id = in_leg.id
+            in_leg.reference_transaction_id = out_leg.id
+            results[index].transaction_id = out_leg.id
+            results[index].success = True
+        await self.db.flush()
+
+        await self._apply_balance_deltas(deltas)
+        return results
+
+    @staticmethod
+    def _check_batch_transfer(item: BatchTransferItem, users: dict, balances: dict[int, float]) -> Optional[str]:
+        if item.sender_user_id == item.recipient_user_id:
+            return "Cannot transfer to yourself"
+        if item.sender_user_id not in users:
+            return "Sender user not found"
+        if item.recipient_user_id not in users:
+            return "Recipient user not found"
+        if balances[item.sender_user_id] < item.amount:
+            return "Insufficient balance"
+        return None
+
+    async def _apply_balance_deltas(self, deltas: dict[int, float]):
+        """Apply net balance changes, one CASE UPDATE per chunk of users"""
+        user_ids = list(deltas)
+        for i in range(0, len(user_ids), IN_CLAUSE_CHUNK):
+            chunk = {user_id: deltas[user_id] for user_id in user_ids[i:i + IN_CLAUSE_CHUNK]}
+            result = await self.db.execute(
+                update(User)
+                .where(User.id.in_(chunk))
+                .values(balance=User.balance + case(chunk, value=User.id))
+                .returning(User.id, User.balance, User.updated_at)
+                .execution_options(synchronize_session=False)
+            )
+            for row in result:
+                # Balances were checked against a snapshot; a concurrent writer may have moved them since
+                if row.balance < -BALANCE_EPSILON:
+                    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Balances changed during batch, retry")
+                self._balance_changed(row.id, row.balance, row.updated_at)
+
+    # The _apply_* methods write an operation into the current DB transaction
+    # without committing. If they raise, the caller must roll back.
+
+    async def _apply_credit(self, user_id: int, amount: float, description: str) -> MoneyOperationResult:
+        new_balance = await self._credit_balance(user_id, amount)
+        [transaction] = await self._insert_ledger([
+            self._ledger_row(user_id, amount, TransactionType.CREDIT, description)
+        ])
+        return MoneyOperationResult(transaction, new_balance)
+
+    async def _apply_withdraw(self, user_id: int, amount: float, description: str) -> MoneyOperationResult:
+        self._check_velocity(user_id, TransactionType.DEBIT, amount)
+        new_balance = await self._debit_balance(user_id, amount)
+        [transaction] = await self._insert_ledger([
+            self._ledger_row(user_id, amount, TransactionType.DEBIT, description)
+        ])
+        return MoneyOperationResult(transaction, new_balance)
+
+    async def _apply_transfer_leg(
+        self,
+        user_id: int,
+        counterparty_id: int,
+        amount: float,
+        transaction_type: TransactionType,
+        description: str,
+        reference_transaction_id: Optional[int] = None
+    ) -> MoneyOperationResult:
+        """One side of a transfer whose other side lives on another shard"""
+        if transaction_type == TransactionType.TRANSFER_OUT:
+            self._check_velocity(user_id, transaction_type, amount)
+            new_balance = await self._debit_balance(user_id, amount, not_found="Sender user not found")
         else:
-            await self.db.rollback()
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Transaction failed")
-        
-        return transaction
+            new_balance = await self._credit_balance(user_id, amount, not_found="Recipient user not found")
+        [transaction] = await self._insert_ledger([
+            self._ledger_row(
+                user_id, amount, transaction_type, description,
+                recipient_user_id=counterparty_id,
+                reference_transaction_id=reference_transaction_id
+            )
+        ])
+        return MoneyOperationResult(transaction, new_balance)
 
-    async def withdraw(self, user_id: int, amount: float, description: str = "Withdraw transaction"):
-        user = await self.get_user_by_id(user_id)
-        if not user:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-        
-        if user.balance < amount:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient balance")
-        
-        transaction = await self.create_transaction(
-            user_id=user.id,
-            amount=amount,
-            transaction_type=TransactionType.DEBIT,
-            description=description
+    async def _credit_balance(self, user_id: int, amount: float, not_found: str = "User not found") -> float:
+        result = await self.db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(balance=User.balance + amount)
+            .returning(User.balance, User.updated_at)
+            .execution_options(synchronize_session=False)
         )
-        
-        if transaction:
-            user.balance -= amount
-            await self.db.commit()
-            await self.db.refresh(transaction)
-            await self.db.refresh(user)
-        else:
-            await self.db.rollback()
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Transaction failed")
-        
-        return transaction
+        row = result.one_or_none()
+        if row is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=not_found)
+        self._balance_changed(user_id, row.balance, row.updated_at)
+        return row.balance
 
-    async def transfer(self, from_user_id: int, to_user_id: int, amount: float, description: str = "Transfer"):
+    async def _debit_balance(self, user_id: int, amount: float, not_found: str = "User not found") -> float:
+        # The balance check and the debit are one statement, so concurrent
+        # withdrawals cannot both pass the check
+        result = await self.db.execute(
+            update(User)
+            .where(User.id == user_id, User.balance >= amount)
+            .values(balance=User.balance - amount)
+            .returning(User.balance, User.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        row = result.one_or_none()
+        if row is None:
+            if not await self._user_exists(user_id):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=not_found)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient balance")
+        self._balance_changed(user_id, row.balance, row.updated_at)
+        return row.balance
+
+    async def _apply_transfer(self, from_user_id: int, to_user_id: int, amount: float, description: str) -> MoneyOperationResult:
         if from_user_id == to_user_id:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot transfer to yourself")
-        
-        from_user = await self.get_user_by_id(from_user_id)
-        to_user = await self.get_user_by_id(to_user_id)
-        
-        if not from_user:
+
+        self._check_velocity(from_user_id, TransactionType.TRANSFER_OUT, amount)
+        # Debit the sender (only if funds suffice) and credit the recipient in one statement
+        result = await self.db.execute(
+            update(User)
+            .where(
+                User.id.in_([from_user_id, to_user_id]),
+                or_(User.id != from_user_id, User.balance >= amount)
+            )
+            .values(balance=User.balance + case((User.id == from_user_id, -amount), else_=amount))
+            .returning(User.id, User.username, User.balance, User.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        users = {row.id: row for row in result}
+        for row in users.values():
+            self._balance_changed(row.id, row.balance, row.updated_at)
+        if from_user_id not in users and not await self._user_exists(from_user_id):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sender user not found")
-        if not to_user:
+        if to_user_id not in users:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Recipient user not found")
-        
-        if from_user.balance < amount:
+        if from_user_id not in users:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient balance")
 
-        try:
-            # Create outgoing transaction for sender
-            from_user_transaction = await self.create_transaction(
-                user_id=from_user.id,
-                recipient_user_id=to_user.id,
-                amount=amount,
-                transaction_type=TransactionType.TRANSFER_OUT,
-                description=f"Transfer to {to_user.username}: {description}"
-            )
-            
-            # Create incoming transaction for recipient
-            to_user_transaction = await self.create_transaction(
-                user_id=to_user.id,
-                recipient_user_id=from_user.id,
-                amount=amount,
-                transaction_type=TransactionType.TRANSFER_IN,
-                description=f"Transfer from {from_user.username}: {description}",
-                reference_transaction_id=from_user_transaction.id
-            )
+        from_user, to_user = users[from_user_id], users[to_user_id]
+        from_user_transaction, to_user_transaction = await self._insert_ledger([
+            self._ledger_row(
+                from_user.id, amount, TransactionType.TRANSFER_OUT,
+                f"Transfer to {to_user.username}: {description}",
+                recipient_user_id=to_user.id
+            ),
+            self._ledger_row(
+                to_user.id, amount, TransactionType.TRANSFER_IN,
+                f"Transfer from {from_user.username}: {description}",
+                recipient_user_id=from_user.id
+            ),
+        ])
 
-            # Update reference in from_user_transaction
-            from_user_transaction.reference_transaction_id = to_user_transaction.id
-
-            # Update balances
-            from_user.balance -= amount
-            to_user.balance += amount
-            
-            await self.db.commit()
-            await self.db.refresh(from_user_transaction)
-            await self.db.refresh(to_user_transaction)
-            await self.db.refresh(from_user)
-            await self.db.refresh(to_user)
-            
-            return from_user_transaction
-            
-        except Exception as e:
-            await self.db.rollback()
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Transfer failed: {str(e)}")
+        # Link both legs; flushed as a single executemany UPDATE
+        from_user_transaction.reference_transaction_id = to_user_transaction.id
+        to_user_transaction.reference_transaction_id = from_user_transaction.id
+        await self.db.flush()
+
+        return MoneyOperationResult(from_user_transaction, from_user.balance)
+
+    async def _user_exists(self, user_id: int) -> bool:
+        result = await self.db.execute(select(User.id).filter(User.id == user_id))
+        return result.scalar_one_or_none() is not None
 
     async def create_transaction(
         self,
@@ -135,15 +435,68 @@ class TransactionServices:
         recipient_user_id: Optional[int] = None,
         reference_transaction_id: Optional[int] = None
     ) -> Transaction:
-        transaction = Transaction(
-            user_id=user_id,
-            amount=amount,
-            transaction_type=transaction_type.value,
-            description=description,
-            recipient_user_id=recipient_user_id,
-            reference_transaction_id=reference_transaction_id
+        [transaction] = await self._insert_ledger([
+            self._ledger_row(
+                user_id, amount, transaction_type, description,
+                recipient_user_id=recipient_user_id,
+                reference_transaction_id=reference_transaction_id
+            )
+        ])
+        return transaction
+
+    @staticmethod
+    def _ledger_row(
+        user_id: int,
+        amount: float,
+        transaction_type: TransactionType,
+        description: str,
+        recipient_user_id: Optional[int] = None,
+        reference_transaction_id: Optional[int] = None
+    ) -> dict:
+        return {
+            "user_id": user_id,
+            "amount": amount,
+            "transaction_type": transaction_type.value,
+            "description": description,
+            "recipient_user_id": recipient_user_id,
+            "reference_transaction_id": reference_transaction_id,
+        }
+
+    async def _insert_ledger(self, rows: list[dict]) -> list[Transaction]:
+        """Insert ledger rows in one bulk INSERT ... RETURNING, without committing"""
+        if SHARDED:
+            # Every row of one write transaction belongs to users of the same shard
+            ids = await allocate_ids(self.db, Transaction.__table__, len(rows), shard_index(rows[0]["user_id"]))
+            rows = [{**row, "id": transaction_id} for row, transaction_id in zip(rows, ids)]
+        result = await self.db.scalars(
+            insert(Transaction).returning(Transaction, sort_by_parameter_order=True),
+            rows
         )
-        
-        self.db.add(transaction)
-        await self.db.flush()  # Get the ID without committing
-        return transaction
\ No newline at end of file
+        transactions = result.all()
+        self._after_commit.append(partial(publish_transactions, transactions))
+        await self._bump_transaction_counts(Counter(row["user_id"] for row in rows))
+        await bump_daily_rollups(self.db, transactions)
+        return transactions
+
+    async def _bump_transaction_counts(self, counts: dict[int, int]):
+        """Add newly inserted ledger rows to the per-user counters"""
+        user_ids = list(counts)
+        for i in range(0, len(user_ids), IN_CLAUSE_CHUNK):
+            chunk = {user_id: counts[user_id] for user_id in user_ids[i:i + IN_CLAUSE_CHUNK]}
+            result = await self.db.execute(
+                update(UserTransactionCount)
+                .where(UserTransactionCount.user_id.in_(chunk))
+                .values(count=UserTransactionCount.count + case(chunk, value=UserTransactionCount.user_id))
+                .returning(UserTransactionCount.user_id)
+                .execution_options(synchronize_session=False)
+            )
+            for user_id in set(chunk) - set(result.scalars()):
+                # First write since counters were introduced: seed from the ledger,
+                # which already includes the rows inserted in this transaction
+                await self.db.execute(
+                    insert(UserTransactionCount).from_select(
+                        ["user_id", "count"],
+                        select(literal(user_id), func.count(Transaction.id))
+                        .where(Transaction.user_id == user_id)
+                    )
+                )
@@ -0,0 +1,45 @@
+from Models.Model import User
+from Services.lruCache import LRUCache
+from Schemas.schemas import UserResponse
+from datetime import datetime
+import os
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "50000"))
+# Bounds staleness from writes made by other worker processes
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+
+# user_id -> dict of UserResponse fields
+user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+# user_id -> balance and updated_at of the last balance write committed while
+# the user was not cached; a read that started before it must not cache its older row
+_uncached_writes = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+_FIELDS = list(UserResponse.model_fields)
+
+def _is_newer(candidate: dict, snapshot: dict) -> bool:
+    return candidate["updated_at"] is not None and (
+        snapshot["updated_at"] is None or candidate["updated_at"] > snapshot["updated_at"]
+    )
+
+def cache_user(user: User) -> dict:
+    """Store a snapshot of a user row and return it.
+
+    The row may come from a read snapshot taken before a balance write that
+    committed meanwhile; the newer balance is kept, so the cache never goes
+    back to an older one.
+    """
+    snapshot = {field: getattr(user, field) for field in _FIELDS}
+    for newer in (user_cache.peek(user.id), _uncached_writes.pop(user.id)):
+        if newer is not None and _is_newer(newer, snapshot):
+            snapshot.update(balance=newer["balance"], updated_at=newer["updated_at"])
+    user_cache.set(user.id, snapshot)
+    return snapshot
+
+def cache_balance(user_id: int, balance: float, updated_at: datetime):
+    """Write a committed balance through to the cached user, or remember it for the next cache_user"""
+    write = {"balance": balance, "updated_at": updated_at}
+    snapshot = user_cache.peek(user_id)
+    if snapshot is None:
+        _uncached_writes.set(user_id, write)
+    elif _is_newer(write, snapshot):
+        user_cache.set(user_id, {**snapshot, **write})
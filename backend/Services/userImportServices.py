@@ -0,0 +1,246 @@
+"""Bulk user import from a streamed NDJSON or CSV upload.
+
+Rows are read incrementally and handled IMPORT_CHUNK_ROWS at a time: each
+row is validated with UserCreate, checked against the rest of the upload
+and, with batched IN queries, against the users table on every shard. The
+surviving passwords are hashed across the whole process pool and the users
+inserted with one executemany per home shard. A bad row only fails itself;
+the report lists every failure by row number.
+"""
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
+from Models.Model import User
+from Schemas.schemas import UserCreate, ImportFormat, UserImportReport, UserImportRowError
+from Services.passwordServices import hash_passwords
+from db.shards import SHARDED, Shard, shard_for_email, allocate_ids, on_every_shard
+from datetime import datetime
+from typing import AsyncIterator, Optional
+import codecs
+import csv
+import json
+import os
+import time
+
+# Rows validated, checked, hashed and inserted together
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "1000"))
+# Failures listed in a report; any more are only counted
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+# Values per IN (...) list, well under SQLite's bound-parameter limit
+IMPORT_IN_CLAUSE_SIZE = 500
+
+CSV_COLUMNS = ("username", "email", "phone_number", "password")
+
+# (row number, parsed record, parse error)
+ImportRecord = tuple[int, Optional[dict], Optional[str]]
+
+async def read_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a UTF-8 byte stream into lines without holding more than one chunk"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+async def parse_ndjson(lines: AsyncIterator[str]) -> AsyncIterator[ImportRecord]:
+    row = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield row, None, "Invalid JSON"
+            continue
+        if isinstance(record, dict):
+            yield row, record, None
+        else:
+            yield row, None, "Expected a JSON object"
+
+async def parse_csv(lines: AsyncIterator[str]) -> AsyncIterator[ImportRecord]:
+    """Rows of a CSV with a header naming at least the UserCreate columns"""
+    header = None
+    record = ""
+    row = 0
+    async for line in lines:
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            # A quoted field carries on to the next line
+            continue
+        fields = next(csv.reader([record]), [])
+        record = ""
+        if not any(field.strip() for field in fields):
+            continue
+        if header is None:
+            header = [field.strip() for field in fields]
+            missing = [column for column in CSV_COLUMNS if column not in header]
+            if missing:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"CSV header is missing columns: {', '.join(missing)}"
+                )
+            continue
+        row += 1
+        if len(fields) != len(header):
+            yield row, None, f"Expected {len(header)} columns, got {len(fields)}"
+        else:
+            yield row, dict(zip(header, fields)), None
+    if record:
+        yield row + 1, None, "Unterminated quoted field"
+
+def parse_upload(chunks: AsyncIterator[bytes], format: ImportFormat) -> AsyncIterator[ImportRecord]:
+    lines = read_lines(chunks)
+    return parse_csv(lines) if format == ImportFormat.CSV else parse_ndjson(lines)
+
+def describe_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc']) or 'row'}: {detail['msg']}"
+        for detail in error.errors()
+    )
+
+async def taken_values(usernames: list[str], emails: list[str]) -> tuple[set[str], set[str]]:
+    """Which of these usernames and emails already belong to a user, on any shard"""
+    async def on_shard(shard: Shard):
+        taken_usernames, taken_emails = set(), set()
+        async with shard.read_session_factory() as db:
+            for column, values, taken in ((User.username, usernames, taken_usernames), (User.email, emails, taken_emails)):
+                for i in range(0, len(values), IMPORT_IN_CLAUSE_SIZE):
+                    taken.update((await db.execute(
+                        select(column).filter(column.in_(values[i:i + IMPORT_IN_CLAUSE_SIZE]))
+                    )).scalars())
+        return taken_usernames, taken_emails
+
+    results = await on_every_shard(on_shard)
+    return set().union(*(u for u, _ in results)), set().union(*(e for _, e in results))
+
+class UserImporter:
+    def __init__(self, chunk_rows: int = IMPORT_CHUNK_ROWS, max_errors: int = IMPORT_MAX_ERRORS):
+        self.chunk_rows = chunk_rows
+        self.max_errors = max_errors
+        self.report = UserImportReport()
+        # Everything accepted so far, to catch duplicates across chunks of the same upload
+        self._usernames: set[str] = set()
+        self._emails: set[str] = set()
+
+    def _fail(self, row: int, error: str, record: Optional[dict] = None):
+        self.report.failed += 1
+        if len(self.report.errors) >= self.max_errors:
+            self.report.errors_truncated = True
+            return
+        record = record or {}
+        username, email = record.get("username"), record.get("email")
+        self.report.errors.append(UserImportRowError(
+            row=row,
+            error=error,
+            username=username if isinstance(username, str) else None,
+            email=email if isinstance(email, str) else None
+        ))
+
+    async def run(self, records: AsyncIterator[ImportRecord]) -> UserImportReport:
+        started = time.perf_counter()
+        chunk: list[tuple[int, UserCreate]] = []
+        async for row, record, error in records:
+            self.report.received += 1
+            if error is not None:
+                self._fail(row, error)
+                continue
+            try:
+                chunk.append((row, UserCreate.model_validate(record)))
+            except ValidationError as e:
+                self._fail(row, describe_validation_error(e), record)
+                continue
+            if len(chunk) >= self.chunk_rows:
+                await self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            await self.import_chunk(chunk)
+        self.report.errors.sort(key=lambda e: e.row)
+        self.report.elapsed = time.perf_counter() - started
+        return self.report
+
+    async def import_chunk(self, chunk: list[tuple[int, UserCreate]]):
+        unique = []
+        for row, user in chunk:
+            if user.username in self._usernames:
+                self._fail(row, "Duplicate username in import", user.model_dump(exclude={"password"}))
+            elif user.email in self._emails:
+                self._fail(row, "Duplicate email in import", user.model_dump(exclude={"password"}))
+            else:
+                self._usernames.add(user.username)
+                self._emails.add(user.email)
+                unique.append((row, user))
+
+        fresh = await self._drop_taken(unique)
+        if not fresh:
+            return
+        hashed = await hash_passwords([user.password for _, user in fresh])
+
+        by_shard: dict[int, tuple[Shard, list]] = {}
+        for (row, user), password in zip(fresh, hashed):
+            home = shard_for_email(user.email)
+            by_shard.setdefault(home.index, (home, []))[1].append((row, user, password))
+        for home, users in by_shard.values():
+            await self._insert(home, users)
+
+    async def _drop_taken(self, users: list[tuple]) -> list[tuple]:
+        """Fail the rows whose username or email is already in the table; returns the rest"""
+        if not users:
+            return []
+        taken_usernames, taken_emails = await taken_values(
+            [entry[1].username for entry in users], [entry[1].email for entry in users]
+        )
+        if not taken_usernames and not taken_emails:
+            return users
+        rest = []
+        for entry in users:
+            row, user = entry[0], entry[1]
+            if user.username in taken_usernames:
+                self._fail(row, "Username already exists", user.model_dump(exclude={"password"}))
+            elif user.email in taken_emails:
+                self._fail(row, "Email already exists", user.model_dump(exclude={"password"}))
+            else:
+                rest.append(entry)
+        return rest
+
+    async def _insert(self, home: Shard, users: list[tuple[int, UserCreate, str]]):
+        for attempt in range(2):
+            now = datetime.now()
+            async with home.session_factory() as db:
+                ids = await allocate_ids(db, User.__table__, len(users), home.index) if SHARDED else None
+                values = [
+                    {
+                        "username": user.username,
+                        "email": user.email,
+                        "password": password,
+                        "phone_number": user.phone_number,
+                        "balance": 0.0,
+                        "created_at": now,
+                        "updated_at": now,
+                        **({"id": ids[i]} if ids else {})
+                    }
+                    for i, (_, user, password) in enumerate(users)
+                ]
+                try:
+                    await db.execute(insert(User), values)
+                    await db.commit()
+                    self.report.created += len(users)
+                    return
+                except IntegrityError:
+                    await db.rollback()
+            # Lost a race with signups committed since the check; drop those rows and go again
+            users = await self._drop_taken(users)
+            if not users:
+                return
+        for row, user, _ in users:
+            self._fail(row, "Username or email already exists", user.model_dump(exclude={"password"}))
+
+async def import_users(chunks: AsyncIterator[bytes], format: ImportFormat, **options) -> UserImportReport:
+    """Create users from a stream of NDJSON or CSV bytes and report per-row failures"""
+    return await UserImporter(**options).run(parse_upload(chunks, format))
@@ -0,0 +1,274 @@
+"""Per-user velocity limits on money leaving an account.
+
+VELOCITY_LIMITS lists one limit per transaction type as
+TYPE:max_count:max_amount:window_seconds, comma-separated, 0 meaning no cap:
+
+    VELOCITY_LIMITS=DEBIT:10:5000:3600,TRANSFER_OUT:20:10000:3600
+
+Counters live in memory: each limited (user, type) pair has a ring of
+VELOCITY_BUCKETS time buckets spanning the window, with running totals, so
+a check is a dict lookup and a little arithmetic. An operation reserves its
+count and amount when it is checked and gives them back if its DB
+transaction rolls back, so concurrent requests can't overshoot a limit
+between check and commit. The window slides a bucket at a time and a bucket
+counts for its whole width, which errs on the strict side by at most one
+bucket.
+
+A breach answers 429 with Retry-After, the time until enough of the window
+has slid out for the operation to fit. The one exception is a single
+operation above max_amount: it can never fit, however long the client
+waits, so it is refused with 400 and is neither counted nor retried.
+
+Counters are per worker process and are warmed from the recent ledger at
+startup. With N workers behind a load balancer a user can reach up to N
+times each limit, so run one worker where a limit must hold exactly.
+"""
+from fastapi import HTTPException, status
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from Models.Model import Transaction
+from Schemas.schemas import TransactionType
+from dataclasses import dataclass
+from array import array
+from datetime import datetime, timedelta
+from typing import Optional, NamedTuple
+import logging
+import math
+import os
+import time
+
+VELOCITY_LIMITS = os.getenv("VELOCITY_LIMITS", "")
+# Buckets per window; more buckets slide more smoothly and cost more memory per user
+VELOCITY_BUCKETS = int(os.getenv("VELOCITY_BUCKETS", "12"))
+
+# Only money going out can be limited; a refused credit would strand the other leg of a transfer
+LIMITABLE_TYPES = (TransactionType.DEBIT, TransactionType.TRANSFER_OUT)
+
+# Float slack when comparing amount totals
+AMOUNT_EPSILON = 1e-9
+
+logger = logging.getLogger("velocity")
+
+@dataclass(frozen=True)
+class VelocityLimit:
+    transaction_type: TransactionType
+    max_count: int
+    max_amount: float
+    window_seconds: float
+
+    def describe(self) -> str:
+        caps = []
+        if self.max_count:
+            caps.append(f"{self.max_count} {self.transaction_type.value.lower()} operations")
+        if self.max_amount:
+            caps.append(f"{self.max_amount:g} total")
+        return f"{' and '.join(caps)} per {self.window_seconds:g}s"
+
+def parse_velocity_limits(spec: str) -> dict[TransactionType, VelocityLimit]:
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            name, max_count, max_amount, window_seconds = entry.split(":")
+            limit = VelocityLimit(TransactionType(name.upper()), int(max_count), float(max_amount), float(window_seconds))
+        except ValueError:
+            raise ValueError(f"Invalid VELOCITY_LIMITS entry {entry!r}; expected TYPE:max_count:max_amount:window_seconds")
+        if limit.transaction_type not in LIMITABLE_TYPES:
+            raise ValueError(f"Velocity limits apply to {', '.join(t.value for t in LIMITABLE_TYPES)}, not {name}")
+        if limit.window_seconds <= 0:
+            raise ValueError(f"Invalid VELOCITY_LIMITS entry {entry!r}; the window must be positive")
+        limits[limit.transaction_type] = limit
+    return limits
+
+class Window:
+    """Ring of (count, amount) buckets for one user and limit, plus running totals"""
+    __slots__ = ("slots", "last", "count", "amount")
+
+    def __init__(self, buckets: int, bucket: int):
+        self.slots = array("d", bytes(16 * buckets))
+        self.last = bucket
+        self.count = 0
+        self.amount = 0.0
+
+class Reservation(NamedTuple):
+    key: tuple[int, TransactionType]
+    bucket: int
+    amount: float
+
+class VelocityLimiter:
+    def __init__(self, limits: dict[TransactionType, VelocityLimit], buckets: int = VELOCITY_BUCKETS):
+        self.limits = limits
+        self.buckets = buckets
+        self._windows: dict[tuple[int, TransactionType], Window] = {}
+        self._prune_at = 1024
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.limits)
+
+    def _bucket_width(self, limit: VelocityLimit) -> float:
+        return limit.window_seconds / self.buckets
+
+    def _advance(self, window: Window, bucket: int):
+        """Slide the window so `bucket` is its newest bucket, emptying the ones that fell out"""
+        if bucket <= window.last:
+            return
+        if bucket - window.last >= self.buckets:
+            window.slots = array("d", bytes(16 * self.buckets))
+            window.count, window.amount = 0, 0.0
+        else:
+            slots = window.slots
+            for stale in range(window.last + 1, bucket + 1):
+                slot = (stale % self.buckets) * 2
+                window.count -= slots[slot]
+                window.amount -= slots[slot + 1]
+                slots[slot] = slots[slot + 1] = 0.0
+        window.last = bucket
+
+    def _window(self, key: tuple[int, TransactionType], bucket: int) -> Window:
+        window = self._windows.get(key)
+        if window is None:
+            if len(self._windows) >= self._prune_at:
+                self.prune()
+                self._prune_at = max(1024, 2 * len(self._windows))
+            window = self._windows[key] = Window(self.buckets, bucket)
+        else:
+            self._advance(window, bucket)
+        return window
+
+    def acquire(self, user_id: int, transaction_type: TransactionType, amount: float, now: Optional[float] = None) -> Optional[Reservation]:
+        """Count an operation against the user's limit, or raise 429 with Retry-After if it would exceed it"""
+        limit = self.limits.get(transaction_type)
+        if limit is None:
+            return None
+        if limit.max_amount and amount > limit.max_amount + AMOUNT_EPSILON:
+            # Not a 429: no Retry-After would ever let this amount through
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Amount is larger than the whole velocity limit of {limit.describe()}"
+            )
+        now = time.time() if now is None else now
+        width = self._bucket_width(limit)
+        bucket = int(now // width)
+        key = (user_id, transaction_type)
+        window = self._window(key, bucket)
+
+        if self._exceeds(limit, window.count + 1, window.amount + amount):
+            self.rejected += 1
+            retry_after = self._retry_after(limit, window, amount, now, width)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Velocity limit exceeded: {limit.describe()}",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+        slot = (bucket % self.buckets) * 2
+        window.slots[slot] += 1
+        window.slots[slot + 1] += amount
+        window.count += 1
+        window.amount += amount
+        return Reservation(key, bucket, amount)
+
+    @staticmethod
+    def _exceeds(limit: VelocityLimit, count: float, amount: float) -> bool:
+        return bool(
+            (limit.max_count and count > limit.max_count)
+            or (limit.max_amount and amount > limit.max_amount + AMOUNT_EPSILON)
+        )
+
+    def _retry_after(self, limit: VelocityLimit, window: Window, amount: float, now: float, width: float) -> float:
+        """Seconds until enough of the oldest buckets have slid out for this operation to fit"""
+        count, total = window.count + 1, window.amount + amount
+        for bucket in range(window.last - self.buckets + 1, window.last + 1):
+            slot = (bucket % self.buckets) * 2
+            count -= window.slots[slot]
+            total -= window.slots[slot + 1]
+            if not self._exceeds(limit, count, total):
+                return (bucket + self.buckets) * width - now
+        return limit.window_seconds
+
+    def release(self, reservation: Reservation):
+        """Give back a reservation whose DB transaction rolled back"""
+        window = self._windows.get(reservation.key)
+        if window is None or reservation.bucket <= window.last - self.buckets:
+            return
+        slot = (reservation.bucket % self.buckets) * 2
+        window.slots[slot] -= 1
+        window.slots[slot + 1] -= reservation.amount
+        window.count -= 1
+        window.amount -= reservation.amount
+
+    def record(self, user_id: int, transaction_type: TransactionType, amount: float, at: float):
+        """Count a committed operation from the ledger, without checking the limit"""
+        limit = self.limits.get(transaction_type)
+        if limit is None:
+            return
+        bucket = int(at // self._bucket_width(limit))
+        window = self._window((user_id, transaction_type), bucket)
+        if bucket <= window.last - self.buckets:
+            return
+        slot = (bucket % self.buckets) * 2
+        window.slots[slot] += 1
+        window.slots[slot + 1] += amount
+        window.count += 1
+        window.amount += amount
+
+    def prune(self, now: Optional[float] = None):
+        """Drop the windows of users with nothing left in them"""
+        now = time.time() if now is None else now
+        for key, window in list(self._windows.items()):
+            if int(now // self._bucket_width(self.limits[key[1]])) - window.last >= self.buckets:
+                del self._windows[key]
+
+    async def warm(self, session_factories: list[async_sessionmaker]) -> int:
+        """Rebuild the counters from the ledger rows still inside a window; returns how many were counted"""
+        self._windows.clear()
+        if not self.enabled:
+            return 0
+        cutoff = datetime.now() - timedelta(seconds=max(limit.window_seconds for limit in self.limits.values()))
+        counted = 0
+        for session_factory in session_factories:
+            async with session_factory() as db:
+                after_id = await ledger_id_before(db, cutoff)
+                rows = await db.execute(
+                    select(Transaction.user_id, Transaction.transaction_type, Transaction.amount, Transaction.created_at)
+                    .filter(
+                        Transaction.id > after_id,
+                        Transaction.transaction_type.in_([t.value for t in self.limits])
+                    )
+                    .order_by(Transaction.id)
+                )
+                for user_id, transaction_type, amount, created_at in rows:
+                    self.record(user_id, TransactionType(transaction_type), amount, created_at.timestamp())
+                    counted += 1
+        logger.info("Warmed velocity counters from %d recent ledger rows", counted)
+        return counted
+
+    def stats(self) -> dict:
+        return {"tracked": len(self._windows), "rejected": self.rejected}
+
+async def ledger_id_before(db, cutoff: datetime) -> int:
+    """Highest ledger id created before `cutoff`, by bisecting the id index.
+
+    created_at grows with id, so this finds the start of the recent ledger
+    without an index on created_at.
+    """
+    low, high = (await db.execute(select(func.min(Transaction.id), func.max(Transaction.id)))).one()
+    if low is None:
+        return 0
+    boundary = low - 1
+    while low <= high:
+        middle = (low + high) // 2
+        row = (await db.execute(
+            select(Transaction.id, Transaction.created_at)
+            .filter(Transaction.id >= middle)
+            .order_by(Transaction.id)
+            .limit(1)
+        )).first()
+        if row is not None and row.created_at < cutoff:
+            boundary = row.id
+            low = row.id + 1
+        else:
+            high = middle - 1
+    return boundary
+
+velocity_limiter = VelocityLimiter(parse_velocity_limits(VELOCITY_LIMITS))
@@ -0,0 +1,132 @@
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from Services.trasnactionServices import TransactionServices, MoneyOperationResult
+from Services.idempotencyServices import current_request, save_response
+from db.db import AsyncSessionLocal
+from db.shards import shards
+from typing import Optional
+import asyncio
+import os
+
+WRITE_QUEUE_ENABLED = os.getenv("WRITE_QUEUE_ENABLED", "0") == "1"
+# Most operations applied per commit
+WRITE_QUEUE_MAX_BATCH = int(os.getenv("WRITE_QUEUE_MAX_BATCH", "200"))
+# How long the writer waits for more operations before committing a batch
+WRITE_QUEUE_MAX_WAIT_MS = float(os.getenv("WRITE_QUEUE_MAX_WAIT_MS", "2"))
+
+class WriteScheduler:
+    """Group-commit queue for money operations.
+
+    Requests enqueue credit/withdraw/transfer operations; a single writer task
+    applies a batch of them inside one DB transaction, each under its own
+    SAVEPOINT, commits once and resolves every caller with its own result or
+    error. Exposes the same credit/withdraw/transfer API as TransactionServices.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        max_batch: int = WRITE_QUEUE_MAX_BATCH,
+        max_wait_ms: float = WRITE_QUEUE_MAX_WAIT_MS
+    ):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._writer is not None and not self._writer.done()
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._writer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Apply everything already queued, then stop the writer"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._writer
+        self._writer = None
+
+    async def credit(self, user_id: int, amount: float, description: str = "Credit transaction") -> MoneyOperationResult:
+        return await self._submit("_apply_credit", user_id, amount, description)
+
+    async def withdraw(self, user_id: int, amount: float, description: str = "Withdraw transaction") -> MoneyOperationResult:
+        return await self._submit("_apply_withdraw", user_id, amount, description)
+
+    async def transfer(self, from_user_id: int, to_user_id: int, amount: float, description: str = "Transfer") -> MoneyOperationResult:
+        return await self._submit("_apply_transfer", from_user_id, to_user_id, amount, description)
+
+    async def _submit(self, method: str, *args) -> MoneyOperationResult:
+        if not self.running:
+            raise RuntimeError("Write scheduler is not running")
+        future = asyncio.get_running_loop().create_future()
+        # The writer task runs outside the caller's context, so a keyed request travels with the operation
+        await self._queue.put((method, args, future, current_request.get()))
+        return await future
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            operation = await self._queue.get()
+            if operation is None:
+                break
+            batch = [operation]
+            stopping = self._drain(batch)
+            if not stopping and len(batch) < self.max_batch and self.max_wait > 0:
+                await asyncio.sleep(self.max_wait)
+                stopping = self._drain(batch)
+            await self._apply_batch(batch)
+
+    def _drain(self, batch: list) -> bool:
+        """Move queued operations into the batch; returns True once the stop marker is seen"""
+        while len(batch) < self.max_batch:
+            try:
+                operation = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return False
+            if operation is None:
+                return True
+            batch.append(operation)
+        return False
+
+    async def _apply_batch(self, batch: list):
+        outcomes = []
+        async with self.session_factory() as db:
+            try:
+                for method, args, future, request in batch:
+                    if future.cancelled():
+                        continue
+                    # One service per operation so a failed operation's after-commit effects are dropped with it
+                    transaction_service = TransactionServices(db)
+                    try:
+                        async with db.begin_nested():
+                            result = await getattr(transaction_service, method)(*args)
+                            await save_response(db, result, request)
+                        outcomes.append((future, result, None, transaction_service))
+                    except Exception as e:
+                        transaction_service._run_after_rollback()
+                        outcomes.append((future, None, e, None))
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                for _, _, _, transaction_service in outcomes:
+                    if transaction_service is not None:
+                        transaction_service._run_after_rollback()
+                outcomes = [(future, None, e, None) for _, _, future, _ in batch]
+
+        for future, result, error, transaction_service in outcomes:
+            if transaction_service is not None:
+                transaction_service._run_after_commit()
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+write_scheduler = WriteScheduler()
+# One writer per shard; shard 0's is write_scheduler
+write_schedulers = [write_scheduler] + [WriteScheduler(shard.session_factory) for shard in shards[1:]]
@@ -0,0 +1,64 @@
+"""Compare transfers/s of POST /transfers/ one at a time against POST /transfers/batch.
+
+    python -m benchmarks.batch_transfers --transfers 2000 --users 200
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.common import use_scratch_database, create_schema, seed_users, asgi_client
+
+use_scratch_database()
+
+
+async def run_single(client, transfers):
+    started = time.perf_counter()
+    for sender, recipient, amount in transfers:
+        response = await client.post(
+            "/transfers/",
+            params={"sender_user_id": sender},
+            json={"recipient_user_id": recipient, "amount": amount}
+        )
+        response.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def run_batch(client, transfers, batch_size):
+    started = time.perf_counter()
+    for i in range(0, len(transfers), batch_size):
+        response = await client.post("/transfers/batch", json={
+            "mode": "all_or_nothing",
+            "transfers": [
+                {"sender_user_id": sender, "recipient_user_id": recipient, "amount": amount}
+                for sender, recipient, amount in transfers[i:i + batch_size]
+            ],
+        })
+        response.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def main(args):
+    await create_schema()
+    user_ids = await seed_users(args.users, balance=1_000_000.0)
+    rng = random.Random(args.seed)
+
+    def make_transfers():
+        return [(*rng.sample(user_ids, 2), round(rng.uniform(1, 100), 2)) for _ in range(args.transfers)]
+
+    async with asgi_client() as client:
+        single = await run_single(client, make_transfers())
+        batch = await run_batch(client, make_transfers(), args.batch_size)
+
+    print(f"single : {args.transfers / single:10.1f} transfers/s ({single:.2f}s)")
+    print(f"batch  : {args.transfers / batch:10.1f} transfers/s ({batch:.2f}s, batch size {args.batch_size})")
+    print(f"speedup: {single / batch:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transfers", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
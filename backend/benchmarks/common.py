@@ -0,0 +1,62 @@
+"""Shared setup for the benchmark scripts.
+
+Run benchmarks from the backend directory, e.g. `python -m benchmarks.batch_transfers`.
+Every run uses a throwaway SQLite file unless DATABASE_URL is already set.
+"""
+import os
+import tempfile
+
+
+def use_scratch_database() -> str:
+    """Point db.db at a temporary database; call before importing app modules"""
+    if "DATABASE_URL" not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(prefix="wallet-bench-"), "bench.db")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{path}"
+    return os.environ["DATABASE_URL"]
+
+
+async def create_schema():
+    from db.db import engine
+    from db.migrations import ensure_schema
+
+    await ensure_schema(engine)
+
+
+async def seed_users(count: int, balance: float) -> list[int]:
+    """Bulk insert `count` users with a starting balance and return their ids"""
+    from sqlalchemy import insert
+    from db.db import AsyncSessionLocal
+    from Models.Model import User
+
+    async with AsyncSessionLocal() as db:
+        result = await db.scalars(
+            insert(User).returning(User.id, sort_by_parameter_order=True),
+            [
+                {
+                    "username": f"bench{i}",
+                    "email": f"bench{i}@example.com",
+                    "password": "x",
+                    "phone_number": "+15550000000",
+                    "balance": balance,
+                }
+                for i in range(count)
+            ]
+        )
+        user_ids = result.all()
+        await db.commit()
+    return user_ids
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def asgi_client():
+    import httpx
+    from main import app
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
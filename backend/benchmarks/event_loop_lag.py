@@ -0,0 +1,78 @@
+"""Event-loop lag during a signup burst: bcrypt inline on the loop vs on the process pool.
+
+    python -m benchmarks.event_loop_lag --signups 32
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import use_scratch_database, create_schema, asgi_client, percentile
+
+use_scratch_database()
+
+from Services import passwordServices
+
+
+async def measure_lag(stop: asyncio.Event, interval: float = 0.005) -> list[float]:
+    """Sleep in a loop and record how late each wakeup is"""
+    lags = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+    return lags
+
+
+async def inline_hash(password: str) -> str:
+    # What create_user used to do: bcrypt on the event loop thread
+    return passwordServices._hash_password(password, passwordServices.BCRYPT_ROUNDS)
+
+
+async def burst(client, prefix: str, count: int) -> tuple[float, int]:
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(
+        client.post("/users/", json={
+            "username": f"{prefix}{i}",
+            "email": f"{prefix}{i}@example.com",
+            "phone_number": "+15550000000",
+            "password": "correct horse battery",
+        })
+        for i in range(count)
+    ), return_exceptions=True)
+    failed = sum(isinstance(r, Exception) or r.status_code != 201 for r in responses)
+    return time.perf_counter() - started, failed
+
+
+async def run(client, prefix: str, count: int):
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(measure_lag(stop))
+    elapsed, failed = await burst(client, prefix, count)
+    stop.set()
+    lags = await ticker
+    print(
+        f"{prefix:<8} {count / elapsed:7.1f} signups/s  loop lag "
+        f"p50 {percentile(lags, 50) * 1000:7.1f} ms  p99 {percentile(lags, 99) * 1000:7.1f} ms  "
+        f"max {max(lags) * 1000:7.1f} ms  failed {failed}"
+    )
+
+
+async def main(args):
+    await create_schema()
+    # Warm the pool so worker start-up is not counted
+    await passwordServices.hash_password("warmup")
+    async with asgi_client() as client:
+        original = passwordServices.hash_password
+        passwordServices.hash_password = inline_hash
+        import router.userRouter as user_router
+        user_router.hash_password = inline_hash
+        await run(client, "inline", args.signups)
+        user_router.hash_password = original
+        passwordServices.hash_password = original
+        await run(client, "pool", args.signups)
+    passwordServices.shutdown_password_executor()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--signups", type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
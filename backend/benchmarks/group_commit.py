@@ -0,0 +1,88 @@
+"""Committed ops/s and latency of money operations: one commit per request vs the group-commit queue.
+
+    python -m benchmarks.group_commit --ops 3000 --concurrency 100
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.common import use_scratch_database, create_schema, seed_users, percentile
+
+use_scratch_database()
+
+from db.db import AsyncSessionLocal
+from Services.trasnactionServices import TransactionServices
+from Services.writeScheduler import WriteScheduler
+
+
+def make_operations(user_ids, count, rng):
+    operations = []
+    for _ in range(count):
+        kind = rng.choice(("credit", "withdraw", "transfer"))
+        amount = round(rng.uniform(1, 50), 2)
+        if kind == "transfer":
+            operations.append(("transfer", (*rng.sample(user_ids, 2), amount)))
+        else:
+            operations.append((kind, (rng.choice(user_ids), amount)))
+    return operations
+
+
+async def direct(kind, args):
+    async with AsyncSessionLocal() as db:
+        return await getattr(TransactionServices(db), kind)(*args)
+
+
+async def run(operations, concurrency, execute):
+    latencies, errors = [], 0
+    pending = iter(operations)
+
+    async def worker():
+        nonlocal errors
+        for kind, args in pending:
+            started = time.perf_counter()
+            try:
+                await execute(kind, args)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return len(operations) - errors, errors, elapsed, latencies
+
+
+def report(name, committed, errors, elapsed, latencies):
+    print(
+        f"{name:<13} {committed / elapsed:9.1f} ops/s  errors {errors:5d}  "
+        f"p50 {percentile(latencies, 50) * 1000:8.1f} ms  p99 {percentile(latencies, 99) * 1000:8.1f} ms"
+    )
+
+
+async def main(args):
+    await create_schema()
+    user_ids = await seed_users(args.users, balance=1_000_000.0)
+    rng = random.Random(args.seed)
+
+    report("per-request", *await run(make_operations(user_ids, args.ops, rng), args.concurrency, direct))
+
+    scheduler = WriteScheduler(max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    await scheduler.start()
+
+    async def queued(kind, args):
+        return await getattr(scheduler, kind)(*args)
+
+    report("group-commit", *await run(make_operations(user_ids, args.ops, rng), args.concurrency, queued))
+    await scheduler.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=3000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--max-batch", type=int, default=200)
+    parser.add_argument("--max-wait-ms", type=float, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,275 @@
+"""Mixed-workload load test for the wallet API, in-process over ASGI or against a live server.
+
+    python -m benchmarks.load_test --duration 30 --concurrency 50
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --users 50
+    python -m benchmarks.load_test --compare benchmarks/results/before.json
+
+Reports throughput and p50/p95/p99 latency per route and writes the numbers
+to a JSON file so runs can be compared across changes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from benchmarks.common import use_scratch_database, percentile
+
+SCENARIOS = {
+    "signup": 1,
+    "credit": 15,
+    "withdraw": 10,
+    "transfer_hot": 20,
+    "transfer_cold": 10,
+    "history": 25,
+    "detail": 19,
+}
+
+
+class RouteStats:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = defaultdict(int)
+        self.errors = 0
+
+    def summary(self, elapsed: float) -> dict:
+        return {
+            "count": len(self.latencies),
+            "errors": self.errors,
+            "statuses": dict(self.statuses),
+            "rps": len(self.latencies) / elapsed if elapsed else 0.0,
+            "mean_ms": sum(self.latencies) / len(self.latencies) * 1000 if self.latencies else 0.0,
+            "p50_ms": percentile(self.latencies, 50) * 1000,
+            "p95_ms": percentile(self.latencies, 95) * 1000,
+            "p99_ms": percentile(self.latencies, 99) * 1000,
+        }
+
+
+class LoadTest:
+    def __init__(self, client, args):
+        self.client = client
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.stats = defaultdict(RouteStats)
+        self.user_ids: list[int] = []
+        self.hot_ids: list[int] = []
+        self.transaction_ids: list[int] = []
+        self.signups = 0
+
+    async def request(self, route: str, method: str, url: str, **kwargs):
+        stats = self.stats[route]
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except Exception:
+            stats.errors += 1
+            stats.latencies.append(time.perf_counter() - started)
+            return None
+        stats.latencies.append(time.perf_counter() - started)
+        stats.statuses[response.status_code] += 1
+        if response.status_code >= 500:
+            stats.errors += 1
+        return response
+
+    def remember_transaction(self, response):
+        if response is not None and response.status_code == 201:
+            self.transaction_ids.append(response.json()["transaction_id"])
+            if len(self.transaction_ids) > 10_000:
+                del self.transaction_ids[:5_000]
+
+    async def signup(self):
+        self.signups += 1
+        name = f"load{os.getpid()}x{self.signups}x{self.rng.randrange(10**9)}"
+        response = await self.request("POST /users/", "POST", "/users/", json={
+            "username": name,
+            "email": f"{name}@example.com",
+            "phone_number": "+15550000000",
+            "password": "load-test-password",
+        })
+        if response is not None and response.status_code == 201:
+            self.user_ids.append(response.json()["id"])
+
+    async def credit(self):
+        user_id = self.rng.choice(self.user_ids)
+        self.remember_transaction(await self.request(
+            "POST /users/{user_id}/add-money", "POST", f"/users/{user_id}/add-money",
+            json={"amount": round(self.rng.uniform(10, 500), 2)}
+        ))
+
+    async def withdraw(self):
+        user_id = self.rng.choice(self.user_ids)
+        self.remember_transaction(await self.request(
+            "POST /users/{user_id}/withdraw", "POST", f"/users/{user_id}/withdraw",
+            json={"amount": round(self.rng.uniform(1, 100), 2)}
+        ))
+
+    async def transfer(self, pool: list[int]):
+        sender, recipient = self.rng.sample(pool, 2)
+        self.remember_transaction(await self.request(
+            "POST /transfers/", "POST", "/transfers/",
+            params={"sender_user_id": sender},
+            json={"recipient_user_id": recipient, "amount": round(self.rng.uniform(1, 50), 2)}
+        ))
+
+    async def transfer_hot(self):
+        await self.transfer(self.hot_ids)
+
+    async def transfer_cold(self):
+        await self.transfer(self.user_ids)
+
+    async def history(self):
+        # Hot accounts have the long ledgers, so page through one of them
+        user_id = self.rng.choice(self.hot_ids)
+        response = await self.request(
+            "GET /transactions/{user_id}", "GET", f"/transactions/{user_id}", params={"limit": 20}
+        )
+        for _ in range(self.rng.randrange(3)):
+            if response is None or response.status_code != 200 or not response.json().get("next_cursor"):
+                break
+            response = await self.request(
+                "GET /transactions/{user_id}", "GET", f"/transactions/{user_id}",
+                params={"limit": 20, "cursor": response.json()["next_cursor"]}
+            )
+
+    async def detail(self):
+        if not self.transaction_ids:
+            return await self.history()
+        transaction_id = self.rng.choice(self.transaction_ids)
+        await self.request(
+            "GET /transactions/detail/{transaction_id}", "GET", f"/transactions/detail/{transaction_id}"
+        )
+
+    async def seed_over_api(self):
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def create(i):
+            async with semaphore:
+                await self.signup()
+
+        await asyncio.gather(*(create(i) for i in range(self.args.users)))
+
+    async def fund_accounts(self):
+        for user_id in self.user_ids:
+            await self.client.post(f"/users/{user_id}/add-money", json={"amount": 1_000_000})
+
+    async def run(self) -> float:
+        hot_count = max(2, int(len(self.user_ids) * self.args.hot_fraction))
+        self.hot_ids = self.user_ids[:hot_count]
+        names, weights = zip(*SCENARIOS.items())
+        deadline = time.perf_counter() + self.args.duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                await getattr(self, self.rng.choices(names, weights)[0])()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+        return time.perf_counter() - started
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(routes: dict, previous: dict = None):
+    print(f"{'route':<45} {'count':>7} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'err':>5}")
+    for route, summary in sorted(routes.items()):
+        line = (
+            f"{route:<45} {summary['count']:>7} {summary['rps']:>8.1f} {summary['p50_ms']:>8.1f} "
+            f"{summary['p95_ms']:>8.1f} {summary['p99_ms']:>8.1f} {summary['errors']:>5}"
+        )
+        if previous and route in previous:
+            before = previous[route]
+            if before["rps"]:
+                line += f"   rps {summary['rps'] / before['rps'] - 1:+.0%}"
+            if before["p99_ms"]:
+                line += f" p99 {summary['p99_ms'] / before['p99_ms'] - 1:+.0%}"
+        print(line)
+
+
+async def main(args):
+    import httpx
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+        lifespan = None
+    else:
+        use_scratch_database()
+        from main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+        lifespan = app.router.lifespan_context(app)
+
+    async with client:
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        try:
+            load_test = LoadTest(client, args)
+            if args.url:
+                await load_test.seed_over_api()
+            else:
+                from benchmarks.common import seed_users
+                load_test.user_ids = await seed_users(args.users, balance=0.0)
+            await load_test.fund_accounts()
+            elapsed = await load_test.run()
+        finally:
+            if lifespan is not None:
+                await lifespan.__aexit__(None, None, None)
+
+    routes = {route: stats.summary(elapsed) for route, stats in load_test.stats.items()}
+    total = sum(summary["count"] for summary in routes.values())
+    result = {
+        "label": args.label,
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "target": args.url or "in-process",
+        "config": {
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "hot_fraction": args.hot_fraction,
+            "seed": args.seed,
+            "scenarios": SCENARIOS,
+        },
+        "elapsed": elapsed,
+        "total_requests": total,
+        "total_rps": total / elapsed,
+        "routes": routes,
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["routes"]
+    print_report(routes, previous)
+    print(f"total: {total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"load-{result['timestamp'].replace(':', '')}-{result['revision']}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="Base URL of a running server; default runs main.app in-process")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of load after seeding")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--hot-fraction", type=float, default=0.05, help="Share of accounts that get the hot traffic")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Earlier results JSON to show deltas against")
+    asyncio.run(main(parser.parse_args()))
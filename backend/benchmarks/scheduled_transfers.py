@@ -0,0 +1,94 @@
+"""Draining a month-start peak of due standing orders: batched runner vs one commit per order.
+
+    python -m benchmarks.scheduled_transfers --orders 100000 --users 20000
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import use_scratch_database, create_schema, seed_users
+
+use_scratch_database()
+
+from sqlalchemy import insert, select, update
+from db.db import AsyncSessionLocal
+from Models.Model import ScheduledTransfer
+from Services.trasnactionServices import TransactionServices
+from Services.scheduledTransferServices import ScheduledTransferRunner, following_run
+
+
+async def seed_orders(user_ids, count, starts_at, rng):
+    rows = []
+    for _ in range(count):
+        sender, recipient = rng.sample(user_ids, 2)
+        rows.append({
+            "sender_user_id": sender,
+            "recipient_user_id": recipient,
+            "amount": round(rng.uniform(1, 50), 2),
+            "description": "Rent",
+            "frequency": "MONTHLY",
+            "status": "ACTIVE",
+            "starts_at": starts_at,
+            "next_run_at": starts_at,
+            "run_count": 0,
+            "failed_attempts": 0,
+        })
+    async with AsyncSessionLocal() as db:
+        for i in range(0, len(rows), 10000):
+            await db.execute(insert(ScheduledTransfer), rows[i:i + 10000])
+        await db.commit()
+
+
+async def per_order(limit, now):
+    """What the cron job did: one transfer and one commit per order"""
+    async with AsyncSessionLocal() as db:
+        orders = (await db.scalars(
+            select(ScheduledTransfer).filter(ScheduledTransfer.next_run_at <= now).limit(limit)
+        )).all()
+    for order in orders:
+        async with AsyncSessionLocal() as db:
+            service = TransactionServices(db)
+            try:
+                await service._apply_transfer(order.sender_user_id, order.recipient_user_id, order.amount, order.description)
+            except Exception:
+                await service._rollback()
+                continue
+            await db.execute(
+                update(ScheduledTransfer)
+                .where(ScheduledTransfer.id == order.id)
+                .values(run_count=ScheduledTransfer.run_count + 1, last_run_at=now, next_run_at=following_run(order, now))
+            )
+            await service._commit()
+    return len(orders)
+
+
+async def main(args):
+    await create_schema()
+    rng = random.Random(args.seed)
+    user_ids = await seed_users(args.users, balance=1_000_000.0)
+    now = datetime.now()
+    await seed_orders(user_ids, args.orders, now - timedelta(minutes=1), rng)
+
+    started = time.perf_counter()
+    ran = await per_order(args.baseline_orders, now)
+    elapsed = time.perf_counter() - started
+    print(f"per-order commit  {ran:7d} orders in {elapsed:7.2f}s  {ran / elapsed:9.1f} orders/s")
+
+    runner = ScheduledTransferRunner(batch_size=args.batch_size)
+    report = await runner.run_due(now=now)
+    print(
+        f"batched runner    {report.due:7d} orders in {report.elapsed:7.2f}s  {report.due / report.elapsed:9.1f} orders/s  "
+        f"({report.succeeded} succeeded, {report.failed} failed)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--baseline-orders", type=int, default=2000, help="Orders run one by one first, for comparison")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
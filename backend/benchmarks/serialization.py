@@ -0,0 +1,104 @@
+"""Cost of encoding a page of transactions: ORM + response_model vs rows straight to JSON bytes.
+
+    python -m benchmarks.serialization --rows 100 --iterations 2000
+
+Times the query plus encoding of one page both ways, then the whole
+GET /transactions/{user_id} request as it is served now.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import use_scratch_database, create_schema, seed_users, asgi_client, percentile
+
+use_scratch_database()
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+from sqlalchemy import select
+from db.db import AsyncSessionLocal, ReadSessionLocal
+from Models.Model import Transaction
+from Schemas.schemas import PaginatedTransactionResponse
+from Services.serialization import TRANSACTION_COLUMNS
+from Services.trasnactionServices import TransactionServices
+
+
+async def seed_ledger(user_id: int, count: int):
+    async with AsyncSessionLocal() as db:
+        service = TransactionServices(db)
+        for _ in range(count):
+            await service.credit(user_id, 1.25, "Benchmark credit")
+
+
+def page_body(transactions, limit):
+    return {"transactions": transactions, "total": limit, "page": 1, "limit": limit, "total_pages": 1, "next_cursor": None}
+
+
+async def time_orm(db, user_id, limit, iterations) -> list[float]:
+    """What the endpoint did before: ORM objects validated into the response model, then encoded"""
+    adapter = TypeAdapter(PaginatedTransactionResponse)
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        transactions = (await db.scalars(
+            select(Transaction).filter(Transaction.user_id == user_id)
+            .order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(limit)
+        )).all()
+        model = adapter.validate_python(page_body(transactions, limit), from_attributes=True)
+        json.dumps(jsonable_encoder(adapter.dump_python(model, mode="json")), separators=(",", ":")).encode("utf-8")
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def time_rows(db, user_id, limit, iterations) -> list[float]:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        transactions = (await db.execute(
+            select(*TRANSACTION_COLUMNS).filter(Transaction.user_id == user_id)
+            .order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(limit)
+        )).all()
+        to_json(page_body([transaction._asdict() for transaction in transactions], limit))
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def report(name: str, samples: list[float]):
+    mean = sum(samples) / len(samples)
+    print(
+        f"{name:<22} mean {mean * 1e6:8.0f} us  p50 {percentile(samples, 50) * 1e6:8.0f} us  "
+        f"p99 {percentile(samples, 99) * 1e6:8.0f} us  ({1 / mean:,.0f} pages/s)"
+    )
+    return mean
+
+
+async def main(args):
+    await create_schema()
+    user_id = (await seed_users(1, balance=0.0))[0]
+    await seed_ledger(user_id, args.rows)
+
+    async with ReadSessionLocal() as db:
+        # Warm up both paths before timing
+        await time_orm(db, user_id, args.rows, 20)
+        await time_rows(db, user_id, args.rows, 20)
+        orm = report("orm + response_model", await time_orm(db, user_id, args.rows, args.iterations))
+        rows = report("rows -> json bytes", await time_rows(db, user_id, args.rows, args.iterations))
+    print(f"speedup: {orm / rows:.1f}x")
+
+    async with asgi_client() as client:
+        samples = []
+        for _ in range(args.iterations // 4):
+            started = time.perf_counter()
+            response = await client.get(f"/transactions/{user_id}", params={"limit": args.rows})
+            samples.append(time.perf_counter() - started)
+            assert response.status_code == 200 and len(response.json()["transactions"]) == args.rows
+        report("GET end to end", samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100, help="Rows per page")
+    parser.add_argument("--iterations", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,148 @@
+"""Committed money operations/s with one database vs SHARD_COUNT shards.
+
+    python -m benchmarks.sharding --shards 4 --processes 4 --ops 4000
+
+Each configuration gets fresh scratch databases and is driven by several
+worker processes (like uvicorn --workers), so the shards' writer locks and
+fsyncs can overlap. Throughput only scales with spare cores and disk: on a
+single core the runs mostly measure the same CPU twice.
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import percentile
+
+
+async def seed(users_per_shard: int) -> None:
+    from sqlalchemy import insert
+    from db.migrations import ensure_schema
+    from db.shards import shards, allocate_ids, dispose_shards
+    from Models.Model import User
+
+    for shard in shards:
+        await ensure_schema(shard.engine)
+        async with shard.session_factory() as db:
+            ids = await allocate_ids(db, User.__table__, users_per_shard, shard.index)
+            await db.execute(insert(User), [
+                {
+                    "id": user_id,
+                    "username": f"bench{user_id}",
+                    "email": f"bench{user_id}@example.com",
+                    "password": "x",
+                    "phone_number": "+15550000000",
+                    "balance": 1_000_000.0,
+                }
+                for user_id in ids
+            ])
+            await db.commit()
+    await dispose_shards()
+
+
+async def drive(ops: int, concurrency: int, cross_shard: float, seed_value: int) -> None:
+    """Run `ops` operations and print committed count, errors and latencies for the parent"""
+    from sqlalchemy import select
+    from db.shards import shards, dispose_shards
+    from Models.Model import User
+    from Services.shardServices import ShardedMoneyService
+
+    by_shard = []
+    for shard in shards:
+        async with shard.read_session_factory() as db:
+            by_shard.append((await db.scalars(select(User.id))).all())
+    service = ShardedMoneyService(use_write_queue=False)
+    rng = random.Random(seed_value)
+
+    def operation():
+        kind = rng.choice(("credit", "withdraw", "transfer"))
+        amount = round(rng.uniform(1, 50), 2)
+        users = rng.choice(by_shard)
+        if kind != "transfer":
+            return kind, (rng.choice(users), amount)
+        if len(by_shard) > 1 and rng.random() < cross_shard:
+            first, second = rng.sample(by_shard, 2)
+            return kind, (rng.choice(first), rng.choice(second), amount)
+        return kind, (*rng.sample(users, 2), amount)
+
+    latencies, errors = [], 0
+    remaining = ops
+
+    async def worker():
+        nonlocal errors, remaining
+        while remaining > 0:
+            remaining -= 1
+            kind, args = operation()
+            started = time.perf_counter()
+            try:
+                await getattr(service, kind)(*args)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    await dispose_shards()
+    print(ops - errors, errors, percentile(latencies, 50), percentile(latencies, 99))
+
+
+def run_configuration(shard_count: int, args) -> None:
+    directory = tempfile.mkdtemp(prefix="wallet-bench-shards-")
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}",
+        SHARD_COUNT=str(shard_count),
+    )
+    env.pop("SHARD_DATABASE_URLS", None)
+    command = [sys.executable, "-m", "benchmarks.sharding"]
+    subprocess.run(command + ["--seed-users", str(args.users // shard_count)], env=env, check=True)
+
+    started = time.perf_counter()
+    workers = [
+        subprocess.Popen(
+            command + [
+                "--drive", str(args.ops // args.processes),
+                "--concurrency", str(args.concurrency),
+                "--cross-shard", str(args.cross_shard),
+                "--seed", str(args.seed + i),
+            ],
+            env=env, stdout=subprocess.PIPE, text=True
+        )
+        for i in range(args.processes)
+    ]
+    outputs = [worker.communicate()[0].split() for worker in workers]
+    elapsed = time.perf_counter() - started
+
+    committed = sum(int(output[0]) for output in outputs)
+    errors = sum(int(output[1]) for output in outputs)
+    p50 = max(float(output[2]) for output in outputs)
+    p99 = max(float(output[3]) for output in outputs)
+    print(
+        f"{shard_count:2d} shard(s) {committed / elapsed:9.1f} ops/s  errors {errors:5d}  "
+        f"p50 {p50 * 1000:8.1f} ms  p99 {p99 * 1000:8.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--ops", type=int, default=4000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=4, help="In-flight operations per process")
+    parser.add_argument("--cross-shard", type=float, default=0.1, help="Share of transfers between shards")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--seed-users", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--drive", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.seed_users is not None:
+        asyncio.run(seed(args.seed_users))
+    elif args.drive is not None:
+        asyncio.run(drive(args.drive, args.concurrency, args.cross_shard, args.seed))
+    else:
+        for shard_count in (1, args.shards):
+            run_configuration(shard_count, args)
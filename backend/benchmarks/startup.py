@@ -0,0 +1,87 @@
+"""Worker boot time against databases of growing size: versioned check vs create_all.
+
+    python -m benchmarks.startup --transactions 0 100000 1000000
+
+Each size gets a generated database (scripts.generate_ledger). Every boot runs
+in a fresh process so nothing is warm except the OS page cache, and reports
+the schema step alone and the whole app startup.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+CHILD = """
+import asyncio, json, sys, time
+mode = sys.argv[1]
+started = time.perf_counter()
+from main import app
+imported = time.perf_counter()
+from db.db import engine, read_engine, Base
+
+async def legacy(conn):
+    def create_schema(conn):
+        Base.metadata.create_all(conn)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    await conn.run_sync(create_schema)
+
+async def boot():
+    schema_started = time.perf_counter()
+    if mode == "legacy":
+        async with engine.begin() as conn:
+            await legacy(conn)
+    else:
+        from db.migrations import ensure_schema
+        await ensure_schema(engine, read_engine)
+    schema_done = time.perf_counter()
+    await engine.dispose()
+    await read_engine.dispose()
+    return schema_done - schema_started
+
+schema = asyncio.run(boot())
+print(json.dumps({"import": imported - started, "schema": schema, "total": time.perf_counter() - started}))
+"""
+
+
+def boot(database: str, mode: str) -> dict:
+    env = dict(os.environ, DATABASE_URL=f"sqlite+aiosqlite:///{database}")
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, mode], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transactions", type=int, nargs="+", default=[0, 100_000, 1_000_000])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--boots", type=int, default=5)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="wallet-startup-")
+    print(f"{'rows':>10} {'size MB':>8} {'mode':>9} {'schema ms':>10} {'boot ms':>9}")
+    for transactions in args.transactions:
+        database = os.path.join(directory, f"ledger-{transactions}.db")
+        if transactions:
+            subprocess.run(
+                [sys.executable, "-m", "scripts.generate_ledger", "--output", database,
+                 "--users", str(args.users), "--transactions", str(transactions), "--force"],
+                check=True, capture_output=True
+            )
+        else:
+            boot(database, "versioned")
+        size = os.path.getsize(database) / 1024 / 1024
+        for mode in ("legacy", "versioned"):
+            runs = [boot(database, mode) for _ in range(args.boots)]
+            schema = statistics.median(run["schema"] for run in runs) * 1000
+            total = statistics.median(run["total"] for run in runs) * 1000
+            print(f"{transactions:>10,} {size:>8.1f} {mode:>9} {schema:>10.2f} {total:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
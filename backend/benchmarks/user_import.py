@@ -0,0 +1,77 @@
+"""Onboarding a partner's users: one POST /users/ per account vs a streamed POST /users/bulk.
+
+    python -m benchmarks.user_import --users 20000 --baseline-users 500
+    BCRYPT_ROUNDS=12 python -m benchmarks.user_import --users 2000 --baseline-users 100
+
+bcrypt dominates both paths, so the gap comes from the per-account
+uniqueness query and commit, and from keeping every password worker busy.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from benchmarks.common import use_scratch_database, create_schema, asgi_client
+
+use_scratch_database()
+os.environ.setdefault("BCRYPT_ROUNDS", "8")
+
+from Services.passwordServices import BCRYPT_ROUNDS, PASSWORD_WORKERS, shutdown_password_executor
+
+
+def account(prefix: str, i: int) -> dict:
+    return {
+        "username": f"{prefix}{i}",
+        "email": f"{prefix}{i}@partner.example",
+        "phone_number": "+15551234567",
+        "password": f"password-{i}",
+    }
+
+
+async def one_by_one(client, count: int, concurrency: int) -> int:
+    """What onboarding did: a create_user call per account, a few in flight"""
+    queue = iter(range(count))
+    created = 0
+
+    async def worker():
+        nonlocal created
+        for i in queue:
+            response = await client.post("/users/", json=account("single", i))
+            created += response.status_code == 201
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return created
+
+
+async def upload(count: int):
+    for start in range(0, count, 1000):
+        yield "".join(json.dumps(account("bulk", i)) + "\n" for i in range(start, min(count, start + 1000))).encode()
+
+
+async def main(args):
+    await create_schema()
+    print(f"bcrypt rounds {BCRYPT_ROUNDS}, {PASSWORD_WORKERS} password workers")
+    async with asgi_client() as client:
+        started = time.perf_counter()
+        created = await one_by_one(client, args.baseline_users, args.concurrency)
+        elapsed = time.perf_counter() - started
+        print(f"POST /users/     {created:7d} users in {elapsed:7.2f}s  {created / elapsed:8.1f} users/s")
+
+        started = time.perf_counter()
+        response = await client.post("/users/bulk", content=upload(args.users), headers={"content-type": "application/x-ndjson"}, timeout=None)
+        elapsed = time.perf_counter() - started
+        report = response.json()
+        print(
+            f"POST /users/bulk {report['created']:7d} users in {elapsed:7.2f}s  {report['created'] / elapsed:8.1f} users/s  "
+            f"({report['failed']} failed)"
+        )
+    shutdown_password_executor()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--baseline-users", type=int, default=500, help="Accounts created one call at a time first, for comparison")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent POST /users/ calls in the baseline")
+    asyncio.run(main(parser.parse_args()))
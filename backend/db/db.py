@@ -1,11 +1,72 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker,AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker,AsyncSession, AsyncEngine
 from sqlalchemy.orm import declarative_base
+from sqlalchemy import event
+import logging
+import random
+import os
 
-DATABASE_URL = "sqlite+aiosqlite:///./db/sqlite.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./db/sqlite.db")
 
+# Full SQL echo is very noisy; DB_LOG_SAMPLE_RATE logs a fraction of statements instead
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"
+DB_LOG_SAMPLE_RATE = float(os.getenv("DB_LOG_SAMPLE_RATE", "0"))
 
-engine =  create_async_engine(url=DATABASE_URL,echo=True,future=True)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Negative values are KiB, positive values are pages
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "8"))
+
+sql_logger = logging.getLogger("db.sql")
+
+
+def configure_sqlite_engine(async_engine: AsyncEngine, read_only: bool = False):
+    """Apply connection PRAGMAs and transaction handling to a SQLite engine.
+
+    Writer connections start transactions with BEGIN IMMEDIATE so concurrent
+    writers queue on busy_timeout instead of failing on lock upgrade. Reader
+    connections are query_only and, with WAL, never wait on the writer.
+    """
+    sync_engine = async_engine.sync_engine
+
+    @event.listens_for(sync_engine, "connect")
+    def _configure_connection(dbapi_connection, connection_record):
+        # pysqlite defers BEGIN until the first DML statement, which breaks SAVEPOINT
+        # (session.begin_nested). Turn that off and let SQLAlchemy emit BEGIN itself.
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        if not read_only:
+            cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    @event.listens_for(sync_engine, "begin")
+    def _emit_begin(conn):
+        conn.exec_driver_sql("BEGIN" if read_only else "BEGIN IMMEDIATE")
+
+    if DB_LOG_SAMPLE_RATE > 0:
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def _log_sampled_statement(conn, cursor, statement, parameters, context, executemany):
+            if random.random() < DB_LOG_SAMPLE_RATE:
+                sql_logger.info("%s %r", statement, parameters)
+
+
+engine =  create_async_engine(url=DATABASE_URL,echo=DB_ECHO,future=True)
+configure_sqlite_engine(engine)
 AsyncSessionLocal = async_sessionmaker(bind=engine,class_=AsyncSession,expire_on_commit=False)
+
+read_engine = create_async_engine(url=DATABASE_URL,echo=DB_ECHO,future=True,pool_size=READ_POOL_SIZE)
+configure_sqlite_engine(read_engine, read_only=True)
+ReadSessionLocal = async_sessionmaker(bind=read_engine,class_=AsyncSession,expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -20,3 +81,10 @@ async def get_db():
             await db.close()
 
 
+async def get_read_db():
+    """Session on the read-only pool, for routes that never write"""
+    async with ReadSessionLocal() as db:
+        try:
+            yield db
+        finally:
+            await db.close()
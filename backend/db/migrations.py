@@ -0,0 +1,74 @@
+"""The backend's schema steps, applied through the shared schema_versioning helper.
+
+At startup `ensure_schema` reads schema_version with a single query on the
+read pool and only takes the write lock when steps are missing. Add new
+steps to the end of MIGRATIONS; never edit or reorder applied ones.
+"""
+from sqlalchemy import Connection, inspect, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from Models.Model import (
+    User,
+    Transaction,
+    UserTransactionCount,
+    IdempotencyKey,
+    BalanceCheckpoint,
+    DailyRollup,
+    ArchiveSegment,
+    ArchivedUser,
+    TransferIntent,
+    ScheduledTransfer
+)
+from pathlib import Path
+from typing import Optional
+import sys
+
+# schema_versioning lives at the repository root, shared with Backend2 and Back3
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+import schema_versioning
+from schema_versioning import Migration, create_tables
+
+def backfill_daily_rollups(conn: Connection):
+    conn.execute(text(
+        "INSERT OR IGNORE INTO daily_rollups (user_id, day, credit_total, credit_count, debit_total, debit_count, "
+        "transfer_in_total, transfer_in_count, transfer_out_total, transfer_out_count) "
+        "SELECT user_id, date(created_at), " + ", ".join(
+            f"SUM(CASE WHEN transaction_type = '{transaction_type}' THEN amount ELSE 0 END), "
+            f"SUM(transaction_type = '{transaction_type}')"
+            for transaction_type in ("CREDIT", "DEBIT", "TRANSFER_IN", "TRANSFER_OUT")
+        ) + " FROM transactions GROUP BY user_id, date(created_at)"
+    ))
+
+def add_idempotency_transfer_intent(conn: Connection):
+    columns = {column["name"] for column in inspect(conn).get_columns("idempotency_keys")}
+    if "transfer_intent_id" not in columns:
+        conn.execute(text("ALTER TABLE idempotency_keys ADD COLUMN transfer_intent_id VARCHAR"))
+    for index in IdempotencyKey.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+MIGRATIONS = [
+    # Databases created before versioning already have these; every step is idempotent
+    Migration(1, "users and transactions", create_tables(User, Transaction)),
+    Migration(2, "per-user transaction counters", create_tables(UserTransactionCount)),
+    Migration(3, "idempotency keys", create_tables(IdempotencyKey)),
+    Migration(4, "balance checkpoints", create_tables(BalanceCheckpoint)),
+    Migration(5, "daily rollups", create_tables(DailyRollup)),
+    Migration(6, "backfill daily rollups from the existing ledger", backfill_daily_rollups),
+    Migration(7, "archive catalog", create_tables(ArchiveSegment, ArchivedUser)),
+    Migration(8, "cross-shard transfer intents", create_tables(TransferIntent)),
+    Migration(9, "scheduled transfers", create_tables(ScheduledTransfer)),
+    Migration(10, "pending idempotency keys of cross-shard transfers", add_idempotency_transfer_intent),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+def migrate(conn: Connection, migrations: list[Migration] = MIGRATIONS) -> list[Migration]:
+    """Apply the missing steps inside the caller's transaction and return them"""
+    return schema_versioning.migrate(conn, migrations)
+
+async def ensure_schema(
+    engine: AsyncEngine,
+    check_engine: Optional[AsyncEngine] = None,
+    migrations: list[Migration] = MIGRATIONS
+) -> list[Migration]:
+    """Bring the database to the latest version; one read on `check_engine` when it already is"""
+    return await schema_versioning.ensure_schema(engine, migrations, check_engine)
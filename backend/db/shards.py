@@ -0,0 +1,129 @@
+"""Ledger sharding by user id.
+
+A user and all of that user's ledger rows live on shard `user_id % SHARD_COUNT`.
+When there is more than one shard, new user and transaction ids are handed
+out so that `id % SHARD_COUNT` is the index of the shard that holds the row.
+Ids therefore stay unique across shards, and a transaction id alone is enough
+to find its row. Signups go to the shard picked by a stable hash of the
+email, so a login by email needs only one shard.
+
+Shard 0 is DATABASE_URL and reuses the engines in db.db. With the default
+SHARD_COUNT=1 nothing changes. The shard count is fixed when the databases
+are created; there is no rebalancing between shard counts.
+"""
+from sqlalchemy import Table, select, func
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from db.db import (
+    DATABASE_URL,
+    DB_ECHO,
+    READ_POOL_SIZE,
+    engine,
+    read_engine,
+    AsyncSessionLocal,
+    ReadSessionLocal,
+    configure_sqlite_engine
+)
+from dataclasses import dataclass
+from typing import Awaitable, Callable, TypeVar
+import asyncio
+import os
+import zlib
+
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+# Comma-separated URLs, one per shard; by default shard N sits next to
+# DATABASE_URL as <name>.shardN<ext>, e.g. db/sqlite.shard1.db
+SHARD_DATABASE_URLS = [url for url in os.getenv("SHARD_DATABASE_URLS", "").split(",") if url]
+
+SHARDED = SHARD_COUNT > 1
+
+T = TypeVar("T")
+
+@dataclass(frozen=True)
+class Shard:
+    index: int
+    url: str
+    engine: AsyncEngine
+    read_engine: AsyncEngine
+    session_factory: async_sessionmaker
+    read_session_factory: async_sessionmaker
+
+def shard_url(index: int) -> str:
+    if SHARD_DATABASE_URLS:
+        return SHARD_DATABASE_URLS[index]
+    if index == 0:
+        return DATABASE_URL
+    url = make_url(DATABASE_URL)
+    root, ext = os.path.splitext(url.database)
+    return url.set(database=f"{root}.shard{index}{ext}").render_as_string(hide_password=False)
+
+def build_shards(count: int = SHARD_COUNT) -> list[Shard]:
+    if SHARD_DATABASE_URLS and len(SHARD_DATABASE_URLS) != count:
+        raise ValueError(f"SHARD_DATABASE_URLS lists {len(SHARD_DATABASE_URLS)} URLs for SHARD_COUNT={count}")
+    shards = []
+    for index in range(count):
+        url = shard_url(index)
+        if url == DATABASE_URL:
+            shards.append(Shard(index, url, engine, read_engine, AsyncSessionLocal, ReadSessionLocal))
+            continue
+        shard_engine = create_async_engine(url=url, echo=DB_ECHO, future=True)
+        configure_sqlite_engine(shard_engine)
+        shard_read_engine = create_async_engine(url=url, echo=DB_ECHO, future=True, pool_size=READ_POOL_SIZE)
+        configure_sqlite_engine(shard_read_engine, read_only=True)
+        shards.append(Shard(
+            index, url, shard_engine, shard_read_engine,
+            async_sessionmaker(bind=shard_engine, class_=AsyncSession, expire_on_commit=False),
+            async_sessionmaker(bind=shard_read_engine, class_=AsyncSession, expire_on_commit=False)
+        ))
+    return shards
+
+shards = build_shards()
+
+def shard_index(row_id: int) -> int:
+    """Shard of a user id or transaction id"""
+    return row_id % SHARD_COUNT
+
+def shard_for_user(user_id: int) -> Shard:
+    return shards[shard_index(user_id)]
+
+def shard_for_email(email: str) -> Shard:
+    """Home shard of a new signup; crc32 so every worker process agrees"""
+    return shards[zlib.crc32(email.lower().encode("utf-8")) % SHARD_COUNT]
+
+async def allocate_ids(db: AsyncSession, table: Table, count: int, index: int) -> list[int]:
+    """Next `count` ids for rows of `table` on shard `index`, each congruent to the index.
+
+    Call inside the shard's write transaction: writer connections begin with
+    BEGIN IMMEDIATE, so no other writer can read the same MAX(id).
+    """
+    max_id = (await db.execute(select(func.max(table.c.id)))).scalar() or 0
+    first = max_id + 1 + (index - max_id - 1) % SHARD_COUNT
+    return list(range(first, first + count * SHARD_COUNT, SHARD_COUNT))
+
+async def on_every_shard(operation: Callable[[Shard], Awaitable[T]]) -> list[T]:
+    """Run `operation` against all shards concurrently, results in shard order"""
+    return list(await asyncio.gather(*(operation(shard) for shard in shards)))
+
+async def get_user_db(user_id: int):
+    """Write session on the shard holding `user_id`"""
+    async with shard_for_user(user_id).session_factory() as db:
+        try:
+            yield db
+        except Exception as e:
+            await db.rollback()
+            raise e
+        finally:
+            await db.close()
+
+async def get_user_read_db(user_id: int):
+    """Read-only session on the shard holding `user_id`"""
+    async with shard_for_user(user_id).read_session_factory() as db:
+        try:
+            yield db
+        finally:
+            await db.close()
+
+async def dispose_shards():
+    for shard in shards:
+        await shard.engine.dispose()
+        await shard.read_engine.dispose()
@@ -1,18 +1,75 @@
 from fastapi import FastAPI
 import uvicorn
-from router import userRouter, transactionsRouter, transferRouter
-from db.db import engine, Base
+from router import userRouter, transactionsRouter, transferRouter, scheduledTransferRouter, metricsRouter, profilingRouter
+from middleware.metricsMiddleware import MetricsMiddleware
+from middleware.profilingMiddleware import ProfilingMiddleware
+from db.shards import shards, SHARDED, dispose_shards
+from db.migrations import ensure_schema
+from Services.metrics import METRICS_ENABLED, instrument_engine
+from Services.profiling import PROFILING_ENABLED
+from Services.writeScheduler import write_schedulers, WRITE_QUEUE_ENABLED
+from Services.passwordServices import shutdown_password_executor
+from Services.reconciliationServices import reconciliation_workers, RECONCILIATION_INTERVAL_SECONDS
+from Services.archiveServices import archive_store, archive_workers, ARCHIVE_INTERVAL_SECONDS
+from Services.shardServices import cross_shard_transfers, cross_shard_recovery_worker, CROSS_SHARD_RECOVERY_INTERVAL_SECONDS
+from Services.scheduledTransferServices import scheduled_transfer_workers, SCHEDULED_TRANSFER_POLL_SECONDS
+from Services.velocityLimits import velocity_limiter
    
 app = FastAPI()
 
+if METRICS_ENABLED:
+    for shard in shards:
+        instrument_engine(shard.engine)
+        instrument_engine(shard.read_engine)
+    app.add_middleware(MetricsMiddleware)
+
+# Installed only when enabled so the default request path has no profiling hook at all
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
 @app.on_event("startup")
 async def startup_db_client():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    for shard in shards:
+        await ensure_schema(shard.engine, shard.read_engine)
+    if SHARDED:
+        # Finish cross-shard transfers a previous process left between its two phases
+        await cross_shard_transfers.recover()
+        if CROSS_SHARD_RECOVERY_INTERVAL_SECONDS > 0:
+            # ...and those this process leaves behind when a second phase fails
+            await cross_shard_recovery_worker.start()
+    if velocity_limiter.enabled:
+        # Count the operations still inside a limit window before taking new ones
+        await velocity_limiter.warm([shard.read_session_factory for shard in shards])
+    for shard in shards:
+        if WRITE_QUEUE_ENABLED:
+            await write_schedulers[shard.index].start()
+        if RECONCILIATION_INTERVAL_SECONDS > 0:
+            await reconciliation_workers[shard.index].start()
+        if ARCHIVE_INTERVAL_SECONDS > 0:
+            await archive_workers[shard.index].start()
+        if SCHEDULED_TRANSFER_POLL_SECONDS > 0:
+            await scheduled_transfer_workers[shard.index].start()
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    await cross_shard_recovery_worker.stop()
+    for shard in shards:
+        await scheduled_transfer_workers[shard.index].stop()
+        await archive_workers[shard.index].stop()
+        await reconciliation_workers[shard.index].stop()
+        await write_schedulers[shard.index].stop()
+    shutdown_password_executor()
+    await archive_store.dispose()
+    await dispose_shards()
 
 app.include_router(userRouter.router)
 app.include_router(transactionsRouter.router)
 app.include_router(transferRouter.router)
+app.include_router(scheduledTransferRouter.router)
+if METRICS_ENABLED:
+    app.include_router(metricsRouter.router)
+if PROFILING_ENABLED:
+    app.include_router(profilingRouter.router)
 
 
 @app.get("/")
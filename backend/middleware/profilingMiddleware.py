@@ -0,0 +1,61 @@
+from starlette.routing import Match
+from Services.profiling import RequestProfile, profile_arms, verify_profile_token, PROFILING_SAMPLE_RATE
+import asyncio
+import logging
+import random
+
+logger = logging.getLogger("profiling")
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_template(scope, routes=None) -> str:
+    """Resolve the route template before routing runs, by matching the app's routes"""
+    for route in scope["app"].router.routes if routes is None else routes:
+        match, _ = route.matches(scope)
+        if match != Match.FULL:
+            continue
+        # Newer FastAPI keeps included routers as one entry wrapping their routes
+        included = getattr(route, "original_router", None)
+        if included is not None:
+            return route_template(scope, included.routes)
+        return getattr(route, "path", UNMATCHED_ROUTE)
+    return UNMATCHED_ROUTE
+
+
+class ProfilingMiddleware:
+    """Profile requests chosen by signed header, armed route or random sampling"""
+
+    def __init__(self, app, sample_rate: float = PROFILING_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    def _reason(self, scope) -> tuple:
+        for name, value in scope["headers"]:
+            if name == b"x-profile-token":
+                if verify_profile_token(value.decode("latin-1")):
+                    return "header", route_template(scope)
+                break
+        if profile_arms:
+            route = route_template(scope)
+            if profile_arms.take(scope["method"], route):
+                return "armed", route
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled", route_template(scope)
+        return None, None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        reason, route = self._reason(scope)
+        profile = RequestProfile.try_start(scope["method"], route, reason) if reason else None
+        if profile is None:
+            return await self.app(scope, receive, send)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profile.stop()
+            path = await asyncio.to_thread(profile.save)
+            logger.info("Profiled %s %s in %.1f ms: %s", scope["method"], route, profile.elapsed * 1000, path)
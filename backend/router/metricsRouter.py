@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Response
+from Services.metrics import metrics
+from Services.userCache import user_cache
+from Services.httpCache import transaction_detail_cache
+from Services.idempotencyServices import idempotency_store
+from Services.eventHub import event_hub
+from Services.velocityLimits import velocity_limiter
+from Services import passwordServices
+
+router = APIRouter(tags=["metrics"])
+
+metrics.register_cache("user", user_cache)
+metrics.register_cache("transaction_detail", transaction_detail_cache)
+metrics.register_cache("idempotency", idempotency_store._cache)
+metrics.register_cache("login", passwordServices._verified)
+metrics.register_event_hub(event_hub)
+metrics.register_velocity_limiter(velocity_limiter)
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, status
+from Schemas.schemas import ProfileArmRequest, ProfilingStatusResponse
+from Services.profiling import profile_arms, list_profiles, sign_profile_token, PROFILING_SECRET
+from typing import Optional
+import hmac
+import time
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not PROFILING_SECRET or not x_admin_token or not hmac.compare_digest(x_admin_token, PROFILING_SECRET):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required")
+
+router = APIRouter(prefix="/admin/profiling", tags=["admin"], dependencies=[Depends(require_admin)])
+
+@router.get("/", response_model=ProfilingStatusResponse)
+async def get_profiling_status():
+    """Armed routes and the most recent saved profiles"""
+    return ProfilingStatusResponse(armed=profile_arms.snapshot(), profiles=list_profiles()[:50])
+
+@router.post("/arm", response_model=ProfilingStatusResponse)
+async def arm_route(request: ProfileArmRequest):
+    """Profile the next `count` requests to a route template"""
+    profile_arms.arm(request.method, request.route, request.count)
+    return ProfilingStatusResponse(armed=profile_arms.snapshot(), profiles=list_profiles()[:50])
+
+@router.delete("/arm", response_model=ProfilingStatusResponse)
+async def disarm_route(route: str, method: str = "GET"):
+    """Stop profiling a route"""
+    profile_arms.disarm(method, route)
+    return ProfilingStatusResponse(armed=profile_arms.snapshot(), profiles=list_profiles()[:50])
+
+@router.post("/token")
+async def create_profile_token(ttl_seconds: int = Query(300, ge=1, le=3600)):
+    """Signed value for the X-Profile-Token header, valid for `ttl_seconds`"""
+    return {"token": sign_profile_token(int(time.time()) + ttl_seconds)}
@@ -0,0 +1,60 @@
+from fastapi import APIRouter, status, Depends, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from Schemas.schemas import ScheduledTransferCreate, ScheduledTransferUpdate, ScheduledTransferResponse
+from Services.scheduledTransferServices import ScheduledTransferServices
+from db.shards import get_user_db, get_user_read_db
+
+router = APIRouter(prefix="/scheduled-transfers", tags=["scheduled transfers"])
+
+# An order lives on its sender's shard, and order ids map to shards the same way user ids do
+
+async def get_sender_db(sender_user_id: int):
+    async for db in get_user_db(sender_user_id):
+        yield db
+
+async def get_schedule_db(schedule_id: int):
+    async for db in get_user_db(schedule_id):
+        yield db
+
+async def get_schedule_read_db(schedule_id: int):
+    async for db in get_user_read_db(schedule_id):
+        yield db
+
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=ScheduledTransferResponse)
+async def create_scheduled_transfer(
+    sender_user_id: int,
+    order: ScheduledTransferCreate,
+    db: AsyncSession = Depends(get_sender_db)
+):
+    """Create a standing order; its first run is at `starts_at`"""
+    return await ScheduledTransferServices(db).create(sender_user_id, order)
+
+@router.get("/", status_code=status.HTTP_200_OK, response_model=list[ScheduledTransferResponse])
+async def get_scheduled_transfers(
+    user_id: int,
+    page: int = Query(1, ge=1),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_user_read_db)
+):
+    """Get the standing orders a user sends, oldest first"""
+    return await ScheduledTransferServices(db).list_for_user(user_id, skip=(page - 1) * limit, limit=limit)
+
+@router.get("/{schedule_id}", status_code=status.HTTP_200_OK, response_model=ScheduledTransferResponse)
+async def get_scheduled_transfer(schedule_id: int, db: AsyncSession = Depends(get_schedule_read_db)):
+    """Get a standing order with the outcome of its last run"""
+    return await ScheduledTransferServices(db).get(schedule_id)
+
+@router.patch("/{schedule_id}", status_code=status.HTTP_200_OK, response_model=ScheduledTransferResponse)
+async def update_scheduled_transfer(
+    schedule_id: int,
+    changes: ScheduledTransferUpdate,
+    db: AsyncSession = Depends(get_schedule_db)
+):
+    """Change, pause or resume a standing order"""
+    return await ScheduledTransferServices(db).update(schedule_id, changes)
+
+@router.delete("/{schedule_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_scheduled_transfer(schedule_id: int, db: AsyncSession = Depends(get_schedule_db)):
+    """Cancel a standing order; it stays readable with status CANCELLED"""
+    await ScheduledTransferServices(db).cancel(schedule_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
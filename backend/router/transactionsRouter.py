@@ -1,86 +1,213 @@
-from fastapi import APIRouter, status, HTTPException, Depends
+from fastapi import APIRouter, status, HTTPException, Depends, Query, Header, Response
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from datetime import datetime, date
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select
 from Models.Model import Transaction
 from Schemas.schemas import (
     TransactionResponse, 
     TransactionCreate, 
     PaginationParams, 
-    PaginatedTransactionResponse
+    PaginatedTransactionResponse,
+    ExportFormat,
+    TransactionType,
+    SummaryGranularity,
+    TransactionSummaryResponse
 )
-from Services.trasnactionServices import TransactionServices
-from db.db import get_db
+from Services.trasnactionServices import TransactionServices, encode_transaction_cursor
+from Services.shardServices import get_money_service
+from Services.streaming import encode_ndjson, encode_csv
+from Services.rollupServices import get_spending_summary, summary_start
+from Services.archiveServices import archive_store
+from Services.serialization import json_response
+from Services.idempotencyServices import idempotency_store
+from Services.httpCache import (
+    IMMUTABLE_CACHE_CONTROL,
+    UNSETTLED_CACHE_CONTROL,
+    transaction_detail_cache,
+    is_settled,
+    transaction_etag,
+    etag_matches
+)
+from db.shards import shard_for_user, get_user_read_db
 
 router = APIRouter(prefix="/transactions", tags=["transactions"])
 
-@router.get("/{user_id}", response_model=PaginatedTransactionResponse)
+@router.get(
+    "/{user_id}",
+    response_model=None,
+    # The page is encoded straight from the rows, so this documents the output rather than validating it
+    responses={status.HTTP_200_OK: {"model": PaginatedTransactionResponse}}
+)
 async def get_user_transactions(
     user_id: int, 
     page: int = 1, 
     limit: int = 10, 
-    db: AsyncSession = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_user_read_db)
 ):
-    """Get all user transactions with pagination"""
-    offset = (page - 1) * limit
-    
-    # Get total count
-    total_result = await db.execute(
-        select(func.count(Transaction.id)).filter(Transaction.user_id == user_id)
+    """Get all user transactions with pagination.
+
+    Pass the `next_cursor` of a previous page as `cursor` to seek on the
+    (user_id, created_at, id) index instead of skipping `(page - 1) * limit` rows.
+    The page is encoded straight from the rows rather than through response_model.
+    """
+    transaction_service = TransactionServices(db)
+    total = await transaction_service.count_user_transactions(user_id)
+
+    # Fetch one extra row to know whether there is a next page
+    transactions = await transaction_service.get_user_transactions(
+        user_id=user_id,
+        skip=(page - 1) * limit,
+        limit=limit + 1,
+        cursor=cursor
     )
-    total = total_result.scalar()
+    next_cursor = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        next_cursor = encode_transaction_cursor(transactions[-1])
     
-    # Get transactions
-    result = await db.execute(
-        select(Transaction)
+    total_pages = (total + limit - 1) // limit
+    
+    return json_response({
+        "transactions": [transaction._asdict() for transaction in transactions],
+        "total": total,
+        "page": page,
+        "limit": limit,
+        "total_pages": total_pages,
+        "next_cursor": next_cursor
+    })
+
+@router.get("/{user_id}/export")
+async def export_user_transactions(
+    user_id: int,
+    format: ExportFormat = ExportFormat.NDJSON,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None
+):
+    """Stream a user's ledger, oldest first, as NDJSON or CSV"""
+    columns = [column.name for column in Transaction.__table__.columns]
+    statement = (
+        select(*Transaction.__table__.columns)
         .filter(Transaction.user_id == user_id)
-        .order_by(Transaction.created_at.desc())
-        .offset(offset)
-        .limit(limit)
+        .order_by(Transaction.created_at, Transaction.id)
     )
-    transactions = result.scalars().all()
-    
-    total_pages = (total + limit - 1) // limit
+    if from_ is not None:
+        statement = statement.filter(Transaction.created_at >= from_)
+    if to is not None:
+        statement = statement.filter(Transaction.created_at < to)
+
+    # Live rows only, unless the range reaches into archived months
+    chunks = archive_store.stream_user_rows(
+        statement, user_id, since=from_, before=to,
+        session_factory=shard_for_user(user_id).read_session_factory
+    )
+    if format == ExportFormat.CSV:
+        body, media_type = encode_csv(chunks, columns), "text/csv"
+    else:
+        body, media_type = encode_ndjson(chunks), "application/x-ndjson"
     
-    return PaginatedTransactionResponse(
-        transactions=transactions,
-        total=total,
-        page=page,
-        limit=limit,
-        total_pages=total_pages
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="transactions-{user_id}.{format.value}"'}
+    )
+
+@router.get("/{user_id}/summary", response_model=TransactionSummaryResponse)
+async def get_transaction_summary(
+    user_id: int,
+    granularity: SummaryGranularity = SummaryGranularity.DAY,
+    periods: int = Query(30, ge=1, le=366, description="Number of periods ending today; ignored when `from` is given"),
+    from_: Optional[date] = Query(None, alias="from"),
+    to: Optional[date] = None,
+    db: AsyncSession = Depends(get_user_read_db)
+):
+    """Credits, debits, transfers and net per day, week or month.
+
+    Served from the daily rollups, so the cost depends on the date range and
+    not on how long the user's ledger is.
+    """
+    if not await TransactionServices(db).get_user_profile(user_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    end = to or date.today()
+    start = from_ or summary_start(granularity, periods, end)
+    if start > end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="`from` must not be after `to`")
+    if (end - start).days > 3660:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Date range is limited to 10 years")
+
+    return TransactionSummaryResponse(
+        user_id=user_id,
+        granularity=granularity,
+        periods=await get_spending_summary(db, user_id, granularity, start, end)
     )
 
 @router.get("/detail/{transaction_id}", status_code=status.HTTP_200_OK, response_model=TransactionResponse) 
-async def get_transaction_detail(transaction_id: int, db: AsyncSession = Depends(get_db)):
-    """Get single transaction detail"""
-    result = await db.execute(select(Transaction).filter(Transaction.id == transaction_id))
-    transaction = result.scalar_one_or_none()
-    
-    if not transaction:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transaction not found")
-    
-    return transaction
+async def get_transaction_detail(
+    transaction_id: int,
+    if_none_match: Optional[str] = Header(None)
+):
+    """Get single transaction detail.
+
+    Committed transactions are immutable: hot rows are served as cached JSON,
+    and revalidating one of them with If-None-Match is answered with 304
+    without a query. A cross-shard TRANSFER_OUT leg is not final until it is
+    linked to the recipient's leg, so until then it is served with no-store
+    and no ETag.
+    """
+    headers = {"ETag": transaction_etag(transaction_id), "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    body = transaction_detail_cache.get(transaction_id)
+    if body is None:
+        # Transaction ids map to shards the same way user ids do
+        async with shard_for_user(transaction_id).read_session_factory() as db:
+            result = await db.execute(select(Transaction).filter(Transaction.id == transaction_id))
+            transaction = result.scalar_one_or_none()
+            if not transaction:
+                transaction = await archive_store.get_transaction(db, transaction_id)
+        
+        if not transaction:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transaction not found")
+
+        body = TransactionResponse.model_validate(transaction).model_dump_json().encode("utf-8")
+        if not is_settled(transaction):
+            return Response(content=body, media_type="application/json", headers={"Cache-Control": UNSETTLED_CACHE_CONTROL})
+        transaction_detail_cache.set(transaction_id, body)
+
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.post("/", response_model=TransactionResponse, status_code=status.HTTP_201_CREATED)
-async def create_transaction(transaction_data: TransactionCreate, user_id: int, db: AsyncSession = Depends(get_db)):
+async def create_transaction(
+    transaction_data: TransactionCreate,
+    user_id: int,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    transaction_service = Depends(get_money_service)
+):
     """Create a credit or debit transaction"""
-    transaction_service = TransactionServices(db)
-    
-    if transaction_data.transaction_type == "CREDIT":
-        transaction = await transaction_service.credit(
-            user_id=user_id, 
-            amount=transaction_data.amount, 
-            description=transaction_data.description
+    if transaction_data.transaction_type not in (TransactionType.CREDIT, TransactionType.DEBIT):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, 
+            detail="Only CREDIT and DEBIT transactions are allowed. Use transfer endpoint for transfers."
         )
-    elif transaction_data.transaction_type == "DEBIT":
-        transaction = await transaction_service.withdraw(
+
+    async def operation():
+        if transaction_data.transaction_type == TransactionType.CREDIT:
+            return await transaction_service.credit(
+                user_id=user_id, 
+                amount=transaction_data.amount, 
+                description=transaction_data.description
+            )
+        return await transaction_service.withdraw(
             user_id=user_id, 
             amount=transaction_data.amount, 
             description=transaction_data.description
         )
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, 
-            detail="Only CREDIT and DEBIT transactions are allowed. Use transfer endpoint for transfers."
-        )
+
+    def render(result) -> TransactionResponse:
+        return TransactionResponse.model_validate(result.transaction)
     
-    return transaction
+    return await idempotency_store.run(
+        idempotency_key, user_id, f"transaction:{user_id}", transaction_data.model_dump(), operation, render
+    )
@@ -1,8 +1,18 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, status, Depends, Response, Header
 from sqlalchemy.ext.asyncio import AsyncSession
 from Services.trasnactionServices import TransactionServices
-from Schemas.schemas import TransferRequest, MoneyOperationResponse
+from Services.shardServices import get_money_service, sharded_money_service
+from Services.idempotencyServices import idempotency_store
+from Schemas.schemas import (
+    TransferRequest,
+    MoneyOperationResponse,
+    BatchTransferRequest,
+    BatchTransferResponse,
+    BatchTransferMode
+)
 from db.db import get_db
+from db.shards import SHARDED
+from typing import Optional
 
 router = APIRouter(prefix="/transfers", tags=["transfers"])
 
@@ -10,33 +20,44 @@ router = APIRouter(prefix="/transfers", tags=["transfers"])
 async def transfer_funds(
     sender_user_id: int, 
     transfer_data: TransferRequest, 
-    db: AsyncSession = Depends(get_db)
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    transaction_service = Depends(get_money_service)
 ):
     """Transfer funds from one user to another"""
-    transaction_service = TransactionServices(db)
-    
-    transfer_transaction = await transaction_service.transfer(
-        from_user_id=sender_user_id,
-        to_user_id=transfer_data.recipient_user_id,
-        amount=transfer_data.amount,
-        description=transfer_data.description
+    async def operation():
+        return await transaction_service.transfer(
+            from_user_id=sender_user_id,
+            to_user_id=transfer_data.recipient_user_id,
+            amount=transfer_data.amount,
+            description=transfer_data.description
+        )
+
+    return await idempotency_store.run(
+        idempotency_key, sender_user_id, f"transfer:{sender_user_id}", transfer_data.model_dump(),
+        operation, MoneyOperationResponse.from_result
     )
+
+
+@router.post("/batch", status_code=status.HTTP_201_CREATED, response_model=BatchTransferResponse)
+async def transfer_funds_batch(
+    batch: BatchTransferRequest,
+    response: Response,
+    db: AsyncSession = Depends(get_db)
+):
+    """Apply many transfers in one DB transaction with a result per item"""
+    transaction_service = sharded_money_service if SHARDED else TransactionServices(db)
+    atomic = batch.mode == BatchTransferMode.ALL_OR_NOTHING
+
+    results = await transaction_service.transfer_batch(batch.transfers, atomic=atomic)
+
+    succeeded = sum(result.success for result in results)
+    if succeeded == 0:
+        response.status_code = status.HTTP_400_BAD_REQUEST
     
-    if not transfer_transaction:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Transfer failed")
-    
-    # Get updated sender balance
-    from sqlalchemy import select
-    from Models.Model import User
-    result = await db.execute(select(User).filter(User.id == sender_user_id))
-    sender = result.scalar_one_or_none()
-    
-    return MoneyOperationResponse(
-        transaction_id=transfer_transaction.id,
-        user_id=transfer_transaction.user_id,
-        amount=transfer_transaction.amount,
-        new_balance=sender.balance,
-        transaction_type=transfer_transaction.transaction_type,
-        description=transfer_transaction.description,
-        created_at=transfer_transaction.created_at
+    return BatchTransferResponse(
+        mode=batch.mode,
+        committed=succeeded > 0,
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        results=results
     )
@@ -1,51 +1,200 @@
-from fastapi import APIRouter, Depends, HTTPException, status    
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from Models.Model import User
-from Schemas.schemas import UserCreate, UserUpdate, UserResponse, AddMoneyRequest, WithdrawMoneyRequest, MoneyOperationResponse
+from Schemas.schemas import UserCreate, UserUpdate, UserResponse, UserListItem, UserLogin, AddMoneyRequest, WithdrawMoneyRequest, MoneyOperationResponse, ImportFormat, UserImportReport
 from Services.trasnactionServices import TransactionServices
-from db.db import get_db
-import bcrypt
+from Services.shardServices import get_money_service
+from Services.userCache import cache_user
+from Services.idempotencyServices import idempotency_store
+from Services.passwordServices import hash_password, verify_password
+from Services.userImportServices import import_users
+from Services.streaming import stream_rows, encode_ndjson, merge_row_streams
+from Services.serialization import json_response
+from Services.eventHub import event_hub, HubFull, Subscription, subscription_feed, encode_sse, encode_websocket
+from db.db import get_db, get_read_db
+from db.shards import (
+    SHARDED,
+    Shard,
+    shards,
+    shard_for_user,
+    shard_for_email,
+    allocate_ids,
+    on_every_shard,
+    get_user_db,
+    get_user_read_db
+)
+from typing import Optional
+from datetime import datetime
+from functools import partial
 
 router = APIRouter(prefix="/users", tags=["users"])
 
-def hash_password(password: str) -> str:
-    """Hash a password using bcrypt"""
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
+# Columns a client may ask for with `fields=`; never includes the password hash
+USER_FIELDS = list(UserResponse.model_fields)
 
-@router.get("/", status_code=status.HTTP_200_OK, response_model=list[UserResponse])
-async def get_users(db: AsyncSession = Depends(get_db)):
-    """Get all users"""
-    result = await db.execute(select(User))
-    users = result.scalars().all()
-    return users
+@router.get(
+    "/",
+    status_code=status.HTTP_200_OK,
+    response_model=None,
+    # The page is encoded straight from the rows, so this documents the output rather than validating it
+    responses={status.HTTP_200_OK: {"model": list[UserListItem], "description": "Users ordered by id"}}
+)
+async def get_users(
+    after_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    min_balance: Optional[float] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return; id is always included"),
+    stream: bool = Query(False, description="Stream every matching user as NDJSON instead of one page"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Get users ordered by id, one page at a time.
+
+    Pass the `X-Next-After-Id` response header as `after_id` to get the next page.
+    """
+    columns = USER_FIELDS
+    if fields:
+        columns = ["id"] + [field for field in dict.fromkeys(fields.split(",")) if field and field != "id"]
+        unknown = set(columns) - set(USER_FIELDS)
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+            )
+
+    statement = select(*(User.__table__.c[column] for column in columns)).order_by(User.id)
+    if after_id is not None:
+        statement = statement.filter(User.id > after_id)
+    if created_from is not None:
+        statement = statement.filter(User.created_at >= created_from)
+    if created_to is not None:
+        statement = statement.filter(User.created_at < created_to)
+    if min_balance is not None:
+        statement = statement.filter(User.balance >= min_balance)
+
+    if stream:
+        if SHARDED:
+            chunks = merge_row_streams(
+                [stream_rows(statement, shard.read_session_factory) for shard in shards],
+                key=lambda row: row["id"]
+            )
+        else:
+            chunks = stream_rows(statement)
+        return StreamingResponse(encode_ndjson(chunks), media_type="application/x-ndjson")
+
+    # Fetch one extra row to know whether there is a next page
+    if SHARDED:
+        # Ids interleave across shards, so each holds about limit / shards of the page;
+        # merge small chunks and stop pulling once the page is full
+        streams = [
+            stream_rows(statement.limit(limit + 1), shard.read_session_factory, limit // len(shards) + 1)
+            for shard in shards
+        ]
+        merged = merge_row_streams(streams, key=lambda row: row["id"])
+        users = []
+        try:
+            async for rows in merged:
+                users += [dict(row) for row in rows]
+                if len(users) > limit:
+                    break
+        finally:
+            for chunks in (merged, *streams):
+                await chunks.aclose()
+        users = users[:limit + 1]
+    else:
+        result = await db.execute(statement.limit(limit + 1))
+        users = [dict(row) for row in result.mappings()]
+    headers = {}
+    if len(users) > limit:
+        users = users[:limit]
+        headers["X-Next-After-Id"] = str(users[-1]["id"])
+
+    return json_response(users, headers=headers)
 
 @router.get("/{user_id}", status_code=status.HTTP_200_OK, response_model=UserResponse)
-async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
+async def get_user(user_id: int, db: AsyncSession = Depends(get_user_read_db)):
     """Get a specific user by ID"""
-    result = await db.execute(select(User).filter(User.id == user_id))
-    user = result.scalar_one_or_none()
+    user = await TransactionServices(db).get_user_profile(user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     return user
 
+async def balance_snapshot(user_id: int) -> Optional[dict]:
+    # Own short-lived session: a feed outlives the request's dependencies
+    async with shard_for_user(user_id).read_session_factory() as db:
+        user = await TransactionServices(db).get_user_profile(user_id)
+    if not user:
+        return None
+    return {"user_id": user_id, "balance": float(user["balance"]), "updated_at": user["updated_at"]}
+
+async def open_feed(user_id: int) -> Subscription:
+    """Check the user exists and take a feed slot; 503 once this worker's hub is full"""
+    if await balance_snapshot(user_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    # Subscribing is the check, so concurrent opens can't all pass it
+    try:
+        return event_hub.subscribe(user_id)
+    except HubFull:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many open event feeds")
+
+def user_feed(subscription: Subscription):
+    async def initial():
+        snapshot = await balance_snapshot(subscription.user_id)
+        return [] if snapshot is None else [("balance", snapshot)]
+
+    return subscription_feed(subscription, initial)
+
+@router.get("/{user_id}/events", status_code=status.HTTP_200_OK)
+async def user_events(user_id: int):
+    """Server-sent events: the current balance, then every committed balance change and ledger entry"""
+    return StreamingResponse(
+        encode_sse(user_feed(await open_feed(user_id))),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/{user_id}/events/ws")
+async def user_events_websocket(websocket: WebSocket, user_id: int):
+    """The same feed as /events, one JSON message per event"""
+    try:
+        subscription = await open_feed(user_id)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+        return
+    feed = user_feed(subscription)
+    try:
+        await websocket.accept()
+        async for batch in feed:
+            # An empty batch is the heartbeat; sending it is how a closed socket is noticed
+            for event, data in batch or [("heartbeat", b"{}")]:
+                await websocket.send_text(encode_websocket(event, data))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await feed.aclose()
+
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=UserResponse)
 async def create_user(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """Create a new user"""
     # Check if username or email already exists
-    existing_user = await db.execute(
-        select(User).filter((User.username == user_data.username) | (User.email == user_data.email))
-    )
-    if existing_user.scalar_one_or_none():
+    duplicate = select(User.id).filter((User.username == user_data.username) | (User.email == user_data.email))
+    if SHARDED:
+        exists = any(await on_every_shard(partial(first_match, duplicate)))
+    else:
+        exists = (await db.execute(duplicate)).first() is not None
+    if exists:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, 
             detail="Username or email already exists"
         )
     
-    # Hash the password
-    hashed_password = hash_password(user_data.password)
+    # End the check's transaction so no DB lock is held while hashing
+    await db.rollback()
+    hashed_password = await hash_password(user_data.password)
     
     # Create new user
     user = User(
@@ -56,13 +205,70 @@ async def create_user(user_data: UserCreate, db: AsyncSession = Depends(get_db))
         balance=0.0
     )
     
+    if SHARDED:
+        # An email always maps to the same shard, so its unique index still settles
+        # signup races on the email; a username race across shards is only caught
+        # by the check above
+        home = shard_for_email(user_data.email)
+        async with home.session_factory() as home_db:
+            [user.id] = await allocate_ids(home_db, User.__table__, 1, home.index)
+            return await save_new_user(home_db, user)
+    return await save_new_user(db, user)
+
+@router.post("/bulk", status_code=status.HTTP_201_CREATED, response_model=UserImportReport)
+async def create_users_bulk(
+    request: Request,
+    response: Response,
+    format: Optional[ImportFormat] = Query(None, description="Defaults to csv for a text/csv body, otherwise ndjson")
+):
+    """Create many users from a streamed NDJSON or CSV body of UserCreate rows.
+
+    CSV needs a header row naming username, email, phone_number and password.
+    Rows that fail validation or clash with an existing user are reported by
+    row number; the rest are created.
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = ImportFormat.CSV if content_type.startswith("text/csv") else ImportFormat.NDJSON
+    report = await import_users(request.stream(), format)
+    if report.created == 0 and report.failed:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+    return report
+
+async def save_new_user(db: AsyncSession, user: User) -> User:
     db.add(user)
-    await db.commit()
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Lost a race with a concurrent signup for the same username or email
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, 
+            detail="Username or email already exists"
+        )
     await db.refresh(user)
     return user
 
+async def first_match(statement, shard: Shard):
+    """First row `statement` finds on one shard, or None"""
+    async with shard.read_session_factory() as db:
+        return (await db.execute(statement.limit(1))).first()
+
+@router.post("/login", status_code=status.HTTP_200_OK, response_model=UserResponse)
+async def login(credentials: UserLogin):
+    """Check a user's email and password"""
+    async with shard_for_email(credentials.email).read_session_factory() as db:
+        result = await db.execute(select(User).filter(User.email == credentials.email))
+        user = result.scalar_one_or_none()
+    if not user or not await verify_password(credentials.password, user.password):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid email or password"
+        )
+    return user
+
 @router.put("/{user_id}", status_code=status.HTTP_200_OK, response_model=UserResponse)
-async def update_user(user_id: int, user_update: UserUpdate, db: AsyncSession = Depends(get_db)):
+async def update_user(user_id: int, user_update: UserUpdate, db: AsyncSession = Depends(get_user_db)):
     """Update user information"""
     result = await db.execute(select(User).filter(User.id == user_id))
     user = result.scalar_one_or_none()
@@ -72,10 +278,12 @@ async def update_user(user_id: int, user_update: UserUpdate, db: AsyncSession =
     # Update only provided fields
     if user_update.username is not None:
         # Check if new username already exists
-        existing = await db.execute(
-            select(User).filter(User.username == user_update.username, User.id != user_id)
-        )
-        if existing.scalar_one_or_none():
+        taken = select(User.id).filter(User.username == user_update.username, User.id != user_id)
+        if SHARDED:
+            exists = any(await on_every_shard(partial(first_match, taken)))
+        else:
+            exists = (await db.execute(taken)).first() is not None
+        if exists:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST, 
                 detail="Username already exists"
@@ -87,52 +295,43 @@ async def update_user(user_id: int, user_update: UserUpdate, db: AsyncSession =
     
     await db.commit()
     await db.refresh(user)
+    cache_user(user)
     return user
 
 @router.post("/{user_id}/add-money", status_code=status.HTTP_201_CREATED, response_model=MoneyOperationResponse)
-async def add_money(user_id: int, request: AddMoneyRequest, db: AsyncSession = Depends(get_db)):
+async def add_money(
+    user_id: int,
+    request: AddMoneyRequest,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    transaction_service = Depends(get_money_service)
+):
     """Add money to user's wallet"""
-    transaction_service = TransactionServices(db)
-    transaction = await transaction_service.credit(
-        user_id=user_id,
-        amount=request.amount,
-        description=request.description
-    )
-    
-    # Get updated user balance
-    result = await db.execute(select(User).filter(User.id == user_id))
-    user = result.scalar_one_or_none()
-    
-    return MoneyOperationResponse(
-        transaction_id=transaction.id,
-        user_id=transaction.user_id,
-        amount=transaction.amount,
-        new_balance=user.balance,
-        transaction_type=transaction.transaction_type,
-        description=transaction.description,
-        created_at=transaction.created_at
+    async def operation():
+        return await transaction_service.credit(
+            user_id=user_id,
+            amount=request.amount,
+            description=request.description
+        )
+
+    return await idempotency_store.run(
+        idempotency_key, user_id, f"add-money:{user_id}", request.model_dump(), operation, MoneyOperationResponse.from_result
     )
 
 @router.post("/{user_id}/withdraw", status_code=status.HTTP_201_CREATED, response_model=MoneyOperationResponse)
-async def withdraw_money(user_id: int, request: WithdrawMoneyRequest, db: AsyncSession = Depends(get_db)):
+async def withdraw_money(
+    user_id: int,
+    request: WithdrawMoneyRequest,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    transaction_service = Depends(get_money_service)
+):
     """Withdraw money from user's wallet"""
-    transaction_service = TransactionServices(db)
-    transaction = await transaction_service.withdraw(
-        user_id=user_id,
-        amount=request.amount,
-        description=request.description
+    async def operation():
+        return await transaction_service.withdraw(
+            user_id=user_id,
+            amount=request.amount,
+            description=request.description
+        )
+
+    return await idempotency_store.run(
+        idempotency_key, user_id, f"withdraw:{user_id}", request.model_dump(), operation, MoneyOperationResponse.from_result
     )
-    
-    # Get updated user balance
-    result = await db.execute(select(User).filter(User.id == user_id))
-    user = result.scalar_one_or_none()
-    
-    return MoneyOperationResponse(
-        transaction_id=transaction.id,
-        user_id=transaction.user_id,
-        amount=transaction.amount,
-        new_balance=user.balance,
-        transaction_type=transaction.transaction_type,
-        description=transaction.description,
-        created_at=transaction.created_at
-    )
\ No newline at end of file
@@ -0,0 +1,41 @@
+"""Move old, reconciled ledger rows from the live database into monthly archive files.
+
+    python -m scripts.archive_transactions --after-days 90
+    python -m scripts.archive_transactions --max-rows 100000
+
+Rows are only archived once reconciliation has checkpointed them, so run
+scripts.reconcile first (or keep the background reconciliation on).
+"""
+import argparse
+import asyncio
+import logging
+
+from db.migrations import ensure_schema
+from db.shards import shards, dispose_shards
+from Services.archiveServices import shard_archiver, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_ROWS, ARCHIVE_DIR
+
+
+async def prepare():
+    for shard in shards:
+        await ensure_schema(shard.engine)
+    await dispose_shards()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--after-days", type=int, default=ARCHIVE_AFTER_DAYS, help="Archive rows older than this")
+    parser.add_argument("--batch-rows", type=int, default=ARCHIVE_BATCH_ROWS)
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--max-rows", type=int, help="Stop after moving about this many rows")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    asyncio.run(prepare())
+    for shard in shards:
+        archiver = shard_archiver(shard, args.archive_dir, after_days=args.after_days, batch_rows=args.batch_rows)
+        run = archiver.run(max_rows=args.max_rows)
+        print(f"shard {shard.index}: moved {run.moved:,} ledger rows into {run.segments} monthly files in {run.elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
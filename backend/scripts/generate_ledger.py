@@ -0,0 +1,208 @@
+"""Bulk-generate a synthetic wallet database for benchmarks.
+
+    python -m scripts.generate_ledger --output ./db/bench.db --users 100000 --transactions 10000000
+
+Writes users and ledger rows straight into the SQLite schema from
+Models/Model.py with executemany batches. The data keeps the model's rules:
+transfers are TRANSFER_OUT/TRANSFER_IN pairs that reference each other,
+balances never go negative and every balance equals the sum of its ledger.
+Account activity is Zipf-skewed so a few hot accounts own most of the rows.
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+
+from db.migrations import migrate
+
+BATCH_ROWS = 50_000
+# bcrypt hash of "password123"; every generated user shares it to skip hashing
+PASSWORD_HASH = "$2b$12$5D9nSyTlTu5sQdj2kJ4FaeMlb55AlCu7aU/Am0D2QySKo4Fb6FOfW"
+DESCRIPTIONS = {
+    "CREDIT": "Add money to wallet",
+    "DEBIT": "Withdraw money from wallet",
+}
+
+
+def sqlite_timestamp(ts: float) -> str:
+    # Same text format SQLAlchemy's DateTime type stores in SQLite
+    return datetime.fromtimestamp(ts).isoformat(sep=" ", timespec="microseconds")
+
+
+def create_schema(path: str):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        migrate(conn)
+    engine.dispose()
+
+
+def secondary_indexes(conn: sqlite3.Connection, table: str) -> list[tuple[str, str]]:
+    return conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,)
+    ).fetchall()
+
+
+def generate(args):
+    rng = random.Random(args.seed)
+    conn = sqlite3.connect(args.output, isolation_level=None)
+    for pragma in (
+        "journal_mode=OFF",
+        "synchronous=OFF",
+        "locking_mode=EXCLUSIVE",
+        "temp_store=MEMORY",
+        f"cache_size=-{args.cache_mb * 1024}",
+    ):
+        conn.execute(f"PRAGMA {pragma}")
+
+    # Building indexes once at the end is much cheaper than maintaining them per row
+    indexes = secondary_indexes(conn, "transactions") + secondary_indexes(conn, "users")
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+
+    end = time.time()
+    start = end - args.days * 86400
+    usernames = [f"user{i}" for i in range(1, args.users + 1)]
+    balances = [0.0] * (args.users + 1)
+    counts = [0] * (args.users + 1)
+
+    # Zipf weights over a shuffled ranking, so hot accounts are spread across ids
+    ranking = list(range(1, args.users + 1))
+    rng.shuffle(ranking)
+    cum_weights = list(itertools.accumulate(1 / (rank ** args.zipf) for rank in range(1, args.users + 1)))
+
+    mix = ("credit", "debit", "transfer")
+    mix_weights = (args.credit_share, args.debit_share, args.transfer_share)
+
+    insert = (
+        "INSERT INTO transactions (id, user_id, transaction_type, amount, description, "
+        "reference_transaction_id, recipient_user_id, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+    )
+    rows = []
+    next_id = 1
+    step = (end - start) / args.transactions
+    started = time.perf_counter()
+    conn.execute("BEGIN")
+    while next_id <= args.transactions:
+        accounts = rng.choices(ranking, cum_weights=cum_weights, k=2)
+        kind = rng.choices(mix, mix_weights)[0]
+        amount = round(rng.uniform(1, args.max_amount), 2)
+        created_at = sqlite_timestamp(start + next_id * step)
+        user_id = accounts[0]
+
+        if kind == "transfer" and (accounts[1] == user_id or next_id == args.transactions):
+            kind = "debit"
+        if kind != "credit" and balances[user_id] < amount:
+            kind = "credit"
+
+        if kind == "transfer":
+            recipient_id = accounts[1]
+            rows.append((
+                next_id, user_id, "TRANSFER_OUT", amount,
+                f"Transfer to {usernames[recipient_id - 1]}: Transfer money",
+                next_id + 1, recipient_id, created_at
+            ))
+            rows.append((
+                next_id + 1, recipient_id, "TRANSFER_IN", amount,
+                f"Transfer from {usernames[user_id - 1]}: Transfer money",
+                next_id, user_id, created_at
+            ))
+            balances[user_id] -= amount
+            balances[recipient_id] += amount
+            counts[user_id] += 1
+            counts[recipient_id] += 1
+            next_id += 2
+        else:
+            transaction_type = "CREDIT" if kind == "credit" else "DEBIT"
+            rows.append((
+                next_id, user_id, transaction_type, amount,
+                DESCRIPTIONS[transaction_type], None, None, created_at
+            ))
+            balances[user_id] += amount if kind == "credit" else -amount
+            counts[user_id] += 1
+            next_id += 1
+
+        if len(rows) >= BATCH_ROWS:
+            conn.executemany(insert, rows)
+            rows.clear()
+            if args.verbose:
+                elapsed = time.perf_counter() - started
+                print(f"{next_id - 1:>12,} rows  {(next_id - 1) / elapsed:,.0f} rows/s", flush=True)
+    conn.executemany(insert, rows)
+
+    user_created_at = sqlite_timestamp(start - 86400)
+    conn.executemany(
+        "INSERT INTO users (id, username, email, password, phone_number, balance, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (
+                user_id, usernames[user_id - 1], f"{usernames[user_id - 1]}@example.com", PASSWORD_HASH,
+                f"+1555{user_id:07d}", round(balances[user_id], 2), user_created_at, user_created_at
+            )
+            for user_id in range(1, args.users + 1)
+        )
+    )
+    conn.executemany(
+        "INSERT INTO user_transaction_counts (user_id, count) VALUES (?, ?)",
+        ((user_id, count) for user_id, count in enumerate(counts) if count)
+    )
+    conn.execute(
+        "INSERT INTO daily_rollups (user_id, day, credit_total, credit_count, debit_total, debit_count, "
+        "transfer_in_total, transfer_in_count, transfer_out_total, transfer_out_count) "
+        "SELECT user_id, date(created_at), " + ", ".join(
+            f"SUM(CASE WHEN transaction_type = '{transaction_type}' THEN amount ELSE 0 END), "
+            f"SUM(transaction_type = '{transaction_type}')"
+            for transaction_type in ("CREDIT", "DEBIT", "TRANSFER_IN", "TRANSFER_OUT")
+        ) + " FROM transactions GROUP BY user_id, date(created_at)"
+    )
+    conn.execute("COMMIT")
+    loaded = time.perf_counter() - started
+
+    for _, sql in indexes:
+        conn.execute(sql)
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA locking_mode=NORMAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+
+    total = time.perf_counter() - started
+    print(
+        f"{next_id - 1:,} transactions for {args.users:,} users in {total:.1f}s "
+        f"(load {loaded:.1f}s, {(next_id - 1) / loaded:,.0f} rows/s; indexes {total - loaded:.1f}s)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="./db/bench.db", help="SQLite file to create")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--transactions", type=int, default=1_000_000, help="Ledger rows to generate")
+    parser.add_argument("--days", type=float, default=365, help="Time span the ledger covers, ending now")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of account activity")
+    parser.add_argument("--credit-share", type=float, default=0.35)
+    parser.add_argument("--debit-share", type=float, default=0.25)
+    parser.add_argument("--transfer-share", type=float, default=0.40)
+    parser.add_argument("--max-amount", type=float, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cache-mb", type=int, default=512)
+    parser.add_argument("--force", action="store_true", help="Replace the output file if it exists")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if os.path.exists(args.output):
+        if not args.force:
+            parser.error(f"{args.output} exists; pass --force to replace it")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.output + suffix):
+                os.remove(args.output + suffix)
+    create_schema(args.output)
+    generate(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Create users in bulk from an NDJSON or CSV file, as POST /users/bulk does.
+
+    python -m scripts.import_users partner.csv
+    python -m scripts.import_users partner.ndjson --errors partner-errors.ndjson
+    cat partner.csv | python -m scripts.import_users - --format csv
+
+CSV needs a header row naming username, email, phone_number and password.
+Exits with status 1 when any row failed.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+
+from db.migrations import ensure_schema
+from db.shards import shards, dispose_shards
+from Schemas.schemas import ImportFormat
+from Services.passwordServices import shutdown_password_executor
+from Services.userImportServices import import_users, IMPORT_CHUNK_ROWS
+
+READ_SIZE = 1 << 16
+
+
+async def read_file(stream):
+    while chunk := stream.read(READ_SIZE):
+        yield chunk
+
+
+async def run(args) -> int:
+    for shard in shards:
+        await ensure_schema(shard.engine)
+    format = args.format
+    if format is None:
+        format = ImportFormat.CSV if args.path.lower().endswith(".csv") else ImportFormat.NDJSON
+
+    stream = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+    try:
+        report = await import_users(read_file(stream), format, chunk_rows=args.chunk_rows, max_errors=args.max_errors)
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+        shutdown_password_executor()
+        await dispose_shards()
+
+    print(
+        f"read {report.received:,} rows, created {report.created:,} users, {report.failed:,} failed "
+        f"in {report.elapsed:.2f}s"
+    )
+    errors = open(args.errors, "w") if args.errors else sys.stderr
+    try:
+        for error in report.errors:
+            errors.write(error.model_dump_json(exclude_none=True) + "\n")
+    finally:
+        if errors is not sys.stderr:
+            errors.close()
+    if report.errors_truncated:
+        print(f"only the first {len(report.errors):,} failures are listed", file=sys.stderr)
+    return 1 if report.failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="File to import, or - for stdin")
+    parser.add_argument("--format", type=ImportFormat, help="ndjson or csv; defaults to csv for a .csv path, otherwise ndjson")
+    parser.add_argument("--errors", help="Write per-row failures here as NDJSON instead of stderr")
+    parser.add_argument("--chunk-rows", type=int, default=IMPORT_CHUNK_ROWS)
+    parser.add_argument("--max-errors", type=int, default=sys.maxsize, help="Failures to list; the rest are only counted")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
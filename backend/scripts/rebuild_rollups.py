@@ -0,0 +1,39 @@
+"""Recompute every user's daily rollups from the ledger.
+
+    python -m scripts.rebuild_rollups --batch-users 200
+
+Safe to run against a live database; each batch of users is rebuilt in its
+own short write transaction. Days that reach into the archive files are left
+as they are.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from db.migrations import ensure_schema
+from db.shards import shards, dispose_shards
+from Services.rollupServices import rebuild_daily_rollups, ROLLUP_REBUILD_BATCH_USERS
+
+
+async def run(args):
+    started = time.perf_counter()
+    rebuilt = 0
+    for shard in shards:
+        await ensure_schema(shard.engine)
+        rebuilt += await rebuild_daily_rollups(shard.session_factory, batch_users=args.batch_users)
+    print(f"rebuilt daily rollups for {rebuilt:,} users in {time.perf_counter() - started:.1f}s")
+    await dispose_shards()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-users", type=int, default=ROLLUP_REBUILD_BATCH_USERS)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
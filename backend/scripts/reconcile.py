@@ -0,0 +1,56 @@
+"""Check users.balance against the ledger, incrementally from the stored checkpoints.
+
+    python -m scripts.reconcile
+    python -m scripts.reconcile --full    # forget checkpoints and re-verify the whole ledger
+
+Exits with status 1 when any user's balance has drifted from their ledger.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+
+from db.migrations import ensure_schema
+from db.shards import shards, dispose_shards
+from Services.reconciliationServices import ReconciliationService, ReconciliationReport, RECONCILIATION_BATCH_USERS, RECONCILIATION_TOLERANCE
+
+
+async def run(args) -> int:
+    report = ReconciliationReport()
+    for shard in shards:
+        await ensure_schema(shard.engine)
+        service = ReconciliationService(
+            shard.session_factory, shard.read_session_factory,
+            batch_users=args.batch_users, tolerance=args.tolerance
+        )
+        if args.full:
+            await service.reset_checkpoints()
+        shard_report = await service.reconcile_all(pause=args.pause_ms / 1000)
+        report.merge(shard_report)
+        report.elapsed += shard_report.elapsed
+    print(
+        f"checked {report.users_checked:,} users, verified {report.transactions_verified:,} new ledger rows "
+        f"in {report.elapsed:.2f}s"
+    )
+    for drifted in report.drifted:
+        print(
+            f"DRIFT user {drifted.user_id}: balance {drifted.balance:.2f} "
+            f"ledger {drifted.ledger_balance:.2f} ({drifted.drift:+.2f})"
+        )
+    await dispose_shards()
+    return 1 if report.drifted else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--full", action="store_true", help="Drop checkpoints first and verify every ledger row")
+    parser.add_argument("--batch-users", type=int, default=RECONCILIATION_BATCH_USERS)
+    parser.add_argument("--tolerance", type=float, default=RECONCILIATION_TOLERANCE)
+    parser.add_argument("--pause-ms", type=float, default=0, help="Sleep between batches")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""Small helpers shared by the tests"""
+from sqlalchemy import insert, select
+
+from db.shards import shards, shard_for_user, allocate_ids
+from Models.Model import User
+
+
+async def create_user(name: str, balance: float = 0.0, shard_index: int = 0) -> int:
+    """Insert a user straight into the given shard and return the id"""
+    shard = shards[shard_index]
+    async with shard.session_factory() as db:
+        [user_id] = await allocate_ids(db, User.__table__, 1, shard.index)
+        await db.execute(insert(User).values(
+            id=user_id,
+            username=name,
+            email=f"{name}@example.com",
+            password="x",
+            phone_number="+15550000000",
+            balance=balance
+        ))
+        await db.commit()
+    assert shard_for_user(user_id) is shard
+    return user_id
+
+
+async def balance_of(user_id: int) -> float:
+    async with shard_for_user(user_id).read_session_factory() as db:
+        return (await db.execute(select(User.balance).filter(User.id == user_id))).scalar_one()
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select, update
+
+from db.shards import shards
+from Models.Model import Transaction, DailyRollup, ArchiveSegment
+from Services.archiveServices import shard_archiver
+from Services.reconciliationServices import ReconciliationService
+from Services.rollupServices import rebuild_daily_rollups
+from Services.trasnactionServices import TransactionServices
+from helpers import create_user
+
+SHARD = shards[0]
+
+
+async def credit(user_id: int, amount: float):
+    async with SHARD.session_factory() as db:
+        return await TransactionServices(db).credit(user_id, amount)
+
+
+async def age_ledger(days: int):
+    """Spread every ledger row of the shard over the days up to `days` ago, oldest id first"""
+    async with SHARD.session_factory() as db:
+        ids = (await db.scalars(select(Transaction.id).order_by(Transaction.id))).all()
+        for offset, transaction_id in enumerate(ids):
+            await db.execute(
+                update(Transaction)
+                .where(Transaction.id == transaction_id)
+                .values(created_at=datetime.now() - timedelta(days=days - offset))
+            )
+        await db.commit()
+    # Rollups were bumped with today's date; make them match the aged rows
+    await rebuild_daily_rollups(SHARD.session_factory)
+
+
+def reconciler() -> ReconciliationService:
+    return ReconciliationService(SHARD.session_factory, SHARD.read_session_factory)
+
+
+async def archive_everything_old() -> int:
+    report = await reconciler().reconcile_all()
+    assert report.drifted == []
+    return shard_archiver(SHARD).run().moved
+
+
+async def live_ids() -> list[int]:
+    async with SHARD.read_session_factory() as db:
+        return (await db.scalars(select(Transaction.id).order_by(Transaction.id))).all()
+
+
+async def test_archived_ids_are_not_reused():
+    alice = await create_user("alice")
+    for _ in range(5):
+        await credit(alice, 1)
+    await age_ledger(days=200)
+    newest = (await live_ids())[-1]
+
+    assert await archive_everything_old() == 4
+    # The newest row stays live so MAX(id) + 1 keeps moving forward
+    assert await live_ids() == [newest]
+
+    transaction, _ = await credit(alice, 5)
+    assert transaction.id > newest
+
+    # SQLite's own rowid assignment relies on the same MAX(id)
+    async with SHARD.session_factory() as db:
+        rowid = (await db.execute(
+            insert(Transaction).values(user_id=alice, transaction_type="CREDIT", amount=1.0).returning(Transaction.id)
+        )).scalar_one()
+        await db.rollback()
+    assert rowid > transaction.id
+
+
+async def test_full_reconcile_counts_archived_rows():
+    alice = await create_user("alice")
+    bob = await create_user("bob")
+    for amount in (10, 20, 30):
+        await credit(alice, amount)
+        await credit(bob, amount)
+    await age_ledger(days=200)
+    assert await archive_everything_old() == 5
+
+    service = reconciler()
+    await service.reset_checkpoints()
+    report = await service.reconcile_all()
+    assert report.drifted == []
+    assert report.users_checked == 2
+
+    await credit(alice, 5)
+    report = await service.reconcile_all()
+    assert report.drifted == []
+    assert report.transactions_verified == 1
+
+
+async def test_archiver_waits_for_checkpoints_after_reset():
+    alice = await create_user("alice")
+    for _ in range(4):
+        await credit(alice, 1)
+    await age_ledger(days=200)
+    assert (await reconciler().reconcile_all()).drifted == []
+
+    await reconciler().reset_checkpoints()
+    assert shard_archiver(SHARD).run().moved == 0
+
+    assert (await reconciler().reconcile_all()).drifted == []
+    assert shard_archiver(SHARD).run().moved == 3
+
+
+async def rollup_totals() -> tuple[int, int, float]:
+    async with SHARD.read_session_factory() as db:
+        return (await db.execute(
+            select(func.count(), func.sum(DailyRollup.credit_count), func.sum(DailyRollup.credit_total))
+        )).one()
+
+
+async def test_rollup_rebuild_keeps_archived_days():
+    alice = await create_user("alice")
+    bob = await create_user("bob")
+    for amount in range(1, 31):
+        await credit(alice if amount % 2 else bob, amount)
+    await age_ledger(days=120)
+    before = await rollup_totals()
+    assert before[0] == 30
+
+    assert await archive_everything_old() > 0
+    async with SHARD.read_session_factory() as db:
+        assert (await db.execute(select(func.count()).select_from(ArchiveSegment))).scalar_one() > 0
+
+    await rebuild_daily_rollups(SHARD.session_factory)
+    assert await rollup_totals() == before
+
+    await credit(alice, 100)
+    await rebuild_daily_rollups(SHARD.session_factory)
+    assert await rollup_totals() == (before[0] + 1, before[1] + 1, before[2] + 100)
@@ -0,0 +1,47 @@
+import asyncio
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+
+from db.shards import shards
+from Models.Model import Transaction
+from Services.trasnactionServices import TransactionServices
+from helpers import create_user, balance_of
+
+
+async def withdraw(user_id: int, amount: float):
+    async with shards[0].session_factory() as db:
+        return await TransactionServices(db).withdraw(user_id, amount)
+
+
+async def transfer(from_user_id: int, to_user_id: int, amount: float):
+    async with shards[0].session_factory() as db:
+        return await TransactionServices(db).transfer(from_user_id, to_user_id, amount)
+
+
+async def ledger_rows() -> int:
+    async with shards[0].read_session_factory() as db:
+        return (await db.execute(select(func.count()).select_from(Transaction))).scalar_one()
+
+
+async def test_only_one_of_two_concurrent_debits_passes():
+    alice = await create_user("alice", balance=100)
+
+    results = await asyncio.gather(withdraw(alice, 70), withdraw(alice, 70), return_exceptions=True)
+
+    refused = [result for result in results if isinstance(result, HTTPException)]
+    assert len(refused) == 1 and refused[0].status_code == 400
+    assert await balance_of(alice) == 30
+    assert await ledger_rows() == 1
+
+
+async def test_concurrent_transfers_never_overdraw():
+    alice = await create_user("alice", balance=100)
+    bob = await create_user("bob")
+
+    results = await asyncio.gather(*(transfer(alice, bob, 30) for _ in range(5)), return_exceptions=True)
+
+    assert sum(not isinstance(result, Exception) for result in results) == 3
+    assert await balance_of(alice) == 10
+    assert await balance_of(bob) == 90
+    assert await ledger_rows() == 6
@@ -0,0 +1,63 @@
+from sqlalchemy import func, select
+
+from db.shards import shards
+from Models.Model import Transaction
+from helpers import create_user, balance_of
+
+
+async def ledger_rows() -> int:
+    async with shards[0].read_session_factory() as db:
+        return (await db.execute(select(func.count()).select_from(Transaction))).scalar_one()
+
+
+async def post_batch(client, mode: str, transfers: list[tuple[int, int, float]]):
+    return await client.post("/transfers/batch", json={"mode": mode, "transfers": [
+        {"sender_user_id": sender, "recipient_user_id": recipient, "amount": amount}
+        for sender, recipient, amount in transfers
+    ]})
+
+
+async def users():
+    return (
+        await create_user("alice", balance=100),
+        await create_user("bob", balance=10),
+        await create_user("carol")
+    )
+
+
+async def test_all_or_nothing_rolls_back_every_transfer(client):
+    alice, bob, carol = await users()
+
+    response = await post_batch(client, "all_or_nothing", [(alice, bob, 30), (bob, carol, 1000), (alice, carol, 10)])
+
+    assert response.status_code == 400
+    body = response.json()
+    assert body["committed"] is False
+    assert body["succeeded"] == 0
+    assert body["results"][1]["error"].startswith("Insufficient balance")
+    assert [await balance_of(user) for user in (alice, bob, carol)] == [100, 10, 0]
+    assert await ledger_rows() == 0
+
+
+async def test_best_effort_keeps_the_transfers_that_succeed(client):
+    alice, bob, carol = await users()
+
+    response = await post_batch(client, "best_effort", [(alice, bob, 30), (bob, carol, 1000), (alice, carol, 10)])
+
+    assert response.status_code == 201
+    body = response.json()
+    assert (body["committed"], body["succeeded"], body["failed"]) == (True, 2, 1)
+    assert [result["success"] for result in body["results"]] == [True, False, True]
+    assert body["results"][2]["new_balance"] == 60
+    assert [await balance_of(user) for user in (alice, bob, carol)] == [60, 40, 10]
+    assert await ledger_rows() == 4
+
+
+async def test_transfers_see_earlier_ones_in_the_same_batch(client):
+    alice, bob, carol = await users()
+
+    # bob can only pay carol with what alice sends him first
+    response = await post_batch(client, "all_or_nothing", [(alice, bob, 50), (bob, carol, 60)])
+
+    assert response.status_code == 201
+    assert [await balance_of(user) for user in (alice, bob, carol)] == [50, 0, 60]
@@ -0,0 +1,164 @@
+import asyncio
+
+from sqlalchemy import delete, select
+
+from db.shards import shards, shard_for_user
+from Models.Model import Transaction, TransferIntent, User
+from Services.httpCache import IMMUTABLE_CACHE_CONTROL, transaction_detail_cache
+from Services.shardServices import cross_shard_transfers, CrossShardRecoveryWorker, COMMITTED, ABORTED
+from helpers import create_user, balance_of
+
+
+async def unreachable(*args):
+    raise ConnectionError("shard unavailable")
+
+
+async def transfer(client, sender: int, recipient: int, amount: float):
+    return await client.post(
+        "/transfers/", params={"sender_user_id": sender}, json={"recipient_user_id": recipient, "amount": amount}
+    )
+
+
+async def ledger(user_id: int) -> list[Transaction]:
+    async with shard_for_user(user_id).read_session_factory() as db:
+        return (await db.scalars(
+            select(Transaction).filter(Transaction.user_id == user_id).order_by(Transaction.id)
+        )).all()
+
+
+async def intent_states() -> list[tuple[str, str]]:
+    states = []
+    for shard in shards:
+        async with shard.read_session_factory() as db:
+            states += (await db.execute(select(TransferIntent.role, TransferIntent.state))).all()
+    return sorted(states)
+
+
+async def test_transfer_between_shards_links_both_legs(client):
+    alice = await create_user("alice", balance=100, shard_index=0)
+    bob = await create_user("bob", shard_index=1)
+
+    response = await transfer(client, alice, bob, 30)
+
+    assert response.status_code == 201
+    [out_leg], [in_leg] = await ledger(alice), await ledger(bob)
+    assert out_leg.reference_transaction_id == in_leg.id
+    assert in_leg.reference_transaction_id == out_leg.id
+    assert await intent_states() == [("RECIPIENT", COMMITTED), ("SENDER", COMMITTED)]
+
+
+async def test_recover_credits_a_transfer_left_in_doubt(client, monkeypatch):
+    alice = await create_user("alice", balance=100, shard_index=0)
+    bob = await create_user("bob", shard_index=1)
+
+    monkeypatch.setattr(cross_shard_transfers, "_apply_recipient", unreachable)
+    assert (await transfer(client, alice, bob, 30)).status_code == 503
+    assert await balance_of(alice) == 70
+    assert await balance_of(bob) == 0
+    monkeypatch.undo()
+
+    assert await cross_shard_transfers.recover() == 1
+    assert await cross_shard_transfers.recover() == 0
+
+    assert await balance_of(bob) == 30
+    [out_leg], [in_leg] = await ledger(alice), await ledger(bob)
+    assert out_leg.reference_transaction_id == in_leg.id
+
+
+async def test_recovery_worker_finishes_a_failed_transfer_without_a_restart(client, monkeypatch):
+    alice = await create_user("alice", balance=100, shard_index=0)
+    bob = await create_user("bob", shard_index=1)
+    carol = await create_user("carol", shard_index=1)
+    original = cross_shard_transfers._apply_recipient
+    attempts = []
+
+    async def flaky(intent, sender_username):
+        # Carol's credit fails on the worker's first passes; bob's transfer is not held up by it
+        if intent.recipient_user_id == carol and len(attempts) < 2:
+            attempts.append(intent.id)
+            raise ConnectionError("shard unavailable")
+        return await original(intent, sender_username)
+
+    monkeypatch.setattr(cross_shard_transfers, "_apply_recipient", unreachable)
+    assert (await transfer(client, alice, carol, 20)).status_code == 503
+    assert (await transfer(client, alice, bob, 30)).status_code == 503
+    monkeypatch.setattr(cross_shard_transfers, "_apply_recipient", flaky)
+
+    worker = CrossShardRecoveryWorker(cross_shard_transfers, interval_seconds=0.05)
+    await worker.start()
+    try:
+        for _ in range(100):
+            if await intent_states() == [("RECIPIENT", COMMITTED)] * 2 + [("SENDER", COMMITTED)] * 2:
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        await worker.stop()
+
+    assert len(attempts) == 2
+    assert await balance_of(alice) == 50
+    assert await balance_of(bob) == 30
+    assert await balance_of(carol) == 20
+
+
+async def test_recover_after_the_recipient_committed_does_not_credit_twice(client, monkeypatch):
+    alice = await create_user("alice", balance=100, shard_index=0)
+    bob = await create_user("bob", shard_index=1)
+
+    # Step 2 commits on the recipient's shard, then the sender's shard goes away
+    monkeypatch.setattr(cross_shard_transfers, "_finish_sender", unreachable)
+    assert (await transfer(client, alice, bob, 30)).status_code == 503
+    monkeypatch.undo()
+    assert await intent_states() == [("RECIPIENT", COMMITTED), ("SENDER", "PREPARED")]
+
+    assert await cross_shard_transfers.recover() == 1
+
+    assert await balance_of(alice) == 70
+    assert await balance_of(bob) == 30
+    assert len(await ledger(bob)) == 1
+    assert await intent_states() == [("RECIPIENT", COMMITTED), ("SENDER", COMMITTED)]
+
+
+async def test_recover_refunds_a_transfer_to_a_deleted_recipient(client, monkeypatch):
+    alice = await create_user("alice", balance=100, shard_index=0)
+    bob = await create_user("bob", shard_index=1)
+
+    monkeypatch.setattr(cross_shard_transfers, "_apply_recipient", unreachable)
+    assert (await transfer(client, alice, bob, 30)).status_code == 503
+    monkeypatch.undo()
+    async with shards[1].session_factory() as db:
+        await db.execute(delete(User).where(User.id == bob))
+        await db.commit()
+
+    assert await cross_shard_transfers.recover() == 1
+
+    assert await balance_of(alice) == 100
+    out_leg, refund = await ledger(alice)
+    assert refund.transaction_type == "CREDIT"
+    assert refund.reference_transaction_id == out_leg.id
+    assert await intent_states() == [("RECIPIENT", ABORTED), ("SENDER", ABORTED)]
+
+
+async def test_unlinked_transfer_leg_is_not_cached(client, monkeypatch):
+    alice = await create_user("alice", balance=100, shard_index=0)
+    bob = await create_user("bob", shard_index=1)
+
+    monkeypatch.setattr(cross_shard_transfers, "_apply_recipient", unreachable)
+    assert (await transfer(client, alice, bob, 30)).status_code == 503
+    monkeypatch.undo()
+    [out_leg] = await ledger(alice)
+
+    pending = await client.get(f"/transactions/detail/{out_leg.id}")
+    assert pending.status_code == 200
+    assert pending.json()["reference_transaction_id"] is None
+    assert pending.headers["Cache-Control"] == "no-store"
+    assert "ETag" not in pending.headers
+    assert transaction_detail_cache.get(out_leg.id) is None
+
+    await cross_shard_transfers.recover()
+
+    settled = await client.get(f"/transactions/detail/{out_leg.id}")
+    [in_leg] = await ledger(bob)
+    assert settled.json()["reference_transaction_id"] == in_leg.id
+    assert settled.headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+    revalidated = await client.get(f"/transactions/detail/{out_leg.id}", headers={"If-None-Match": settled.headers["ETag"]})
+    assert revalidated.status_code == 304
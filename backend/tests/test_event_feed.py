@@ -0,0 +1,51 @@
+import asyncio
+import gc
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from Services.eventHub import event_hub
+from router.userRouter import open_feed, user_feed
+from helpers import create_user
+
+
+async def test_concurrent_opens_cannot_exceed_the_cap(monkeypatch):
+    alice = await create_user("alice")
+    monkeypatch.setattr(event_hub, "max_subscribers", 2)
+
+    opened = await asyncio.gather(*(open_feed(alice) for _ in range(3)), return_exceptions=True)
+
+    refused = [result for result in opened if isinstance(result, HTTPException)]
+    assert len(refused) == 1 and refused[0].status_code == 503
+    assert event_hub.subscriber_count == 2
+
+    # Feeds that never started still give their slot back once dropped
+    feeds = [user_feed(subscription) for subscription in opened if not isinstance(subscription, HTTPException)]
+    del opened, feeds
+    gc.collect()
+    assert event_hub.subscriber_count == 0
+
+
+async def test_feed_sends_the_balance_then_committed_changes(client):
+    alice = await create_user("alice")
+    feed = user_feed(await open_feed(alice))
+    try:
+        [(event, data)] = await anext(feed)
+        assert (event, json.loads(data)["balance"]) == ("balance", 0)
+
+        await client.post(f"/users/{alice}/add-money", json={"amount": 10})
+
+        batch = await anext(feed)
+        assert [event for event, _ in batch] == ["balance", "transaction"]
+        assert json.loads(batch[0][1])["balance"] == 10
+    finally:
+        await feed.aclose()
+    assert event_hub.subscriber_count == 0
+
+
+async def test_unknown_user_takes_no_slot():
+    with pytest.raises(HTTPException) as refused:
+        await open_feed(999)
+    assert refused.value.status_code == 404
+    assert event_hub.subscriber_count == 0
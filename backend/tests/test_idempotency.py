@@ -0,0 +1,187 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, select
+
+from db.shards import shards, shard_for_user
+from Models.Model import IdempotencyKey, Transaction, User
+from Schemas.schemas import MoneyOperationResponse
+from Services.idempotencyServices import IdempotencyStore, idempotency_store
+from Services.shardServices import cross_shard_transfers
+from Services.trasnactionServices import TransactionServices
+from Services.writeScheduler import WriteScheduler
+from helpers import create_user, balance_of
+
+
+async def add_money(client, user_id: int, amount: float, key: str = "key-1"):
+    return await client.post(f"/users/{user_id}/add-money", json={"amount": amount}, headers={"Idempotency-Key": key})
+
+
+async def stored_keys(user_id: int) -> list:
+    async with shard_for_user(user_id).read_session_factory() as db:
+        return (await db.execute(select(IdempotencyKey.key, IdempotencyKey.transfer_intent_id))).all()
+
+
+async def test_retry_replays_the_first_response(client):
+    alice = await create_user("alice")
+
+    first = await add_money(client, alice, 10)
+    retry = await add_money(client, alice, 10)
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert await balance_of(alice) == 10
+
+
+async def test_key_reused_for_a_different_request_conflicts(client):
+    alice = await create_user("alice")
+
+    assert (await add_money(client, alice, 10)).status_code == 201
+    reused = await add_money(client, alice, 11)
+
+    assert reused.status_code == 409
+    assert await balance_of(alice) == 10
+
+
+async def test_key_is_stored_with_the_ledger_write(client):
+    alice = await create_user("alice", shard_index=1)
+
+    first = await add_money(client, alice, 10)
+    assert await stored_keys(alice) == [(f"add-money:{alice}:key-1", None)]
+
+    # A fresh process has nothing cached and must find the key on the user's shard
+    idempotency_store._cache.clear()
+    retry = await add_money(client, alice, 10)
+    assert retry.json() == first.json()
+    assert await balance_of(alice) == 10
+
+
+async def credit_with_key(store: IdempotencyStore, user_id: int, operation):
+    return await store.run(
+        "key-1", user_id, f"add-money:{user_id}", {"amount": 10}, operation, MoneyOperationResponse.from_result
+    )
+
+
+async def test_duplicate_committed_by_another_process_rolls_back():
+    alice = await create_user("alice")
+    other_process = IdempotencyStore()
+    this_process = IdempotencyStore()
+
+    async def credit():
+        async with shards[0].session_factory() as db:
+            return await TransactionServices(db).credit(alice, 10)
+
+    async def credit_after_other_process():
+        # The other process commits the same key between our lookup and our write
+        await credit_with_key(other_process, alice, credit)
+        return await credit()
+
+    first = await credit_with_key(this_process, alice, credit_after_other_process)
+
+    assert first.headers["Idempotent-Replayed"] == "true"
+    assert await balance_of(alice) == 10
+    async with shards[0].read_session_factory() as db:
+        assert len((await db.scalars(select(Transaction.id))).all()) == 1
+
+
+async def test_expired_key_is_taken_over():
+    alice = await create_user("alice")
+    async with shards[0].session_factory() as db:
+        await db.execute(insert(IdempotencyKey).values(
+            key=f"add-money:{alice}:key-1",
+            request_hash="old",
+            status_code=201,
+            response_body=b"{}",
+            expires_at=datetime.now() - timedelta(seconds=1)
+        ))
+        await db.commit()
+
+    async def credit():
+        async with shards[0].session_factory() as db:
+            return await TransactionServices(db).credit(alice, 10)
+
+    response = await credit_with_key(IdempotencyStore(), alice, credit)
+
+    assert response.status_code == 201
+    assert "Idempotent-Replayed" not in response.headers
+    assert await balance_of(alice) == 10
+
+
+async def test_write_queue_stores_the_key_in_its_batch():
+    alice = await create_user("alice")
+    scheduler = WriteScheduler(shards[0].session_factory)
+    await scheduler.start()
+    try:
+        first = await credit_with_key(IdempotencyStore(), alice, lambda: scheduler.credit(alice, 10))
+        retry = await credit_with_key(IdempotencyStore(), alice, lambda: scheduler.credit(alice, 10))
+    finally:
+        await scheduler.stop()
+
+    assert retry.body == first.body
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert await balance_of(alice) == 10
+
+
+async def test_cross_shard_transfer_key_is_pending_until_resolved(client, monkeypatch):
+    alice = await create_user("alice", balance=100, shard_index=0)
+    bob = await create_user("bob", shard_index=1)
+    transfer = {"recipient_user_id": bob, "amount": 30}
+    headers = {"Idempotency-Key": "key-1"}
+
+    async def unreachable(*args):
+        raise ConnectionError("recipient shard unavailable")
+
+    monkeypatch.setattr(cross_shard_transfers, "_apply_recipient", unreachable)
+    in_doubt = await client.post("/transfers/", params={"sender_user_id": alice}, json=transfer, headers=headers)
+    assert in_doubt.status_code == 503
+    [(_, intent_id)] = await stored_keys(alice)
+    assert intent_id is not None
+
+    # Debited but unresolved: a retry must neither run again nor claim success
+    retry = await client.post("/transfers/", params={"sender_user_id": alice}, json=transfer, headers=headers)
+    assert retry.status_code == 409
+    assert await balance_of(alice) == 70
+
+    monkeypatch.undo()
+    assert await cross_shard_transfers.recover() == 1
+    assert await stored_keys(alice) == [(f"transfer:{alice}:key-1", None)]
+
+    replayed = await client.post("/transfers/", params={"sender_user_id": alice}, json=transfer, headers=headers)
+    assert replayed.status_code == 201
+    assert replayed.headers["Idempotent-Replayed"] == "true"
+    assert await balance_of(alice) == 70
+    assert await balance_of(bob) == 30
+
+
+async def test_aborted_cross_shard_transfer_drops_its_key(client, monkeypatch):
+    alice = await create_user("alice", balance=100, shard_index=0)
+    bob = await create_user("bob", shard_index=1)
+    transfer = {"recipient_user_id": bob, "amount": 30}
+    headers = {"Idempotency-Key": "key-1"}
+
+    async def unreachable(*args):
+        raise ConnectionError("recipient shard unavailable")
+
+    monkeypatch.setattr(cross_shard_transfers, "_apply_recipient", unreachable)
+    assert (await client.post("/transfers/", params={"sender_user_id": alice}, json=transfer, headers=headers)).status_code == 503
+    monkeypatch.undo()
+
+    # The recipient is gone by the time the transfer is recovered
+    async with shards[1].session_factory() as db:
+        await db.execute(delete(User).where(User.id == bob))
+        await db.commit()
+    assert await cross_shard_transfers.recover() == 1
+
+    assert await stored_keys(alice) == []
+    assert await balance_of(alice) == 100
+    retry = await client.post("/transfers/", params={"sender_user_id": alice}, json=transfer, headers=headers)
+    assert retry.status_code == 404
+
+
+async def test_operation_errors_are_not_stored(client):
+    alice = await create_user("alice", balance=5)
+
+    refused = await client.post(f"/users/{alice}/withdraw", json={"amount": 10}, headers={"Idempotency-Key": "key-1"})
+
+    assert refused.status_code == 400
+    assert await stored_keys(alice) == []
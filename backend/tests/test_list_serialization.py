@@ -0,0 +1,44 @@
+from sqlalchemy import select
+
+from db.shards import shards
+from Models.Model import Transaction, User
+from Schemas.schemas import PaginatedTransactionResponse, TransactionResponse, UserResponse
+from Services.trasnactionServices import TransactionServices
+from helpers import create_user
+
+
+async def test_transaction_page_matches_the_response_model(client):
+    alice = await create_user("alice")
+    bob = await create_user("bob")
+    async with shards[0].session_factory() as db:
+        await TransactionServices(db).credit(alice, 10)
+        await TransactionServices(db).transfer(alice, bob, 4, "rent")
+
+    page = (await client.get(f"/transactions/{alice}")).json()
+
+    PaginatedTransactionResponse.model_validate(page)
+    async with shards[0].read_session_factory() as db:
+        rows = (await db.scalars(
+            select(Transaction).filter(Transaction.user_id == alice).order_by(Transaction.id.desc())
+        )).all()
+    assert page["transactions"] == [TransactionResponse.model_validate(row).model_dump(mode="json") for row in rows]
+
+
+async def test_user_page_matches_the_response_model(client):
+    alice = await create_user("alice", balance=12.5)
+
+    [listed] = (await client.get("/users/")).json()
+
+    async with shards[0].read_session_factory() as db:
+        user = await db.get(User, alice)
+    assert listed == UserResponse.model_validate(user).model_dump(mode="json")
+
+
+async def test_openapi_documents_what_the_list_endpoints_return(client):
+    paths = (await client.get("/openapi.json")).json()["paths"]
+
+    def schema(path: str) -> dict:
+        return paths[path]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+
+    assert schema("/users/")["items"]["$ref"].endswith("/UserListItem")
+    assert schema("/transactions/{user_id}")["$ref"].endswith("/PaginatedTransactionResponse")
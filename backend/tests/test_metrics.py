@@ -0,0 +1,34 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from conftest import SCRATCH_DIR
+from db.db import configure_sqlite_engine
+from Services.metrics import METRICS_ENABLED, MetricsRegistry, RequestStats, current_request, instrument_engine
+
+
+async def test_metrics_are_off_by_default(client):
+    assert not METRICS_ENABLED
+    assert (await client.get("/metrics")).status_code == 404
+
+
+async def test_begin_is_reported_apart_from_queries():
+    engine = create_async_engine(f"sqlite+aiosqlite:///{SCRATCH_DIR}/metrics.db")
+    configure_sqlite_engine(engine)
+    instrument_engine(engine)
+    stats = RequestStats()
+    token = current_request.set(stats)
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text("SELECT 1"))
+            await conn.execute(text("SELECT 2"))
+    finally:
+        current_request.reset(token)
+        await engine.dispose()
+
+    assert (stats.queries, stats.transactions) == (2, 1)
+
+    registry = MetricsRegistry()
+    registry.observe_request("GET", "/users/{user_id}", 200, 0.01, stats)
+    rendered = registry.render()
+    assert 'db_queries_total{method="GET",route="/users/{user_id}"} 2' in rendered
+    assert 'db_transactions_total{method="GET",route="/users/{user_id}"} 1' in rendered
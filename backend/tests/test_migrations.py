@@ -0,0 +1,23 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from conftest import SCRATCH_DIR
+from db.db import Base
+from db.migrations import LATEST_VERSION, ensure_schema
+
+
+async def test_fresh_database_gets_every_table_once():
+    engine = create_async_engine(f"sqlite+aiosqlite:///{SCRATCH_DIR}/fresh.db")
+    try:
+        applied = await ensure_schema(engine)
+        assert applied[-1].version == LATEST_VERSION
+
+        async with engine.connect() as conn:
+            tables = set(await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names()))
+            version = (await conn.execute(text("SELECT version FROM schema_version"))).scalar_one()
+        assert set(Base.metadata.tables) <= tables
+        assert version == LATEST_VERSION
+
+        assert await ensure_schema(engine) == []
+    finally:
+        await engine.dispose()
@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete
+
+from db.shards import shards
+from Models.Model import User
+from Services.scheduledTransferServices import ScheduledTransferRunner
+from helpers import create_user, balance_of
+
+DAY = timedelta(days=1)
+
+
+async def schedule(client, sender: int, recipient: int, amount: float, frequency: str = "DAILY", **fields) -> dict:
+    fields.setdefault("starts_at", (datetime.now() - DAY - timedelta(minutes=5)).isoformat())
+    response = await client.post(
+        "/scheduled-transfers/",
+        params={"sender_user_id": sender},
+        json={"recipient_user_id": recipient, "amount": amount, "frequency": frequency, **fields}
+    )
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+async def fetch(client, order: dict) -> dict:
+    return (await client.get(f"/scheduled-transfers/{order['id']}")).json()
+
+
+async def run_all(now: datetime) -> int:
+    return sum([(await ScheduledTransferRunner(shard).run_due(now)).succeeded for shard in shards])
+
+
+async def test_due_orders_run_once_per_occurrence(client):
+    alice = await create_user("alice", balance=100, shard_index=0)
+    bob = await create_user("bob", shard_index=0)
+    carol = await create_user("carol", shard_index=1)
+    # More local orders than fit in one batch, plus one to another shard
+    orders = [await schedule(client, alice, bob, 5) for _ in range(4)]
+    orders.append(await schedule(client, alice, carol, 10, frequency="ONCE"))
+    now = datetime.now()
+
+    assert await run_all(now) == 5
+    assert await run_all(now) == 0
+
+    assert await balance_of(alice) == 70
+    assert await balance_of(bob) == 20
+    assert await balance_of(carol) == 10
+    daily = await fetch(client, orders[0])
+    assert daily["status"] == "ACTIVE"
+    assert daily["run_count"] == 1
+    assert daily["last_transaction_id"] is not None
+    assert datetime.fromisoformat(daily["next_run_at"]) == datetime.fromisoformat(daily["starts_at"]) + 2 * DAY
+    once = await fetch(client, orders[-1])
+    assert once["status"] == "COMPLETED"
+    assert once["next_run_at"] is None
+
+
+async def test_insufficient_balance_is_retried_then_skipped(client):
+    alice = await create_user("alice", balance=10, shard_index=0)
+    bob = await create_user("bob", shard_index=0)
+    order = await schedule(client, alice, bob, 50)
+    now = datetime.now()
+
+    for attempt in (1, 2):
+        await run_all(now)
+        retried = await fetch(client, order)
+        assert retried["failed_attempts"] == attempt
+        assert retried["last_error"].startswith("Insufficient balance")
+        assert datetime.fromisoformat(retried["next_run_at"]) == now + timedelta(hours=1)
+        now += timedelta(hours=1)
+
+    await run_all(now)
+    skipped = await fetch(client, order)
+    assert skipped["status"] == "ACTIVE"
+    assert skipped["failed_attempts"] == 0
+    assert skipped["run_count"] == 0
+    assert datetime.fromisoformat(skipped["next_run_at"]) == datetime.fromisoformat(order["starts_at"]) + 2 * DAY
+    assert await balance_of(alice) == 10
+
+
+async def test_order_to_a_deleted_recipient_fails(client):
+    alice = await create_user("alice", balance=100, shard_index=0)
+    bob = await create_user("bob", shard_index=0)
+    order = await schedule(client, alice, bob, 5)
+    async with shards[0].session_factory() as db:
+        await db.execute(delete(User).where(User.id == bob))
+        await db.commit()
+
+    await run_all(datetime.now())
+
+    failed = await fetch(client, order)
+    assert failed["status"] == "FAILED"
+    assert failed["next_run_at"] is None
+    assert await balance_of(alice) == 100
+
+
+async def test_patch_rejects_null_for_required_fields(client):
+    alice = await create_user("alice", balance=100)
+    bob = await create_user("bob")
+    order = await schedule(client, alice, bob, 5)
+
+    for field in ("status", "amount", "frequency"):
+        response = await client.patch(f"/scheduled-transfers/{order['id']}", json={field: None})
+        assert response.status_code == 422, field
+    assert await fetch(client, order) == order
+
+
+async def test_patch_clears_ends_at_and_pauses_and_resumes(client):
+    alice = await create_user("alice", balance=100)
+    bob = await create_user("bob")
+    order = await schedule(client, alice, bob, 5, ends_at=(datetime.now() + 30 * DAY).isoformat())
+
+    cleared = await client.patch(f"/scheduled-transfers/{order['id']}", json={"ends_at": None, "description": None})
+    assert cleared.status_code == 200
+    assert cleared.json()["ends_at"] is None
+    assert cleared.json()["description"] is None
+
+    paused = (await client.patch(f"/scheduled-transfers/{order['id']}", json={"status": "PAUSED"})).json()
+    assert paused["next_run_at"] is None
+    assert await run_all(datetime.now()) == 0
+
+    resumed = (await client.patch(f"/scheduled-transfers/{order['id']}", json={"status": "ACTIVE"})).json()
+    assert resumed["status"] == "ACTIVE"
+    assert datetime.fromisoformat(resumed["next_run_at"]) > datetime.now()
+
+
+async def test_finished_orders_cannot_be_changed(client):
+    alice = await create_user("alice", balance=100)
+    bob = await create_user("bob")
+    order = await schedule(client, alice, bob, 5)
+
+    assert (await client.delete(f"/scheduled-transfers/{order['id']}")).status_code == 204
+    response = await client.patch(f"/scheduled-transfers/{order['id']}", json={"amount": 3})
+
+    assert response.status_code == 409
+    assert (await fetch(client, order))["amount"] == 5
@@ -0,0 +1,52 @@
+from Services.httpCache import IMMUTABLE_CACHE_CONTROL, transaction_detail_cache, transaction_etag
+from Services.shardServices import cross_shard_transfers
+from helpers import create_user
+
+
+async def test_detail_is_immutable_and_revalidates_with_304(client):
+    alice = await create_user("alice")
+    created = await client.post(f"/users/{alice}/add-money", json={"amount": 10})
+    transaction_id = created.json()["transaction_id"]
+
+    first = await client.get(f"/transactions/detail/{transaction_id}")
+    assert first.status_code == 200
+    assert first.json()["amount"] == 10
+    assert first.headers["ETag"] == transaction_etag(transaction_id)
+    assert first.headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+
+    revalidated = await client.get(f"/transactions/detail/{transaction_id}", headers={"If-None-Match": first.headers["ETag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["ETag"] == first.headers["ETag"]
+
+    # Not cached yet in this process: still 304 once the row is found
+    transaction_detail_cache.clear()
+    revalidated = await client.get(f"/transactions/detail/{transaction_id}", headers={"If-None-Match": f'W/{first.headers["ETag"]}'})
+    assert revalidated.status_code == 304
+
+
+async def test_unknown_id_is_not_found_even_with_if_none_match(client):
+    response = await client.get("/transactions/detail/999", headers={"If-None-Match": transaction_etag(999)})
+
+    assert response.status_code == 404
+
+
+async def test_unlinked_transfer_leg_ignores_if_none_match(client, monkeypatch):
+    alice = await create_user("alice", balance=100, shard_index=0)
+    bob = await create_user("bob", shard_index=1)
+
+    async def unreachable(*args):
+        raise ConnectionError("recipient shard unavailable")
+
+    monkeypatch.setattr(cross_shard_transfers, "_apply_recipient", unreachable)
+    response = await client.post(
+        "/transfers/", params={"sender_user_id": alice}, json={"recipient_user_id": bob, "amount": 30}
+    )
+    assert response.status_code == 503
+    transactions = (await client.get(f"/transactions/{alice}")).json()["transactions"]
+    [out_leg] = [transaction["id"] for transaction in transactions]
+
+    pending = await client.get(f"/transactions/detail/{out_leg}", headers={"If-None-Match": transaction_etag(out_leg)})
+
+    assert pending.status_code == 200
+    assert pending.headers["Cache-Control"] == "no-store"
+    assert "ETag" not in pending.headers
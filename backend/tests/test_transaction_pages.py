@@ -0,0 +1,49 @@
+from datetime import datetime
+
+from sqlalchemy import update
+
+from db.shards import shards
+from Models.Model import Transaction
+from Services.trasnactionServices import TransactionServices
+from helpers import create_user
+
+
+async def test_cursor_pages_through_equal_timestamps(client):
+    alice = await create_user("alice")
+    async with shards[0].session_factory() as db:
+        for _ in range(7):
+            await TransactionServices(db).credit(alice, 1)
+        # Rows created in the same instant are ordered by id alone
+        await db.execute(update(Transaction).values(created_at=datetime(2026, 1, 1, 12, 0)))
+        await db.commit()
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = (await client.get(f"/transactions/{alice}", params=params)).json()
+        assert page["total"] == 7
+        seen += [transaction["id"] for transaction in page["transactions"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(seen) == 7
+    assert seen == sorted(seen, reverse=True)
+
+
+async def test_invalid_cursor_is_rejected(client):
+    alice = await create_user("alice")
+
+    response = await client.get(f"/transactions/{alice}", params={"cursor": "not-a-cursor"})
+
+    assert response.status_code == 400
+
+
+async def test_total_follows_new_transactions(client):
+    alice = await create_user("alice")
+    assert (await client.get(f"/transactions/{alice}")).json()["total"] == 0
+
+    await client.post(f"/users/{alice}/add-money", json={"amount": 5})
+    await client.post(f"/users/{alice}/withdraw", json={"amount": 2})
+
+    assert (await client.get(f"/transactions/{alice}")).json()["total"] == 2
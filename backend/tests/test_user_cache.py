@@ -0,0 +1,46 @@
+from sqlalchemy import update
+
+from db.shards import shards
+from Models.Model import User
+from Services.trasnactionServices import TransactionServices
+from Services.userCache import cache_user
+from helpers import create_user, balance_of
+
+
+async def credit(user_id: int, amount: float):
+    async with shards[0].session_factory() as db:
+        return await TransactionServices(db).credit(user_id, amount)
+
+
+async def test_balance_write_is_seen_through_the_cache(client):
+    alice = await create_user("alice")
+    assert (await client.get(f"/users/{alice}")).json()["balance"] == 0
+
+    await client.post(f"/users/{alice}/add-money", json={"amount": 10})
+
+    assert (await client.get(f"/users/{alice}")).json()["balance"] == 10
+
+
+async def test_read_older_than_a_committed_write_is_not_cached(client):
+    alice = await create_user("alice")
+    # A GET reads the row, then a credit commits before the GET caches it
+    async with shards[0].read_session_factory() as db:
+        stale = await TransactionServices(db).get_user_by_id(alice)
+    await credit(alice, 10)
+    cache_user(stale)
+
+    assert (await client.get(f"/users/{alice}")).json()["balance"] == 10
+
+
+async def test_stale_cached_balance_does_not_refuse_a_withdrawal(client):
+    alice = await create_user("alice")
+    assert (await client.get(f"/users/{alice}")).json()["balance"] == 0
+
+    # Another worker process credits the user; this process's cache still says 0
+    async with shards[0].session_factory() as db:
+        await db.execute(update(User).where(User.id == alice).values(balance=50))
+        await db.commit()
+
+    response = await client.post(f"/users/{alice}/withdraw", json={"amount": 20})
+    assert response.status_code == 201
+    assert await balance_of(alice) == 30
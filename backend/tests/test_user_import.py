@@ -0,0 +1,93 @@
+import json
+
+from sqlalchemy import select
+
+from db.shards import shards
+from Models.Model import User
+from Services.userImportServices import import_users
+from Schemas.schemas import ImportFormat
+from helpers import create_user
+
+
+def user_row(name: str, **fields) -> dict:
+    return {"username": name, "email": f"{name}@example.com", "phone_number": "+15550000000", "password": "secret123", **fields}
+
+
+async def usernames() -> set[str]:
+    names = set()
+    for shard in shards:
+        async with shard.read_session_factory() as db:
+            names.update((await db.scalars(select(User.username))).all())
+    return names
+
+
+async def upload(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+async def test_bad_ndjson_rows_are_reported_and_the_rest_created(client):
+    await create_user("alice")
+    lines = [
+        json.dumps(user_row("bob")),
+        "{not json",
+        json.dumps(user_row("carol", password="short")),
+        json.dumps(user_row("bobby", email="bob@example.com")),
+        json.dumps(user_row("alice", email="alice2@example.com")),
+        "",
+        json.dumps(["dave"]),
+        json.dumps(user_row("erin")),
+    ]
+
+    response = await client.post("/users/bulk", content="\n".join(lines), headers={"content-type": "application/x-ndjson"})
+
+    assert response.status_code == 201
+    report = response.json()
+    assert (report["received"], report["created"], report["failed"]) == (7, 2, 5)
+    errors = {error["row"]: error for error in report["errors"]}
+    assert sorted(errors) == [2, 3, 4, 5, 6]
+    assert errors[2]["error"] == "Invalid JSON"
+    assert errors[3]["error"].startswith("password:")
+    assert errors[3]["username"] == "carol"
+    assert errors[4]["error"] == "Duplicate email in import"
+    assert errors[5]["error"] == "Username already exists"
+    assert errors[6]["error"] == "Expected a JSON object"
+    assert await usernames() == {"alice", "bob", "erin"}
+
+
+async def test_csv_rows_are_numbered_after_the_header(client):
+    body = "\r\n".join([
+        "username,email,phone_number,password",
+        "frank,frank@example.com,+15550000000,secret123",
+        "grace,grace@example.com,+15550000000",
+        '"heidi","heidi@example.com","+15550000000","multi\nline pass"',
+        "ivan,not-an-email,+15550000000,secret123",
+    ])
+
+    response = await client.post("/users/bulk", content=body, headers={"content-type": "text/csv"})
+
+    report = response.json()
+    assert response.status_code == 201
+    assert (report["received"], report["created"], report["failed"]) == (4, 2, 2)
+    assert [(error["row"], error["error"].split(":")[0]) for error in report["errors"]] == [
+        (2, "Expected 4 columns, got 3"), (4, "email")
+    ]
+    assert await usernames() == {"frank", "heidi"}
+
+
+async def test_duplicates_are_caught_across_chunks(client):
+    lines = [json.dumps(user_row(name)) + "\n" for name in ("judy", "mallory", "oscar")]
+    lines.append(json.dumps(user_row("judy", email="judy2@example.com")) + "\n")
+
+    report = await import_users(upload(*(line.encode() for line in lines)), ImportFormat.NDJSON, chunk_rows=2)
+
+    assert (report.created, report.failed) == (3, 1)
+    assert (report.errors[0].row, report.errors[0].error) == (4, "Duplicate username in import")
+
+
+async def test_upload_where_every_row_fails_is_a_400(client):
+    response = await client.post("/users/bulk", content="{}\n[]\n", headers={"content-type": "application/x-ndjson"})
+
+    assert response.status_code == 400
+    assert response.json()["failed"] == 2
+    assert await usernames() == set()
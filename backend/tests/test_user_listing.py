@@ -0,0 +1,40 @@
+import json
+
+from helpers import create_user
+
+
+async def list_all(client, **params) -> list[dict]:
+    users, after_id = [], None
+    while True:
+        response = await client.get("/users/", params={**params, **({"after_id": after_id} if after_id else {})})
+        assert response.status_code == 200
+        users += response.json()
+        after_id = response.headers.get("X-Next-After-Id")
+        if after_id is None:
+            return users
+
+
+async def test_pages_merge_every_shard_in_id_order(client):
+    ids = [await create_user(f"user{n}", shard_index=n % 3 % 2) for n in range(8)]
+
+    users = await list_all(client, limit=3)
+
+    assert [user["id"] for user in users] == sorted(ids)
+
+
+async def test_filters_and_projection_apply_on_every_shard(client):
+    for n in range(6):
+        await create_user(f"user{n}", balance=n * 10, shard_index=n % 2)
+
+    users = await list_all(client, limit=2, min_balance=25, fields="username,balance")
+
+    assert sorted(user["username"] for user in users) == ["user3", "user4", "user5"]
+    assert all(set(user) == {"id", "username", "balance"} for user in users)
+
+
+async def test_stream_returns_every_user(client):
+    ids = [await create_user(f"user{n}", shard_index=n % 2) for n in range(5)]
+
+    response = await client.get("/users/", params={"stream": True, "fields": "username"})
+
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == sorted(ids)
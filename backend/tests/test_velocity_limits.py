@@ -0,0 +1,53 @@
+import pytest
+
+from Services.velocityLimits import velocity_limiter, parse_velocity_limits
+from helpers import create_user, balance_of
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    # conftest turns the limits off; each test here sets its own
+    def apply(spec: str):
+        monkeypatch.setattr(velocity_limiter, "limits", parse_velocity_limits(spec))
+    return apply
+
+
+async def withdraw(client, user_id: int, amount: float):
+    return await client.post(f"/users/{user_id}/withdraw", json={"amount": amount})
+
+
+async def test_breach_answers_429_with_retry_after(client, limits):
+    limits("DEBIT:2:0:3600")
+    alice = await create_user("alice", balance=100)
+
+    assert (await withdraw(client, alice, 10)).status_code == 201
+    assert (await withdraw(client, alice, 10)).status_code == 201
+    refused = await withdraw(client, alice, 10)
+
+    assert refused.status_code == 429
+    assert 1 <= int(refused.headers["Retry-After"]) <= 3600
+    assert await balance_of(alice) == 80
+
+
+async def test_rolled_back_operation_gives_its_reservation_back(client, limits):
+    limits("DEBIT:2:50:3600")
+    alice = await create_user("alice", balance=40)
+
+    # Both fail after the limit was checked, so neither may count
+    assert (await withdraw(client, alice, 45)).status_code == 400
+    assert (await withdraw(client, alice, 45)).status_code == 400
+
+    assert (await withdraw(client, alice, 20)).status_code == 201
+    assert (await withdraw(client, alice, 20)).status_code == 201
+    assert await balance_of(alice) == 0
+
+
+async def test_amount_above_the_whole_limit_is_refused_outright(client, limits):
+    limits("DEBIT:0:50:3600")
+    alice = await create_user("alice", balance=100)
+
+    refused = await withdraw(client, alice, 60)
+
+    assert refused.status_code == 400
+    assert "Retry-After" not in refused.headers
+    assert (await withdraw(client, alice, 50)).status_code == 201
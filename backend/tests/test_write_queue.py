@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select
+
+from db.shards import shards
+from Models.Model import Transaction
+from Services.writeScheduler import WriteScheduler
+from helpers import create_user, balance_of
+
+
+@pytest.fixture
+async def scheduler():
+    scheduler = WriteScheduler(shards[0].session_factory, max_batch=50, max_wait_ms=20)
+    await scheduler.start()
+    yield scheduler
+    await scheduler.stop()
+
+
+async def ledger_rows(user_id: int) -> int:
+    async with shards[0].read_session_factory() as db:
+        return (await db.execute(select(func.count()).filter(Transaction.user_id == user_id))).scalar_one()
+
+
+async def test_batched_operations_each_get_their_own_result(scheduler):
+    alice = await create_user("alice", balance=10)
+    bob = await create_user("bob")
+
+    results = await asyncio.gather(
+        *(scheduler.credit(alice, 1) for _ in range(20)),
+        scheduler.transfer(alice, bob, 25),
+        return_exceptions=True
+    )
+
+    assert not any(isinstance(result, Exception) for result in results)
+    assert len({result.transaction.id for result in results}) == 21
+    assert await balance_of(alice) == 5
+    assert await balance_of(bob) == 25
+
+
+async def test_failed_operation_rolls_back_alone(scheduler):
+    alice = await create_user("alice", balance=10)
+
+    credited, refused, withdrawn = await asyncio.gather(
+        scheduler.credit(alice, 5),
+        scheduler.withdraw(alice, 100),
+        scheduler.withdraw(alice, 15),
+        return_exceptions=True
+    )
+
+    assert credited.new_balance == 15
+    assert isinstance(refused, HTTPException) and refused.status_code == 400
+    assert withdrawn.new_balance == 0
+    assert await balance_of(alice) == 0
+    assert await ledger_rows(alice) == 2
+
+
+async def test_stop_applies_everything_already_queued(scheduler):
+    alice = await create_user("alice")
+
+    pending = [asyncio.ensure_future(scheduler.credit(alice, 1)) for _ in range(10)]
+    await asyncio.sleep(0)
+    await scheduler.stop()
+
+    assert all(future.done() for future in pending)
+    assert await balance_of(alice) == 10
+    with pytest.raises(RuntimeError):
+        await scheduler.credit(alice, 1)
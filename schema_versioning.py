@@ -0,0 +1,76 @@
+"""Versioned schema setup shared by the apps in this repository.
+
+The schema_version table holds the number of the last applied step. At
+startup `ensure_schema` reads it with a single query and only takes the
+write lock when steps are missing, so booting against an up-to-date
+database never reflects or creates anything. Each app keeps its own
+ordered list of steps; every step names the models it creates, so what a
+version means does not depend on which modules happen to be imported.
+Add new steps to the end of the list; never edit or reorder applied ones.
+"""
+from sqlalchemy import Connection, MetaData, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from dataclasses import dataclass
+from typing import Callable, Optional
+import logging
+
+logger = logging.getLogger("migrations")
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+def create_tables(*models) -> Callable[[Connection], None]:
+    """Step that creates the models' tables and their indexes if missing"""
+    def apply(conn: Connection):
+        tables = [model.__table__ for model in models]
+        tables[0].metadata.create_all(conn, tables=tables)
+        # create_all skips the indexes of tables that already exist
+        for table in tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    return apply
+
+def current_version(conn: Connection) -> int:
+    try:
+        return conn.execute(text("SELECT version FROM schema_version")).scalar() or 0
+    except OperationalError:
+        # No schema_version table: an empty database or one from before versioning
+        return 0
+
+def migrate(conn: Connection, migrations: list[Migration]) -> list[Migration]:
+    """Apply the missing steps inside the caller's transaction and return them"""
+    version = current_version(conn)
+    pending = [migration for migration in migrations if migration.version > version]
+    if not pending:
+        return []
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    for migration in pending:
+        logger.info("Applying schema migration %d: %s", migration.version, migration.description)
+        migration.apply(conn)
+    conn.execute(text("DELETE FROM schema_version"))
+    conn.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), {"version": pending[-1].version})
+    return pending
+
+def drop_schema(conn: Connection, metadata: MetaData):
+    """Drop every table of `metadata` together with the version, so the next boot starts from step 1"""
+    metadata.drop_all(conn)
+    conn.execute(text("DROP TABLE IF EXISTS schema_version"))
+
+async def ensure_schema(
+    engine: AsyncEngine,
+    migrations: list[Migration],
+    check_engine: Optional[AsyncEngine] = None
+) -> list[Migration]:
+    """Bring the database to the latest version; one read when it already is"""
+    async with (check_engine or engine).connect() as conn:
+        version = await conn.run_sync(current_version)
+    if version >= migrations[-1].version:
+        return []
+    # The writer's BEGIN IMMEDIATE (or SQLite's own write lock) serialises
+    # workers booting at the same time; migrate() re-reads the version under it
+    async with engine.begin() as conn:
+        return await conn.run_sync(migrate, migrations)